@@ -0,0 +1,230 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Sequence
+from CoreUtils import log_event
+
+SCHEMA_FILES = {
+    'players': 'data/schema/player_schema.sql',
+    'transactions': 'data/schema/transaction_schema.sql',
+    'teams': 'data/schema/team_schema.sql',
+}
+
+# (index name, table, columns). An index is only created once its table has all of its columns, since tables
+# created without a schema file only have the columns of the first DataFrame written to them.
+INDEXES = [
+    ('idx_players_playerid_timestamp', 'players', ['PlayerID', 'DataTimestamp']),
+    ('idx_players_deadline', 'players', ['Deadline']),
+    ('idx_players_transactionid', 'players', ['TransactionID']),
+    ('idx_transactions_transactionid', 'transactions', ['TransactionID']),
+    ('idx_teams_teamid_season', 'teams', ['TeamID', 'DataSeason']),
+]
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """
+    Returns the column names of a table, or an empty list if the table does not exist.
+    """
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def create_table(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Creates a table from its schema file in data/schema if it does not exist yet, along with its indexes.
+    """
+    with open(SCHEMA_FILES[table], 'r') as f:
+        schema = f.read()
+
+    # Statements are run one at a time rather than with executescript, which commits the open transaction first
+    statement = ''
+    for line in schema.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    ensure_indexes(conn, [table])
+
+
+def ensure_indexes(conn: sqlite3.Connection, tables: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    Creates the lookup indexes of the given tables (all tables by default) that are missing.
+
+    Parameters:
+    - conn (sqlite3.Connection): Connection to the archive database.
+    - tables (Optional[Sequence[str]]): Tables to index, defaults to every table in INDEXES.
+
+    Returns:
+    - List[str]: Names of the indexes that exist or were created.
+    """
+    created = []
+    for index_name, table, columns in INDEXES:
+        if tables is not None and table not in tables:
+            continue
+        if not set(columns).issubset(table_columns(conn, table)):
+            continue
+
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON "{table}" ({", ".join(columns)})')
+        created.append(index_name)
+
+    return created
+
+
+def _add_lookup_indexes(conn: sqlite3.Connection) -> None:
+    ensure_indexes(conn)
+    conn.execute('ANALYZE')
+
+
+def rebuild_with_text_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    """
+    Rebuilds a table so that a column is declared TEXT and every stored value in it is text.
+
+    SQLite cannot change the type of an existing column, so the table is copied into a new table with the same
+    columns in rowid order, swapped in, and re-indexed. Whole numbers stored as REAL (e.g. IDs written from a pandas
+    column containing NaN) are stored without a trailing '.0'.
+
+    Returns:
+    - bool: True if the table was rebuilt, False if it does not exist or the column was already TEXT.
+    """
+    table_info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    declared_types = {row[1]: row[2] for row in table_info}
+    if column not in declared_types:
+        return False
+
+    non_text_values = conn.execute(f'SELECT COUNT(*) FROM "{table}" WHERE typeof("{column}") NOT IN (\'text\', \'null\')').fetchone()[0]
+    if declared_types[column].upper() == 'TEXT' and non_text_values == 0:
+        return False
+
+    column_definitions = ', '.join(f'"{name}" {"TEXT" if name == column else declared_type}' for name, declared_type in declared_types.items())
+    select_columns = ', '.join(
+        f'CASE WHEN typeof("{name}") = \'real\' AND "{name}" = CAST("{name}" AS INTEGER) THEN CAST(CAST("{name}" AS INTEGER) AS TEXT) '
+        f'ELSE CAST("{name}" AS TEXT) END' if name == column else f'"{name}"' for name in declared_types)
+
+    conn.execute(f'CREATE TABLE "{table}_rebuild" ({column_definitions})')
+    conn.execute(f'INSERT INTO "{table}_rebuild" SELECT {select_columns} FROM "{table}" ORDER BY rowid')
+    conn.execute(f'DROP TABLE "{table}"')
+    conn.execute(f'ALTER TABLE "{table}_rebuild" RENAME TO "{table}"')
+    ensure_indexes(conn, [table])
+
+    return True
+
+
+def _store_player_ids_as_text(conn: sqlite3.Connection) -> None:
+    for table in ['players', 'transactions']:
+        if rebuild_with_text_column(conn, table, 'PlayerID'):
+            log_event(f'Rebuilt {table} with PlayerID stored as TEXT')
+
+
+# Schema migrations, applied in order to databases whose PRAGMA user_version is below the migration's version
+MIGRATIONS = [
+    (1, 'Add lookup indexes to players, transactions and teams', _add_lookup_indexes),
+    (2, 'Store PlayerID as TEXT in players and transactions', _store_player_ids_as_text),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Upgrades a database in place by applying every migration newer than its schema version.
+
+    Each migration runs in its own transaction together with the version bump, so an interrupted upgrade resumes
+    from the last completed migration. The version is re-read after the write lock is taken, so concurrent
+    processes opening the same archive do not apply a migration twice.
+
+    Parameters:
+    - conn (sqlite3.Connection): Connection to the archive database.
+
+    Returns:
+    - int: The schema version of the database after migrating.
+    """
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return get_schema_version(conn)
+
+    db_path = conn.execute('PRAGMA database_list').fetchone()[2]
+    conn.commit()
+    for version, description, migration in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            log_event(f'Migrating {db_path} to schema version {version}: {description}')
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return get_schema_version(conn)
+
+
+def sql_column_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def sql_value(value):
+    """
+    Converts a DataFrame value to the value stored by SQLite, the same way DataFrame.to_sql does: missing values
+    are stored as NULL, numpy scalars as the Python equivalent and timestamps as text.
+    """
+    if value is None or (not isinstance(value, (str, bytes, list, tuple, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def append_dataframe(df: pd.DataFrame, table: str, conn: sqlite3.Connection) -> int:
+    """
+    Appends a DataFrame to a table, creating the table from its schema file if needed and adding any columns of
+    the DataFrame the table does not have yet.
+
+    Everything is done with plain statements on conn, so when it is called inside a transaction the rows and any
+    new table or columns are committed or rolled back with the rest of the transaction. (DataFrame.to_sql and
+    executescript both commit the connection's open transaction.)
+
+    Parameters:
+    - df (pd.DataFrame): Rows to append.
+    - table (str): Name of the table.
+    - conn (sqlite3.Connection): Connection to the archive database.
+
+    Returns:
+    - int: The number of rows appended.
+    """
+    existing_columns = table_columns(conn, table)
+    if not existing_columns:
+        if table in SCHEMA_FILES:
+            create_table(conn, table)
+        else:
+            column_definitions = ', '.join(f'"{column}" {sql_column_type(df[column].dtype)}' for column in df.columns)
+            conn.execute(f'CREATE TABLE "{table}" ({column_definitions})')
+        existing_columns = table_columns(conn, table)
+
+    missing_columns = [column for column in df.columns if column not in existing_columns]
+    for column in missing_columns:
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {sql_column_type(df[column].dtype)}')
+    if missing_columns:
+        ensure_indexes(conn, [table])
+
+    if len(df) == 0:
+        return 0
+
+    columns = ', '.join(f'"{column}"' for column in df.columns)
+    placeholders = ', '.join('?' for _ in df.columns)
+    rows = [tuple(sql_value(value) for value in row) for row in df.itertuples(index=False, name=None)]
+    conn.executemany(f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})', rows)
+    return len(df)
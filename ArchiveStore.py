@@ -0,0 +1,160 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional, Sequence
+import pandas as pd
+import ArchiveSchema
+
+
+class ArchiveStore:
+    """
+    Shared, thread-safe access to one archive database file.
+
+    Connections are long-lived and pooled: a thread borrows an idle connection for the duration of a read or a
+    transaction and returns it afterwards, so repeated lookups reuse the same connection and its compiled statement
+    cache instead of reconnecting. The database runs in WAL mode, so readers (e.g. the Flask viewer) are not
+    blocked by a writer (e.g. the transfer market monitor), and writers within the process are serialised by a lock
+    before taking SQLite's write lock, with busy_timeout covering writers in other processes.
+    """
+    PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,  # 64 MiB per connection
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    }
+    CACHED_STATEMENTS = 256
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, db_path: str, tables: Sequence[str] = ()):
+        self.db_path = db_path
+        self.idle_connections = queue.LifoQueue()
+        self.write_lock = threading.RLock()
+        self.local = threading.local()
+        self.schema_lock = threading.Lock()
+        self.ensured_tables = set()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        with self.connection():
+            pass  # Opening the first connection applies any pending migrations
+        self.ensure_tables(tables)
+
+    @classmethod
+    def open(cls, db_path: str, tables: Sequence[str] = ()) -> 'ArchiveStore':
+        """
+        Returns the shared store of a database file, creating it on first use.
+
+        Parameters:
+        - db_path (str): Path to the SQLite database file.
+        - tables (Sequence[str]): Tables from ArchiveSchema.SCHEMA_FILES that should exist in this database.
+
+        Returns:
+        - ArchiveStore: The store shared by every caller using this file.
+        """
+        key = os.path.realpath(db_path)
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls(db_path)
+                cls._stores[key] = store
+
+        store.ensure_tables(tables)
+        return store
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.PRAGMAS['busy_timeout'] / 1000, check_same_thread=False,
+                               cached_statements=self.CACHED_STATEMENTS)
+        for pragma, value in self.PRAGMAS.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+        with self.schema_lock:
+            ArchiveSchema.migrate(conn)
+
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a pooled connection for reads. The connection is returned to the pool when the block exits.
+        """
+        try:
+            conn = self.idle_connections.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle_connections.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Borrows a pooled connection inside a write transaction, committed when the block exits and rolled back if it
+        raises. Nested transactions in the same thread join the outer one.
+        """
+        with self.write_lock:
+            if getattr(self.local, 'transaction_conn', None) is not None:
+                yield self.local.transaction_conn
+                return
+
+            with self.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                self.local.transaction_conn = conn
+                try:
+                    yield conn
+                    if conn.in_transaction:
+                        conn.commit()
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+                finally:
+                    self.local.transaction_conn = None
+
+    def ensure_tables(self, tables: Sequence[str]) -> None:
+        missing_tables = [table for table in tables if table not in self.ensured_tables]
+        if not missing_tables:
+            return
+
+        with self.transaction() as conn:
+            for table in missing_tables:
+                if not ArchiveSchema.table_columns(conn, table):
+                    ArchiveSchema.create_table(conn, table)
+        self.ensured_tables.update(missing_tables)
+
+    def read_dataframe(self, query: str, params: Optional[Sequence] = None) -> pd.DataFrame:
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def fetchall(self, query: str, params: Sequence = ()) -> list:
+        with self.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def fetchone(self, query: str, params: Sequence = ()) -> Optional[tuple]:
+        with self.connection() as conn:
+            return conn.execute(query, params).fetchone()
+
+    def append_dataframe(self, df: pd.DataFrame, table: str) -> int:
+        with self.transaction() as conn:
+            return ArchiveSchema.append_dataframe(df, table, conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle_connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def open_store(db_path: str, tables: Sequence[str] = ()) -> ArchiveStore:
+    return ArchiveStore.open(db_path, tables=tables)
@@ -1,13 +1,24 @@
 import datetime
 import threading
 import time
+import queue
+import json
+import atexit
 import werkzeug
 import os
+import re
+import http.cookiejar
+from urllib.parse import urljoin
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 werkzeug.cached_property = werkzeug.utils.cached_property
 import warnings
-from bs4 import GuessedAtParserWarning
+from bs4 import BeautifulSoup, GuessedAtParserWarning, UnicodeDammit
 warnings.filterwarnings("ignore", category=GuessedAtParserWarning)
 from robobrowser import RoboBrowser
+from robobrowser.forms.form import Form
+from PageCache import PageCache, CacheMissError
+import RequestMetrics
 
 # Force IPv4 connections
 import socket
@@ -17,6 +28,78 @@ def force_ipv4():
 import urllib3.util.connection
 urllib3.util.connection.allowed_gai_family = force_ipv4
 
+import urllib3.connection
+import urllib3.exceptions
+import requests.adapters
+
+
+class TimedConnectionMixin:
+    """
+    Times the host lookup and the connection of each new connection for the request metrics. The host is resolved
+    here, and each address is then connected to in turn by urllib3, so that the two are timed separately.
+    """
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = [sockaddr[0] for *_, sockaddr in socket.getaddrinfo(host.strip('[]'), self.port, urllib3.util.connection.allowed_gai_family(),
+                                                                            socket.SOCK_STREAM)]
+        except socket.gaierror:
+            # urllib3 looks the host up again and raises its own error for the failed lookup
+            addresses = [host]
+        finally:
+            RequestMetrics.add_time('dns', time.perf_counter() - start)
+
+        try:
+            for n, address in enumerate(addresses):
+                self._dns_host = address
+                start = time.perf_counter()
+                try:
+                    return super()._new_conn()
+                except (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError):
+                    if n == len(addresses) - 1:
+                        raise
+                finally:
+                    RequestMetrics.add_time('connect', time.perf_counter() - start)
+        finally:
+            self._dns_host = host
+
+
+class TimedHTTPConnection(TimedConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    # Opens the connections of a session with the timed connection classes
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+
+def create_rbrowser():
+    """
+    Returns a new RoboBrowser whose session times its host lookups and connections for the request metrics.
+    """
+    rbrowser = RoboBrowser()
+    for prefix in ('http://', 'https://'):
+        rbrowser.session.mount(prefix, TimedHTTPAdapter())
+    return rbrowser
+
+SITE_URL = 'https://www.fromthepavilion.org/'
+SITE_URL_RE = re.compile(r'^https?://www\.fromthepavilion\.org/')
+
 
 class SingletonMeta(type):
     _instances = {}
@@ -30,98 +113,463 @@ class SingletonMeta(type):
             return cls._instances[cls]
 
 
-class FTPBrowser(metaclass=SingletonMeta):
-    def __init__(self, auto_login=True):
-        self.history = []
-        self.override_ratelimit = False
-        self.parsed = ''
+class RateLimiter:
+    """
+    Sliding window request limiter covering several windows at once.
+
+    Each window keeps a deque of the request timestamps that fall inside it. Expired timestamps are evicted from the
+    left as time passes, so checking the wait and recording a request are amortised O(1) and memory is bounded by the
+    window limits rather than the lifetime of the process.
+    """
+    DEFAULT_LIMITS = [
+        (datetime.timedelta(minutes=2), 100),
+        (datetime.timedelta(minutes=30), 500),
+        (datetime.timedelta(hours=6), 1000),
+        (datetime.timedelta(days=1), 2000),
+        (datetime.timedelta(days=7), 5000)
+    ]
+
+    def __init__(self, limits=None, state_file='data/ratelimit_state.json', save_every=10):
+        self.limits = [(duration.total_seconds(), limit) for duration, limit in (limits or self.DEFAULT_LIMITS)]
+        self.windows = [deque() for _ in self.limits]
+        self.state_file = state_file
+        self.save_every = save_every
+        self.unsaved_requests = 0
+
+        if self.state_file:
+            self.load()
+            atexit.register(self.save)
+
+    def _evict(self, now):
+        for (duration, limit), window in zip(self.limits, self.windows):
+            window_start = now - duration
+            while window and window[0] <= window_start:
+                window.popleft()
+
+    def wait_time(self, now=None):
+        """
+        Returns the number of seconds to wait before another request can be made without exceeding any window,
+        along with the duration of the window that requires the longest wait.
+        """
+        now = time.time() if now is None else now
+        self._evict(now)
+
+        max_wait_time, limiting_duration = 0, None
+        for (duration, limit), window in zip(self.limits, self.windows):
+            if len(window) >= limit:
+                # The oldest request that must expire before the window has room again
+                wait_time = window[len(window) - limit] + duration - now
+                if wait_time > max_wait_time:
+                    max_wait_time, limiting_duration = wait_time, duration
 
-        self.rbrowser = RoboBrowser()
-        if auto_login:
-            self.login()
+        return max_wait_time, limiting_duration
+
+    def record(self, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        for window in self.windows:
+            window.append(timestamp)
+
+        self.unsaved_requests += 1
+        if self.state_file and self.unsaved_requests >= self.save_every:
+            self.save()
+
+    def remaining(self, now=None):
+        """
+        Returns a list of (window duration in seconds, requests remaining) for each window.
+        """
+        now = time.time() if now is None else now
+        self._evict(now)
+        return [(duration, max(limit - len(window), 0)) for (duration, limit), window in zip(self.limits, self.windows)]
+
+    def save(self):
+        if not self.state_file:
+            return
+
+        # The longest window holds every timestamp that any shorter window can still need
+        longest_window = self.windows[max(range(len(self.limits)), key=lambda i: self.limits[i][0])]
+        state_dir = os.path.dirname(self.state_file)
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+
+        temp_file = f'{self.state_file}.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump({'timestamps': list(longest_window)}, f)
+        os.replace(temp_file, self.state_file)
+        self.unsaved_requests = 0
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return
+
+        try:
+            with open(self.state_file, 'r') as f:
+                timestamps = sorted(json.load(f)['timestamps'])
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            log_event(f'Could not load rate limit state from {self.state_file}: {e}')
+            return
+
+        for window in self.windows:
+            window.clear()
+            window.extend(timestamps)
+        self._evict(time.time())
+
+
+class Page:
+    """
+    A downloaded page. The response bytes are kept as they are, and the decoded text and the BeautifulSoup tree are
+    each built the first time they are used, so a page is parsed at most once, and only if a caller needs the tree.
+
+    Parameters:
+    - url (str): The page URL.
+    - content (bytes): The response body.
+    - build_tree (Callable[[], BeautifulSoup]): Builds the page's tree, e.g. by reading RoboBrowser's own lazily
+      parsed tree so that a page used for its forms is not parsed twice.
+    - metrics (Optional[RequestMetrics]): Records the time spent building the tree.
+    - from_cache (bool): Whether the page was served from the page cache rather than downloaded.
+    """
+    def __init__(self, url, content, build_tree, metrics=None, from_cache=False):
+        self.url = url
+        self.content = content
+        self.from_cache = from_cache
+        self._build_tree = build_tree
+        self._metrics = metrics
+        self._text = None
+        self._tree = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            try:
+                self._text = self.content.decode('utf-8')
+            except UnicodeDecodeError:
+                self._text = UnicodeDammit(self.content, is_html=True).unicode_markup
+        return self._text
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            parse_start = time.perf_counter()
+            self._tree = self._build_tree()
+            if self._metrics is not None:
+                self._metrics.record_parse(self.url, time.perf_counter() - parse_start)
+        return self._tree
+
+    def __str__(self):
+        return self.text
+
+
+class SessionStore:
+    """
+    Saves the cookies of logged in sessions to a file only its owner can read, so that a new process can reuse a
+    session instead of logging in again. Sessions are stored by name ('main' for the browser's own session, 'pool1'
+    and so on for the fetch_many sessions) along with the user they belong to.
+
+    A saved session is not checked when it is loaded. The first page it opens shows whether the site still accepts
+    it, and check_login triggers a new login if not.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, sessions):
+        # The file is created without group or other permissions before anything is written to it
+        temp_path = self.path + '.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sessions, f)
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.path)
+
+    def load(self, name, username, cookie_jar):
+        """
+        Adds the saved cookies of a session to a cookie jar. Returns False if no unexpired session of the user is saved.
+        """
+        with self.lock:
+            session = self._read().get(name)
+
+        if not session or session.get('username') != username:
+            return False
+
+        now = time.time()
+        cookies = [cookie for cookie in session['cookies'] if cookie['expires'] is None or cookie['expires'] > now]
+        if not cookies:
+            return False
+
+        for cookie in cookies:
+            cookie_jar.set_cookie(http.cookiejar.Cookie(
+                version=0, name=cookie['name'], value=cookie['value'], port=None, port_specified=False,
+                domain=cookie['domain'], domain_specified=bool(cookie['domain']), domain_initial_dot=cookie['domain'].startswith('.'),
+                path=cookie['path'], path_specified=True, secure=cookie['secure'], expires=cookie['expires'], discard=cookie['expires'] is None,
+                comment=None, comment_url=None, rest={}))
+        return True
+
+    def save(self, name, username, cookie_jar):
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                    'secure': cookie.secure, 'expires': cookie.expires} for cookie in cookie_jar]
+        with self.lock:
+            sessions = self._read()
+            sessions[name] = {'username': username, 'saved': time.time(), 'cookies': cookies}
+            self._write(sessions)
+
+    def discard(self, name):
+        with self.lock:
+            sessions = self._read()
+            if sessions.pop(name, None) is not None:
+                self._write(sessions)
 
-    def login(self, max_attempts=3):
+
+class FTPBrowser(metaclass=SingletonMeta):
+    def __init__(self, auto_login=True, pool_size=4, use_cache=True, offline=False, base_url=None):
+        # Pages are requested from base_url instead of the site when it is set, e.g. to load test against a local
+        # mock server. URLs keep referring to the site everywhere else, including as page cache keys
+        self.base_url = base_url or os.environ.get('PAVILIONPY_BASE_URL') or SITE_URL
+        if not self.base_url.endswith('/'):
+            self.base_url += '/'
+        uses_site = self.base_url == SITE_URL
+
+        # Recent requests, kept for inspection only. Rate limiting is handled by self.rate_limiter
+        self.history = deque(maxlen=1000)
+        self.request_count = 0
+        # Requests to another server do not use up, or persist, the site's rate limit budget
+        self.rate_limiter = RateLimiter(state_file='data/ratelimit_state.json' if uses_site else None)
+        self.override_ratelimit = False
+        self.page = None  # The page last loaded by the main session
+        self.rate_lock = threading.Lock()
+        self.metrics = RequestMetrics.RequestMetrics()
+
+        # Offline mode replays pages from the cache and never contacts the site. Pages from another server are
+        # cached separately, so they are never replayed as real pages
+        self.offline = offline
+        server_name = re.sub(r'\W+', '_', self.base_url.split('://')[-1]).strip('_')
+        page_cache_path = 'data/page_cache.db' if uses_site else 'data/page_cache_{}.db'.format(server_name)
+        self.page_cache = PageCache(db_path=page_cache_path, offline=offline) if (use_cache or offline) else None
+
+        # Logged in sessions are saved when they log in and reused by the next process, until the site rejects them
+        self.session_store = SessionStore('data/session_cookies.json' if uses_site else 'data/session_cookies_{}.json'.format(server_name)) if not offline else None
+
+        # Additional logged-in sessions used by fetch_many, created on first use
+        self.pool_size = pool_size
+        self.session_pool = queue.Queue()
+        self.pool_sessions_created = 0
+        self.pool_lock = threading.Lock()
+
+        # The main session logs in on its first request to the site rather than here, so that importing a module
+        # that creates the browser, or only reading cached pages, never logs in
+        self.rbrowser = create_rbrowser()
+        self.login_pending = auto_login and not offline
+        self.login_lock = threading.Lock()
+        self.session_names = {self.rbrowser: 'main'}
+
+        # HTML of the forms loaded by get_page_form, by (page URL, form action)
+        self.form_cache = {}
+
+    def login(self, max_attempts=3, rbrowser=None):
+        rbrowser = self.rbrowser if rbrowser is None else rbrowser
+        if rbrowser is self.rbrowser:
+            self.login_pending = False
+            # Forms loaded by another session may hold hidden inputs that belong to it
+            self.form_cache.clear()
         credentials = self.get_credentials()
         attempts = 0
         while attempts < max_attempts:
             try:
-                self._ftpopen('http://www.fromthepavilion.org/')
-                form = self.get_form(action='securityCheck.htm')
+                self._ftpopen('http://www.fromthepavilion.org/', rbrowser=rbrowser)
+                form = rbrowser.get_form(action='securityCheck.htm')
                 if form is None:
                     raise Exception("Login form not found")
 
                 form['j_username'] = credentials[0]
                 form['j_password'] = credentials[1]
                 log_event('Attempting to login as {}'.format(credentials[0]))
-                self.submit_form(form)
+                page = self._ftpsubmit(form, rbrowser=rbrowser)
 
-                if self.check_login():
+                if self.check_login(page):
                     log_event('Successfully logged in as user {}.'.format(credentials[0]))
+                    self.save_session(rbrowser)
                     return
                 else:
                     log_event('Failed to log in as user {} ({}/{} attempts)'.format(credentials[0], attempts + 1, max_attempts))
+                    self.metrics.count('securityCheck.htm', 'retries')
             except ZeroDivisionError as e:
                 log_event('Error during login: {}'.format(str(e)))
 
             attempts += 1
             time.sleep(10)
 
+        # The saved session was rejected, or the site refused a new one
+        if self.session_store and rbrowser in self.session_names:
+            self.session_store.discard(self.session_names[rbrowser])
+
+    def restore_session(self, rbrowser=None):
+        """
+        Loads the session saved by a previous login into a session's cookies, instead of logging in.
+
+        Parameters:
+        - rbrowser (RoboBrowser): The session, defaults to the browser's main session.
+
+        Returns:
+        - bool: True if a saved session of the current user was loaded.
+        """
+        rbrowser = self.rbrowser if rbrowser is None else rbrowser
+        if self.session_store is None or rbrowser not in self.session_names:
+            return False
+
+        username = self.get_credentials()[0]
+        if not self.session_store.load(self.session_names[rbrowser], username, rbrowser.session.cookies):
+            return False
+
+        log_event('Reusing the saved {} session of user {}.'.format(self.session_names[rbrowser], username))
+        if rbrowser is self.rbrowser:
+            self.login_pending = False
+        return True
+
+    def save_session(self, rbrowser=None):
+        rbrowser = self.rbrowser if rbrowser is None else rbrowser
+        if self.session_store is not None and rbrowser in self.session_names:
+            self.session_store.save(self.session_names[rbrowser], self.get_credentials()[0], rbrowser.session.cookies)
+
     def rate_limit(self):
-        now = datetime.datetime.utcnow()
-        max_wait_time = 0
-        limit_triggered = False
-
-        rate_limits = [
-            {'duration': datetime.timedelta(minutes=2), 'limit': 100},
-            {'duration': datetime.timedelta(minutes=30), 'limit': 500},
-            {'duration': datetime.timedelta(hours=6), 'limit': 1000},
-            {'duration': datetime.timedelta(days=1), 'limit': 2000},
-            {'duration': datetime.timedelta(days=7), 'limit': 5000}
-        ]
-
-        for limit in rate_limits:
-            window_start = now - limit['duration']
-            requests_in_window = [req for req in self.history if req['timestamp'] > window_start]
-
-            if len(requests_in_window) >= limit['limit']:
-                wait_time = (requests_in_window[0]['timestamp'] + limit['duration'] - now).total_seconds()
-                log_event(f'Rate limit exceeded for {limit["duration"]}. Calculated necessary sleep: {wait_time:.2f} seconds.')
-                if wait_time > max_wait_time:
-                    max_wait_time = wait_time
-                    limit_triggered = True
+        max_wait_time, limiting_duration = self.rate_limiter.wait_time()
 
-        if limit_triggered:
+        if max_wait_time > 0:
+            log_event(f'Rate limit exceeded for {datetime.timedelta(seconds=limiting_duration)}. Calculated necessary sleep: {max_wait_time:.2f} seconds.')
             if not self.override_ratelimit:
                 log_event(f'Rate limit applied, sleeping for: {max_wait_time:.2f} seconds.')
                 time.sleep(max_wait_time)
-
-    def _ftpopen(self, url):
+                RequestMetrics.add_time('rate_limit_sleep', max_wait_time)
+
+    def _ensure_login(self, rbrowser):
+        if self.login_pending and rbrowser is self.rbrowser:
+            with self.login_lock:
+                if self.login_pending and not self.restore_session():
+                    self.login()
+
+    def _reserve_request(self, url):
+        # Every session draws from the same budget, so the wait and the history entry are taken together
+        with self.rate_lock:
+            self.rate_limit()
+            self.rate_limiter.record()
+            self.request_count += 1
+            request_record = {'url': url, 'page_size': 0, 'timestamp': datetime.datetime.utcnow()}
+            self.history.append(request_record)
+
+        return request_record
+
+    def _log_metrics_summary(self):
+        summary = self.metrics.due_summary()
+        if summary:
+            log_event('Requests: ' + summary)
+
+    def resolve_url(self, url):
+        """
+        Returns the address a site URL is requested from, which differs from the URL when base_url is set.
+        """
+        return SITE_URL_RE.sub(self.base_url, url) if url else url
+
+    @property
+    def parsed(self):
+        """
+        The BeautifulSoup tree of the last page loaded, parsed on first use. Use text for the page's HTML instead
+        of str(browser.parsed), which serialises the whole tree.
+        """
+        return self.page.tree if self.page is not None else ''
+
+    @property
+    def text(self):
+        return self.page.text if self.page is not None else ''
+
+    def _response_page(self, url, rbrowser):
+        # RoboBrowser parses its response lazily, and the page shares that tree with the session's get_form
+        state = rbrowser.state
+        return Page(url, rbrowser.response.content, lambda: state.parsed, metrics=self.metrics)
+
+    def _cached_page(self, url, content, rbrowser):
+        return Page(url, content, lambda: BeautifulSoup(content, features=rbrowser.parser), metrics=self.metrics, from_cache=True)
+
+    def _ftpsubmit(self, form, rbrowser=None):
+        rbrowser = self.rbrowser if rbrowser is None else rbrowser
+        self._ensure_login(rbrowser)
+        with self.metrics.time_request(form.action) as timings:
+            request_record = self._reserve_request(form.action)
+
+            # Relative form actions already resolve against the server the form was loaded from
+            form.action = self.resolve_url(form.action)
+
+            with self.metrics.time_stage('transfer'):
+                rbrowser.submit_form(form)
+            timings['bytes'] = request_record['page_size'] = len(rbrowser.response.content)
+        request_record['timings'] = dict(timings)
+        self._log_metrics_summary()
+
+        page = self._response_page(form.action, rbrowser)
+        if rbrowser is self.rbrowser:
+            self.page = page
+        return page
+
+    def _ftpopen(self, url, rbrowser=None, use_cache=True):
         if 'www.fromthepavilion.org/' not in url:
             log_event('Invalid URL: {}'.format(url))
             return
 
-        self.rate_limit()
+        rbrowser = self.rbrowser if rbrowser is None else rbrowser
+
+        # Offline there is nothing to download, so the cache is read even when it should be bypassed
+        read_cache = self.page_cache and (use_cache or self.page_cache.offline)
+        cached_content = self.page_cache.get(url) if read_cache else None
+        if cached_content is not None:
+            self.metrics.record_cache_hit(url)
+            page = self._cached_page(url, cached_content, rbrowser)
+        else:
+            self._ensure_login(rbrowser)
+            with self.metrics.time_request(url) as timings:
+                request_record = self._reserve_request(url)
+
+                with self.metrics.time_stage('transfer'):
+                    rbrowser.open(self.resolve_url(url))
+                timings['bytes'] = request_record['page_size'] = len(rbrowser.response.content)
+            request_record['timings'] = dict(timings)
+            self._log_metrics_summary()
+
+            page = self._response_page(url, rbrowser)
+
+            # Logged out pages are never cached, so a replayed page is always a logged in view
+            if self.page_cache and self.check_login(page):
+                self.page_cache.put(url, page.content)
 
-        self.rbrowser.open(url)
-        page_content = self.rbrowser.response.content
-        page_size = len(page_content)
-        timestamp = datetime.datetime.utcnow()
-        self.history.append({'url': url, 'page_size': page_size, 'timestamp': timestamp})
+        if rbrowser is self.rbrowser:
+            self.page = page
 
-        self.parsed = self.rbrowser.parsed
+        return page
 
-    def open(self, url):
+    def open(self, url, use_cache=True):
+        """
+        Opens a page with the main session.
+
+        Parameters:
+        - url (str): The page URL.
+        - use_cache (bool): False to download the page even if the page cache has a fresh copy, for pages whose
+          current game week or season is read. The downloaded page still replaces the cached copy.
+        """
         if 'www.fromthepavilion.org/' not in url:
             log_event('Invalid URL: {}'.format(url))
             return
 
         log_event('Opening URL: {}'.format(url))
-        self._ftpopen(url)
+        self._ftpopen(url, use_cache=use_cache)
 
         if not self.check_login():
             log_event('Session expired. Attempting to re-login.')
+            self.metrics.count(url, 'relogins')
+            self.metrics.count(url, 'retries')
             self.login()
-            self._ftpopen(url)
+            self._ftpopen(url, use_cache=use_cache)
 
             if not self.check_login():
                 log_event('Failed to load page.')
@@ -131,28 +579,218 @@ class FTPBrowser(metaclass=SingletonMeta):
             result = self.rbrowser.get_form()
         else:
             result = self.rbrowser.get_form(action=action)
-        self.parsed = self.rbrowser.parsed
         return result
 
+    def get_page_form(self, url, action=None):
+        """
+        Returns a form of a page, opening the page only the first time the form is requested. Later calls return a
+        fresh copy of the form as it was first loaded, with its field names, hidden inputs and defaults, so that a
+        search can be filled in and submitted straight away instead of reopening its page every time. Forms are
+        loaded again after the browser logs in again.
+
+        The form is read from the opened page rather than the session, which does not load pages served from the
+        page cache, and its action is resolved against the page URL.
+
+        Parameters:
+        - url (str): The page containing the form.
+        - action (Optional[str]): The form's action, defaults to the first form on the page.
+
+        Returns:
+        - Form: A copy of the form, or None if the page has no such form.
+        """
+        key = (url, action)
+        if key not in self.form_cache:
+            self.open(url)
+            if self.page is None:
+                return None
+            form = self.page.tree.find('form', action=action) if action is not None else self.page.tree.find('form')
+            if form is None:
+                return None
+
+            # A copy, so that the page's own tree is left as it was downloaded
+            form = BeautifulSoup(str(form), 'html.parser').form
+            form['action'] = urljoin(url, form.get('action', ''))
+            self.form_cache[key] = str(form)
+
+        return Form(self.form_cache[key])
+
     def submit_form(self, form):
-        result = self.rbrowser.submit_form(form)
-        self.parsed = self.rbrowser.parsed
-        return result
+        action = form.action
+        page = self._ftpsubmit(form)
+
+        if not self.check_login(page):
+            log_event('Session expired. Attempting to re-login.')
+            self.metrics.count(action, 'relogins')
+            self.metrics.count(action, 'retries')
+            self.login()
+            form.action = action
+            page = self._ftpsubmit(form)
+
+            if not self.check_login(page):
+                log_event('Failed to load page.')
 
-    def check_login(self):
-        content = str(self.rbrowser.parsed)
+        return page
+
+    def check_login(self, page=None):
+        page = self.page if page is None else page
+        # The page's text is searched rather than its tree, so checking a page never parses it
+        content = page.text if isinstance(page, Page) else str(page or '')
         if '<strong>completely free</strong>' in content:
             return False
         return True
 
+    def _acquire_session(self):
+        while True:
+            with self.pool_lock:
+                try:
+                    return self.session_pool.get_nowait()
+                except queue.Empty:
+                    create_session = self.pool_sessions_created < self.pool_size
+                    if create_session:
+                        self.pool_sessions_created += 1
+                        session_name = 'pool{}'.format(self.pool_sessions_created)
+
+            if not create_session:
+                # Waiting with a timeout lets this thread take over if another thread fails to create its session
+                try:
+                    return self.session_pool.get(timeout=1)
+                except queue.Empty:
+                    continue
+
+            rbrowser = create_rbrowser()
+            self.session_names[rbrowser] = session_name
+            try:
+                if not self.restore_session(rbrowser):
+                    self.login(rbrowser=rbrowser)
+            except Exception:
+                with self.pool_lock:
+                    self.pool_sessions_created -= 1
+                raise
+            return rbrowser
+
+    def _fetch_with_session(self, url, use_cache=True):
+        # Cached pages are served without taking (or logging in) a pooled session
+        read_cache = self.page_cache and (use_cache or self.page_cache.offline)
+        cached_content = self.page_cache.get(url) if read_cache else None
+        if cached_content is not None:
+            self.metrics.record_cache_hit(url)
+            return self._cached_page(url, cached_content, self.rbrowser).text
+
+        rbrowser = self._acquire_session()
+        try:
+            page = self._ftpopen(url, rbrowser=rbrowser, use_cache=use_cache)
+            if not self.check_login(page):
+                log_event('Pooled session expired. Attempting to re-login.')
+                self.metrics.count(url, 'relogins')
+                self.metrics.count(url, 'retries')
+                self.login(rbrowser=rbrowser)
+                page = self._ftpopen(url, rbrowser=rbrowser, use_cache=use_cache)
+
+            return page.text
+        finally:
+            self.session_pool.put(rbrowser)
+
+    def fetch(self, url, use_cache=True):
+        """
+        Downloads one page with a pooled session, for callers running their own download threads (see Pipeline).
+        Returns the page content as a string. use_cache is as for open.
+        """
+        if 'www.fromthepavilion.org/' not in url:
+            raise ValueError('Invalid URL: {}'.format(url))
+
+        return self._fetch_with_session(url, use_cache=use_cache)
+
+    def fetch_many(self, urls, max_workers=None, use_cache=True):
+        """
+        Downloads several pages concurrently using a small pool of separately logged-in sessions.
+
+        All sessions share this browser's rate limit history, so the combined request rate stays within the
+        same limits enforced for single page loads.
+
+        Parameters:
+        - urls (list): The page URLs to download.
+        - max_workers (int): Number of concurrent sessions, defaults to the browser's pool_size.
+        - use_cache (bool): False to download pages even if the page cache has a fresh copy, as for open.
+
+        Returns:
+        - list: The page contents as strings, in the same order as urls.
+        """
+        urls = list(urls)
+        if not urls:
+            return []
+
+        for url in urls:
+            if 'www.fromthepavilion.org/' not in url:
+                raise ValueError('Invalid URL: {}'.format(url))
+
+        max_workers = min(max_workers or self.pool_size, self.pool_size, len(urls))
+        log_event('Opening {} URLs with {} sessions'.format(len(urls), max_workers))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda url: self._fetch_with_session(url, use_cache=use_cache), urls))
+
 
     def get_credentials(self):
         with open('data/credentials.txt', 'r') as f:
             return f.readline().strip().split(',')
 
 
-def initialize_browser(auto_login=True):
-    return FTPBrowser(auto_login=auto_login)
+def initialize_browser(auto_login=True, use_cache=True, offline=False, base_url=None):
+    return FTPBrowser(auto_login=auto_login, use_cache=use_cache, offline=offline, base_url=base_url)
+
+
+class LogWriter:
+    """
+    Appends log lines to their files from a background thread, so that logging a message does not open and write
+    the log file. Lines queued while a write is in progress are written together, and every queued line is written
+    before the process exits.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def write(self, path, line):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+                    atexit.register(self.flush)
+        # The path is resolved now, as the working directory may have changed by the time the line is written
+        self.queue.put((os.path.abspath(path), line))
+
+    def flush(self):
+        # Waits until every queued line has been written
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            lines = [self.queue.get()]
+            while True:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines_by_path = {}
+            for path, line in lines:
+                lines_by_path.setdefault(path, []).append(line)
+
+            for path, path_lines in lines_by_path.items():
+                try:
+                    log_dir = os.path.dirname(path)
+                    if log_dir and not os.path.exists(log_dir):
+                        os.makedirs(log_dir)
+                    with open(path, 'a') as f:
+                        f.writelines(path_lines)
+                except OSError as e:
+                    print(f'Could not write to log file {path}: {e}')
+
+            for _ in lines:
+                self.queue.task_done()
+
+
+log_writer = LogWriter()
 
 
 def log_event(logtext, logtype='full', logfile='default', ind_level=0):
@@ -162,16 +800,11 @@ def log_event(logtext, logtype='full', logfile='default', ind_level=0):
 
     for logf in logfile:
         if logf == 'default':
-            log_dir = 'data/logs'
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            logf = f'{log_dir}/ftp_archiver_output_history.log'
+            logf = 'data/logs/ftp_archiver_output_history.log'
         if logtype in ['full', 'console']:
             print('[{}] '.format(current_time.strftime('%d/%m/%Y-%H:%M:%S')) + '\t' * ind_level + logtext)
         if logtype in ['full', 'file']:
-            with open(logf, 'a') as f:
-                f.write('[{}] '.format(current_time.strftime('%d/%m/%Y-%H:%M:%S')) + logtext + '\n')
+            log_writer.write(logf, '[{}] '.format(current_time.strftime('%d/%m/%Y-%H:%M:%S')) + logtext + '\n')
 
         logtype = 'file' # to prevent repeated console outputs when multiple logfiles are specified
 
-
@@ -0,0 +1,201 @@
+import CoreUtils
+browser = CoreUtils.initialize_browser()
+
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+from ArchiveStore import ArchiveStore
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+CrawlItem = namedtuple('CrawlItem', ['Kind', 'ItemKey', 'Parent', 'Attempts'])
+
+
+class ItemNotReady(Exception):
+    """
+    Raised for an item that cannot be collected yet, e.g. a league game that has not been played. The item stays
+    pending without using up an attempt, and the remaining items with the same parent (if it has one) are left for
+    the next run.
+    """
+
+
+class CrawlJob:
+    """
+    Resumable bulk collection job.
+
+    A job's work items (e.g. league IDs, then the game IDs found in each league) are stored in a crawl_items table in
+    the same archive as the collected data, along with whether each item is pending, done or failed. run() hands the
+    pending items of one kind to a handler in batches and records the outcome of each batch once the handler returns,
+    so an interrupted job (a crash, a login failure, or being stopped during a long rate limit sleep) continues from
+    the first unfinished item when it is run again. Failed items are retried on later runs until max_attempts is
+    reached.
+
+    An item's data is saved by the handler before the item is marked as done, in a separate transaction, so an item is
+    never marked as done without its data. A crash between the two leaves the item pending and it is collected again,
+    so handlers that must not store an item twice skip the data they have already saved (e.g. with
+    get_stored_player_ids).
+    """
+
+    def __init__(self, name: str, store: ArchiveStore, max_attempts: int = 3):
+        """
+        Parameters:
+        - name (str): Name of the job. Items are shared by every run of a job with the same name.
+        - store (ArchiveStore): The archive the job's data is saved to, which also holds the job's progress.
+        - max_attempts (int): Number of times a failing item is attempted before it is skipped, defaults to 3.
+        """
+        self.name = name
+        self.store = store
+        self.max_attempts = max_attempts
+
+        with self.store.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS crawl_items (Job TEXT, Kind TEXT, ItemKey TEXT, Parent TEXT, Status TEXT, '
+                         'Attempts INTEGER, LastError TEXT, UpdatedAt TEXT, PRIMARY KEY (Job, Kind, ItemKey))')
+
+    def add_items(self, kind: str, keys: Iterable, parent=None) -> int:
+        """
+        Adds work items to the job. Items that already exist keep their status, so adding the same items on every run
+        is safe. Returns the number of new items.
+        """
+        now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        parent = None if parent is None else str(parent)
+        rows = [(self.name, kind, str(key), parent, 'pending', 0, None, now) for key in keys]
+
+        with self.store.transaction() as conn:
+            return conn.executemany('INSERT OR IGNORE INTO crawl_items (Job, Kind, ItemKey, Parent, Status, Attempts, LastError, UpdatedAt) '
+                                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows).rowcount
+
+    def get_items(self, kind: str, status: Optional[str] = None) -> List[CrawlItem]:
+        query = 'SELECT Kind, ItemKey, Parent, Attempts FROM crawl_items WHERE Job = ? AND Kind = ?'
+        params = [self.name, kind]
+        if status is not None:
+            query += ' AND Status = ?'
+            params.append(status)
+
+        return [CrawlItem(*row) for row in self.store.fetchall(query + ' ORDER BY rowid', params)]
+
+    def get_pending_items(self, kind: str) -> List[CrawlItem]:
+        return [CrawlItem(*row) for row in self.store.fetchall('''
+            SELECT Kind, ItemKey, Parent, Attempts FROM crawl_items
+            WHERE Job = ? AND Kind = ? AND (Status = 'pending' OR (Status = 'failed' AND Attempts < ?))
+            ORDER BY rowid
+        ''', (self.name, kind, self.max_attempts))]
+
+    def progress(self, kind: Optional[str] = None) -> Dict[str, int]:
+        """
+        Returns the number of the job's items with each status, of one kind or of every kind.
+        """
+        query = 'SELECT Status, COUNT(*) FROM crawl_items WHERE Job = ?' + (' AND Kind = ?' if kind else '') + ' GROUP BY Status'
+        counts = {'pending': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(self.store.fetchall(query, [self.name] + ([kind] if kind else []))))
+        return counts
+
+    def reset(self, kind: Optional[str] = None, status: str = 'failed') -> int:
+        """
+        Returns items with the given status (failed items by default) to pending with no attempts.
+        """
+        query = "UPDATE crawl_items SET Status = 'pending', Attempts = 0 WHERE Job = ? AND Status = ?" + (' AND Kind = ?' if kind else '')
+        with self.store.transaction() as conn:
+            return conn.execute(query, [self.name, status] + ([kind] if kind else [])).rowcount
+
+    def estimate_eta(self, n_items: int, requests_per_item: float, seconds_per_item: Optional[float] = None) -> timedelta:
+        """
+        Estimates the time needed to collect the remaining items.
+
+        The requests still needed are compared against the requests left in each of the browser's rate limit windows.
+        Requests beyond a window's remaining budget can only be made as the window frees up, at its limit per window
+        duration, so e.g. a crawl needing 3000 more requests takes at least a day once the 2000 per day limit is used
+        up. The estimate is the longest of these, or of n_items * seconds_per_item if the job's own pace is slower.
+
+        Parameters:
+        - n_items (int): Number of items remaining.
+        - requests_per_item (float): Average number of page requests per item.
+        - seconds_per_item (Optional[float]): Average time taken per item so far, if known.
+
+        Returns:
+        - timedelta: The estimated time until the remaining items are collected.
+        """
+        requests_needed = n_items * requests_per_item
+        eta_seconds = n_items * seconds_per_item if seconds_per_item else 0
+
+        for (duration, limit), (_, remaining) in zip(browser.rate_limiter.limits, browser.rate_limiter.remaining()):
+            if requests_needed > remaining:
+                eta_seconds = max(eta_seconds, (requests_needed - remaining) * duration / limit)
+
+        return timedelta(seconds=int(eta_seconds))
+
+    def run(self, kind: str, handler: Callable[[List[CrawlItem]], Optional[Dict[str, Exception]]], batch_size: int = 1,
+            requests_per_item: float = 1.0) -> Dict[str, int]:
+        """
+        Runs the handler over every pending item of one kind, including items added while the job is running.
+
+        The handler is called with a list of up to batch_size CrawlItems. It either raises, failing the whole batch,
+        or returns None or a dict mapping the ItemKeys of items that did not succeed to their exception. Items missing
+        from the dict are marked as done. Any data the handler saves should be saved before it returns, so that an
+        item is only marked as done once its data is stored.
+
+        Parameters:
+        - kind (str): The kind of item to process, e.g. 'game'.
+        - handler (Callable): Processes a batch of items.
+        - batch_size (int): Maximum number of items passed to the handler at once, defaults to 1.
+        - requests_per_item (float): Estimated page requests per item, used for the ETA until the job has measured it.
+
+        Returns:
+        - Dict[str, int]: Number of items 'done', 'failed' and 'deferred' by this run.
+        """
+        summary = {'done': 0, 'failed': 0, 'deferred': 0}
+        attempted_items, deferred_parents = set(), set()
+        start_time, start_request_count = time.time(), browser.request_count
+
+        while True:
+            pending_items = [item for item in self.get_pending_items(kind)
+                             if item.ItemKey not in attempted_items and item.Parent not in deferred_parents]
+            if not pending_items:
+                break
+
+            batch = pending_items[:batch_size]
+            attempted_items.update(item.ItemKey for item in batch)
+            try:
+                errors = handler(batch) or {}
+            except Exception as e:
+                errors = {item.ItemKey: e for item in batch}
+
+            now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+            updates = []
+            for item in batch:
+                error = errors.get(item.ItemKey)
+                if error is None:
+                    updates.append(('done', item.Attempts + 1, None))
+                    summary['done'] += 1
+                elif isinstance(error, ItemNotReady):
+                    if item.Parent is None:
+                        CoreUtils.log_event(f'{kind} {item.ItemKey} is not ready yet - ({error})', ind_level=1)
+                    else:
+                        CoreUtils.log_event(f'{kind} {item.ItemKey} is not ready yet, deferring the remaining items of {item.Parent} - ({error})', ind_level=1)
+                        deferred_parents.add(item.Parent)
+                    updates.append(('pending', item.Attempts, str(error)))
+                    summary['deferred'] += 1
+                else:
+                    CoreUtils.log_event(f'Error collecting {kind} {item.ItemKey} (attempt {item.Attempts + 1}/{self.max_attempts}) - ({error})', ind_level=1)
+                    updates.append(('failed', item.Attempts + 1, str(error)))
+                    summary['failed'] += 1
+
+            with self.store.transaction() as conn:
+                conn.executemany('UPDATE crawl_items SET Status = ?, Attempts = ?, LastError = ?, UpdatedAt = ? WHERE Job = ? AND Kind = ? AND ItemKey = ?',
+                                 [update + (now, self.name, kind, item.ItemKey) for update, item in zip(updates, batch)])
+
+            self.log_progress(kind, len(pending_items) - len(batch), len(attempted_items), time.time() - start_time,
+                              browser.request_count - start_request_count, requests_per_item)
+
+        return summary
+
+    def log_progress(self, kind: str, n_remaining: int, n_attempted: int, elapsed_seconds: float, n_requests: int, requests_per_item: float) -> None:
+        counts = self.progress(kind)
+        total = sum(counts.values())
+
+        if n_attempted > 0 and n_requests > 0:
+            requests_per_item = n_requests / n_attempted
+        eta = self.estimate_eta(n_remaining, requests_per_item, elapsed_seconds / n_attempted if n_attempted else None)
+
+        CoreUtils.log_event(f'{self.name}: {counts["done"]}/{total} {kind} items done, {counts["failed"]} failed, {n_remaining} remaining in this run. '
+                            f'ETA {eta} at {requests_per_item:.1f} requests per item.', ind_level=1)
@@ -7,12 +7,10 @@ import pandas as pd
 from bs4 import BeautifulSoup
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib
 import sqlite3
 import json
-import jsonschema
-from jsonschema import validate
 from typing import Dict, Optional, Union
+from ArchiveStore import open_store
 from FTPConstants import *
 from io import StringIO
 
@@ -23,6 +21,8 @@ pd.options.mode.chained_assignment = None  # default='warn'
 def nationality_id_to_rgba_color(natid):
     nat_colors = ['darkblue', 'red', 'forestgreen', 'black', 'mediumseagreen', 'darkkhaki', 'maroon', 'firebrick', 'darkgreen', 'firebrick', 'tomato', 'royalblue', 'brown', 'darkolivegreen', 'olivedrab', 'purple', 'lightcoral', 'darkorange']
 
+    # matplotlib is slow to import and only needed for plotting, so it is imported on first use
+    import matplotlib.colors
     return matplotlib.colors.to_rgba(nat_colors[natid-1])
 
 
@@ -53,18 +53,20 @@ def skill_word_to_index(skill_w, skill_word_type='full'):
 
 def get_player_page(player_id):
     browser.open('https://www.fromthepavilion.org/player.htm?playerId={}'.format(player_id))
-    page = str(browser.parsed)
 
-    return page
+    return browser.text
 
 
 def get_current_game_week():
     try:
-        page = str(browser.parsed)
+        # A page served from the page cache may show an earlier week
+        if browser.page is None or browser.page.from_cache:
+            raise ValueError('No downloaded page to read the game week from')
+        page = browser.text
         timestamp, season, week = get_timestamp_info_from_page(page)
     except:
-        browser.open('https://www.fromthepavilion.org/natclub.htm?teamId=3016')
-        page = str(browser.parsed)
+        browser.open('https://www.fromthepavilion.org/natclub.htm?teamId=3016', use_cache=False)
+        page = browser.text
         timestamp, season, week = get_timestamp_info_from_page(page)
 
     return (season, week)
@@ -118,21 +120,18 @@ def cache_team(team_id: Union[int, str], db_file_path: str = 'data/PavilionPy.db
     """
 
     if not os.path.exists(db_file_path):
-        create_table_sql = "CREATE TABLE IF NOT EXISTS teams (TeamID TEXT, TeamName TEXT, ManagerName TEXT, ManagerMembership BOOLEAN, TeamRegionID TEXT, TeamGroundName TEXT, DataSeason INTEGER, DataTimeStamp TEXT)"
         try:
-            with sqlite3.connect(db_file_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(create_table_sql)
+            open_store(db_file_path, tables=['teams'])
         except sqlite3.Error as e:
             print(f"Error initializing database: {e}")
             return None
 
+    # The season stored with the team is read from the page, so a cached copy from an earlier season is not used
     if int(team_id) in range(3001, 3019) or int(team_id) in range(3021, 3039):
-        browser.open(f'https://www.fromthepavilion.org/natclub.htm?teamId={team_id}')
+        browser.open(f'https://www.fromthepavilion.org/natclub.htm?teamId={team_id}', use_cache=False)
     else:
-        browser.open(f'https://www.fromthepavilion.org/club.htm?teamId={team_id}')
-    html_content = str(browser.parsed)
-    soup = BeautifulSoup(html_content, 'html.parser')
+        browser.open(f'https://www.fromthepavilion.org/club.htm?teamId={team_id}', use_cache=False)
+    soup = browser.parsed
 
     manager_name_match = soup.find('th', string="Manager").find_next_sibling('td')
     manager_name = manager_name_match.get_text(strip=True) if manager_name_match else None
@@ -161,7 +160,7 @@ def cache_team(team_id: Union[int, str], db_file_path: str = 'data/PavilionPy.db
 
     data_timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
     try:
-        with sqlite3.connect(db_file_path) as conn:
+        with open_store(db_file_path, tables=['teams']).transaction() as conn:
             cursor = conn.cursor()
 
             # First check if we already have this team for this season
@@ -192,7 +191,6 @@ def cache_team(team_id: Union[int, str], db_file_path: str = 'data/PavilionPy.db
                                               team_region_id, team_ground_name, data_season, data_timestamp))
                 CoreUtils.log_event(f'{team_name} ({team_id}) has been added to the teams database.')
 
-            conn.commit()
             return True
     except sqlite3.Error as e:
         CoreUtils.log_event(f"Teams database error: {e}")
@@ -209,6 +207,8 @@ def load_config(config_file_path: str, schema_file_path: str = "data/schema/arch
     Returns:
     - Optional[Dict]: The validated configuration data, or None if validation fails.
     """
+    import jsonschema
+
     try:
         with open(schema_file_path, 'r') as schema_file:
             schema = json.load(schema_file)
@@ -216,7 +216,7 @@ def load_config(config_file_path: str, schema_file_path: str = "data/schema/arch
         with open(config_file_path, 'r') as config_file:
             config_data = json.load(config_file)
 
-        validate(instance=config_data, schema=schema)
+        jsonschema.validate(instance=config_data, schema=schema)
 
         return config_data
 
@@ -248,7 +248,7 @@ def get_team_info(team_id: str, attribute: str, season: Optional[int] = None, db
         return get_team_info(team_id, attribute, season, db_file_path)
 
     try:
-        with sqlite3.connect(db_file_path) as conn:
+        with open_store(db_file_path).connection() as conn:
             cursor = conn.cursor()
 
             # If season is not specified, find the latest season in the database
@@ -378,39 +378,52 @@ def convert_text_to_numeric_skills(df):
 
 def get_team_page(teamid):
     browser.open('https://www.fromthepavilion.org/club.htm?teamId={}'.format(teamid))
-    page = str(browser.parsed)
 
-    return page
+    return browser.text
 
 
 def get_transfer_history_page(player_id):
     transfer_history_url = f'https://www.fromthepavilion.org/playertransfers.htm?playerId={player_id}'
     browser.open(transfer_history_url)
-    page = str(browser.parsed)
-    return page
+    return browser.text
+
+
+TRANSFER_HISTORY_COLUMNS = ['CompletionTime', 'FromTeamName', 'ToTeamName', 'FinalPrice', 'Rating', 'Age', 'ToTeamID', 'FromTeamID']
 
 
 def extract_transfer_history_table(page):
+    """
+    Parses a player's transfer history page into a DataFrame with one row per completed transfer.
+
+    The page is parsed once with BeautifulSoup; the table text and the team links are both read from the same tree.
+    A page without a transfer table (e.g. a player who has never been sold) gives an empty DataFrame.
+    """
     soup = BeautifulSoup(page, 'html.parser')
     table = soup.find('table', class_='data stats tablesorter')
-    to_team_ids = []
-    from_team_ids = []
-    if table:
-        rows = table.find_all('tr')[1:]  # Exclude header
-        for row in rows:
-            to_cell = row.find_all('td')[3]  # 'To' column is the fourth column
-            from_cell = row.find_all('td')[2]  # 'From' column is the third column
+    if not table:
+        return pd.DataFrame(columns=TRANSFER_HISTORY_COLUMNS)
 
-            to_link = to_cell.find('a', href=True)
-            from_link = from_cell.find('a', href=True)
+    def cell_text(cell):
+        return ' '.join(cell.get_text().split())  # Whitespace is collapsed as in pd.read_html
 
-            to_team_id = re.search(r'teamId=(\d+)', to_link['href']).group(1) if to_link else None
-            from_team_id = re.search(r'teamId=(\d+)', from_link['href']).group(1) if from_link else None
+    header_row, *rows = table.find_all('tr')
+    headers = [cell_text(cell) for cell in header_row.find_all(['th', 'td'])]
+
+    records = []
+    to_team_ids = []
+    from_team_ids = []
+    for row in rows:
+        cells = row.find_all('td')
+        if len(cells) < len(headers):
+            continue
+        records.append([cell_text(cell) for cell in cells[:len(headers)]])
 
-            to_team_ids.append(to_team_id)
-            from_team_ids.append(from_team_id)
+        to_link = cells[3].find('a', href=True)  # 'To' column is the fourth column
+        from_link = cells[2].find('a', href=True)  # 'From' column is the third column
+        to_team_ids.append(re.search(r'teamId=(\d+)', to_link['href']).group(1) if to_link else None)
+        from_team_ids.append(re.search(r'teamId=(\d+)', from_link['href']).group(1) if from_link else None)
 
-    transfer_table = pd.read_html(StringIO(page))[0]
+    transfer_table = pd.DataFrame(records, columns=headers)
 
     def parse_date(date_str):
         for date_format in ['%d %b. %y %H:%M', '%d %b %y %H:%M']:
@@ -431,21 +444,37 @@ def extract_transfer_history_table(page):
     return transfer_table
 
 
-def match_deadline_to_transaction(player_id, reference_deadline, epsilon=timedelta(hours=6)):
+def find_transaction(transfer_history_table, reference_deadline, epsilon=timedelta(hours=6)):
     """
-    Finds the closest transaction to the given reference_deadline within a specified epsilon time window.
-    Only considers transactions that occurred after the reference deadline.
+    Finds the closest transaction to the given reference_deadline within a specified epsilon time window, in a table
+    returned by extract_transfer_history_table. Returns None if no transaction matches.
     """
-    transfer_page = get_transfer_history_page(player_id)
-    transfer_history_table = extract_transfer_history_table(transfer_page)
     start_time = reference_deadline-timedelta(minutes=2) # The completion time must be equal to or greater than the estimated deadline... but include a buffer
 
-    valid_transactions = transfer_history_table[transfer_history_table['CompletionTime'] >= start_time]
+    completed_transactions = transfer_history_table[transfer_history_table['CompletionTime'].notnull()]
+    valid_transactions = completed_transactions[completed_transactions['CompletionTime'] >= start_time]
 
     for i, transaction in valid_transactions.iterrows():
         if abs((transaction['CompletionTime'] - reference_deadline).total_seconds()) < epsilon.total_seconds():
             transaction['CompletionTime'] = transaction['CompletionTime'].strftime('%Y-%m-%dT%H:%M:%S')
-            return transaction.to_dict()#[transaction['ToTeamName'], transaction['ToTeamID'], transaction['FinalPrice'], transaction['CompletionTime'].strftime('%Y-%m-%dT%H:%M:%S')]
+            return transaction.to_dict()
+
+    return None
+
+
+def match_deadline_to_transaction(player_id, reference_deadline, epsilon=timedelta(hours=6), page=False, transfer_history_table=None):
+    """
+    Finds the closest transaction to the given reference_deadline within a specified epsilon time window.
+    Only considers transactions that occurred after the reference deadline.
+    """
+    if transfer_history_table is None:
+        if not page:
+            page = get_transfer_history_page(player_id)
+        transfer_history_table = extract_transfer_history_table(page)
+
+    transaction = find_transaction(transfer_history_table, reference_deadline, epsilon=epsilon)
+    if transaction is not None:
+        return transaction
 
     return {'ToTeamName': '(did not sell)', 'ToTeamID': -1, 'FinalPrice': -1, 'CompletionTime': '1970-01-01T00:00:00', 'FromTeamID': -1, 'FromTeamName': '-1', 'Year': -1, 'Rating': -1}
 
@@ -463,7 +492,7 @@ def get_team_name(teamid, page=False):
 def get_team_region(teamid, return_type='regionid', page=False):
     if not page:
         browser.open('https://www.fromthepavilion.org/club.htm?teamId={}'.format(teamid))
-        page = str(browser.parsed)
+        page = browser.text
 
     country_ids = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 14, 15, 18]
     senior_country_ids = [id + 3000 for id in country_ids]
@@ -874,6 +903,80 @@ def get_player_skills(player_id, page=False):
     return skill_dir
 
 
+def parse_player_page(page: str, player_id: Optional[Union[int, str]] = None) -> Dict:
+    """
+    Extracts every field available on a player.htm page in a single pass, so that callers needing many columns
+    do not re-run the individual get_player_* helpers (and their BeautifulSoup builds) once per column.
+
+    Parameters:
+    - page (str): The player.htm page content.
+    - player_id (Optional[Union[int, str]]): The player's ID, used to locate the player name in the page header.
+
+    Returns:
+    - Dict: A record keyed by column name (Player, Rating, Batting, WageReal, Talent1, DataSeason, etc.).
+      Fields that cannot be found on the page are None.
+    """
+    record = {'Player': get_player_name(player_id, page)}
+
+    age_match = re.search(r'(\d+)y(\d+)w', page)
+    if age_match:
+        years, weeks = int(age_match.group(1)), int(age_match.group(2))
+        record['AgeDisplay'] = f"{years}.{str(weeks).zfill(2)}"
+        record['AgeYear'] = years
+        record['AgeWeeks'] = weeks
+        record['AgeValue'] = years + (weeks / 15.0)
+    else:
+        record.update({'AgeDisplay': None, 'AgeYear': None, 'AgeWeeks': None, 'AgeValue': None})
+    record['Age'] = record['AgeDisplay']
+
+    try:
+        record['WageReal'], record['WagePaid'], record['WageDiscount'] = get_player_wage(player_id, page, return_type='tuple')
+    except IndexError:
+        record['WageReal'], record['WagePaid'], record['WageDiscount'] = None, None, None
+
+    record['Talent1'], record['Talent2'] = get_player_talents(player_id, page)
+    record['Rating'] = get_player_rating(player_id, page)
+    record['Experience'] = get_player_experience(player_id, page)
+    record['Form'] = get_player_form(player_id, page)
+    record['Fatigue'] = get_player_fatigue(player_id, page)
+    record['Captaincy'] = get_player_captaincy(player_id, page)
+    record['BatHand'] = get_player_batting_type(player_id, page)
+    record['BowlType'] = get_player_bowling_type(player_id, page)
+    try:
+        record['Nationality'] = get_player_nationality(player_id, page)
+    except IndexError:
+        record['Nationality'] = None
+    record['NatSquad'] = 'This player is a member of the national squad' in page
+    record['Touring'] = 'This player is on tour with the national team' in page
+
+    header_index = page.find('<h1>')
+    team_match = re.search(r'<a href="club\.htm\?teamId=(\d+)">([^<]+)</a>', page[header_index:]) if header_index >= 0 else None
+    record['TeamID'] = team_match.group(1) if team_match else None
+    record['TeamName'] = team_match.group(2).strip().replace('amp;', '') if team_match else None
+
+    skills_summary = get_player_skills_summary(player_id, page)
+    record['SummaryBat'] = skills_summary['Batsman']
+    record['SummaryBowl'] = skills_summary['Bowler']
+    record['SummaryKeep'] = skills_summary['Keeper']
+    record['SummaryAllr'] = skills_summary['Allrounder']
+
+    player_skills = get_player_skills(player_id, page)
+    for skill_name in ORDERED_SKILLS:
+        record[skill_name] = player_skills.get(skill_name, 'Not Available')
+
+    if record['Rating'] is not None:
+        record['SpareRating'] = record['Rating'] - calculate_rating_from_skills(list(player_skills.values()))
+    else:
+        record['SpareRating'] = None
+
+    try:
+        record['DataTimestamp'], record['DataSeason'], record['DataWeek'] = get_timestamp_info_from_page(page)
+    except IndexError:
+        record['DataTimestamp'], record['DataSeason'], record['DataWeek'] = None, None, None
+
+    return record
+
+
 def get_league_teamids(leagueid, league_format='league', knockout_round=None, ind_level=0):
     if league_format == 'knockout':
         if not isinstance(knockout_round, None):
@@ -897,7 +1000,7 @@ def get_league_teamids(leagueid, league_format='league', knockout_round=None, in
 
 def get_team_season_matches(teamid):
     browser.open('https://www.fromthepavilion.org/teamfixtures.htm?teamId={}#curr'.format(teamid))
-    page = str(browser.parsed)
+    page = browser.text
 
     data = pd.read_html(page)[1]
     date_list = [datetime.datetime.strptime(date_str, '%d %b %Y %H:%M') for date_str in data['Date']]
@@ -914,7 +1017,7 @@ def get_league_gameids(leagueid, round_n='latest', league_format='league'):
 
     if league_format == 'league':
         browser.open('https://www.fromthepavilion.org/leaguefixtures.htm?lsId={}'.format(leagueid))
-        league_page = str(browser.parsed)
+        league_page = browser.text
         league_rounds = int(max([int(r[6:]) for r in re.findall('Round [0-9]+', league_page)]))
         gameids = [g[7:] for g in re.findall('gameId=[0-9]+', league_page)]
 
@@ -932,13 +1035,14 @@ def get_league_gameids(leagueid, round_n='latest', league_format='league'):
 
     elif league_format == 'knockout':
         browser.open('https://www.fromthepavilion.org/cupfixtures.htm?cupId={}&currentRound=true'.format(leagueid))
-        fixtures = pd.read_html(str(browser.parsed))[0]
+        page = browser.text
+        fixtures = pd.read_html(StringIO(page))[0]
         for n, roundname in enumerate(fixtures.columns):
             if roundname[:7] == 'Round {}'.format(round_n):
                 round_column_name = roundname
                 break
 
-        games_on_page = re.findall('gameId=.{0,150}', str(browser.parsed))
+        games_on_page = re.findall('gameId=.{0,150}', page)
         requested_games = []
         for game in fixtures[round_column_name][::2 ** (round_n - 1)]:
             team1, team2 = game.split('vs')
@@ -965,8 +1069,9 @@ def get_league_gameids(leagueid, round_n='latest', league_format='league'):
 
 def get_game_scorecard_table(gameid, ind_level=0):
     browser.open('https://www.fromthepavilion.org/scorecard.htm?gameId={}'.format(gameid))
-    scorecard_tables = pd.read_html(str(browser.parsed))
-    page_teamids = [''.join([c for c in x if c.isdigit()]) for x in re.findall('teamId=[0-9]+', str(browser.parsed))]
+    page = browser.text
+    scorecard_tables = pd.read_html(StringIO(page))
+    page_teamids = [''.join([c for c in x if c.isdigit()]) for x in re.findall('teamId=[0-9]+', page)]
     home_team_id, away_team_id = page_teamids[21], page_teamids[22]
     scorecard_tables[-2].iloc[0][1] = home_team_id
     scorecard_tables[-2].iloc[1][1] = away_team_id
@@ -978,7 +1083,7 @@ def get_game_scorecard_table(gameid, ind_level=0):
 
 def get_game_teamids(gameid, ind_level=0):
     browser.open('https://www.fromthepavilion.org/gamedetails.htm?gameId={}'.format(gameid))
-    page_teamids = [''.join([c for c in x if c.isdigit()]) for x in re.findall('teamId=[0-9]+', str(browser.parsed))]
+    page_teamids = [''.join([c for c in x if c.isdigit()]) for x in re.findall('teamId=[0-9]+', browser.text)]
     home_team_id, away_team_id = page_teamids[22], page_teamids[23]
 
     CoreUtils.log_event('Found teams for game {} - {} vs {}'.format(gameid, home_team_id, away_team_id), ind_level=ind_level)
@@ -0,0 +1,292 @@
+import CoreUtils
+browser = CoreUtils.initialize_browser()
+
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import pandas as pd
+import FTPUtils
+from ArchiveStore import open_store
+from TransactionResolver import TransactionResolver
+from PavilionPy import search_transfer_listings, finalise_transfer_listings, save_market_listings
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Requests made for each archived listing: its player.htm and playerpopup.htm pages for the 'all_visible' columns, and
+# the transfer history that resolves its transaction
+REQUESTS_PER_LISTING = 3
+
+
+class MarketScheduler:
+    """
+    Event scheduler for the transfer market monitor.
+
+    Events are kept in a priority queue ordered by the time they are due:
+    - 'search': Downloads the first poll_pages pages of search results, which hold the listings closest to their
+      deadline, or every page of the search split by country once every full_sweep_interval. Listings seen for the
+      first time get a 'detail' event shortly before their deadline, and the listing rows of known listings are
+      refreshed with their latest bid. The next search is scheduled from the rate at which new listings are
+      appearing, before the listings beyond the downloaded pages could be due.
+    - 'detail': Downloads the player pages of every listing whose deadline is close, once per listing, and stores
+      them in the archive. Schedules a 'resolve' event after the latest of their deadlines.
+    - 'resolve': Resolves the transactions of expired listings through the TransactionResolver.
+
+    Compared to re-downloading the first results page and all of its player pages on every cycle, each listing's
+    player pages are downloaded once, so more listings can be archived within the browser's rate limits.
+
+    Requests are budgeted from the browser's rate limiter: the requests remaining in each of its windows, spread over
+    the window, give the request rate that can be sustained. Searches are spaced so that they use at most
+    search_budget_share of that rate, and the remainder is an allowance for the player pages and transfer histories
+    of the listings. Listings that come due while the allowance is spent are not archived.
+    """
+
+    def __init__(self, db_file: str, search_settings: Dict = {}, detail_lead: timedelta = timedelta(minutes=3),
+                 detail_batch_window: timedelta = timedelta(minutes=2), resolution_delay: timedelta = timedelta(minutes=60),
+                 resolution_horizon: timedelta = timedelta(days=1), min_poll_interval: timedelta = timedelta(minutes=2),
+                 max_poll_interval: timedelta = timedelta(hours=2), target_new_listings_per_poll: int = 10,
+                 rate_smoothing: float = 0.3, poll_pages: int = 1, full_sweep_interval: timedelta = timedelta(days=1),
+                 search_budget_share: float = 0.25, budget_carryover: timedelta = timedelta(hours=6), retry_delay: int = 60,
+                 max_retries: int = 10, delay_factor: float = 2.0, max_delay: int = 3600):
+        """
+        Parameters:
+        - db_file (str): Path to the market archive, or the name of an archive in data/archives.
+        - search_settings (Dict): Transfer market search settings, defaults to the default search.
+        - detail_lead (timedelta): How long before its deadline a listing's player pages are downloaded.
+        - detail_batch_window (timedelta): Listings due for details within this window are downloaded together.
+        - resolution_delay (timedelta): How long after a deadline the listing's transaction is resolved.
+        - resolution_horizon (timedelta): Time after a deadline after which an unresolved listing is recorded as unsold.
+        - min_poll_interval (timedelta): Shortest interval between searches.
+        - max_poll_interval (timedelta): Longest interval between searches, unless the request budget needs a longer one.
+        - target_new_listings_per_poll (int): Number of new listings each search should find on average.
+        - rate_smoothing (float): Weight of the latest observation in the smoothed new listing rate.
+        - poll_pages (int): Number of results pages downloaded by each search, defaults to 1. These searches are not
+          split by country.
+        - full_sweep_interval (timedelta): Interval between searches of every results page, split by country. The
+          first search is always a full sweep.
+        - search_budget_share (float): Fraction of the sustainable request rate used by searches, defaults to 0.25.
+        - budget_carryover (timedelta): Unused listing allowance is kept for at most this long, so that a quiet period
+          lets more listings be archived in a later busy one, defaults to 6 hours.
+        - retry_delay (int): Initial delay in seconds before retrying a failed event, defaults to 60.
+        - max_retries (int): Maximum number of consecutive failures before giving up, defaults to 10.
+        - delay_factor (float): Factor by which the retry delay increases after each failure, defaults to 2.0.
+        - max_delay (int): Maximum retry delay in seconds, defaults to 3600.
+        """
+        if not ('.' in db_file): # db_file is not a filename, and instead a archive name
+            db_file = f'{FTPUtils.get_database_from_name(db_file)}.db'
+
+        self.store = open_store(db_file, tables=['players', 'transactions'])
+        self.transaction_resolver = TransactionResolver(self.store, resolution_delay=resolution_delay, horizon=resolution_horizon)
+        self.search_settings = search_settings
+        self.detail_lead = detail_lead
+        self.detail_batch_window = detail_batch_window
+        self.resolution_delay = resolution_delay
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.target_new_listings_per_poll = target_new_listings_per_poll
+        self.rate_smoothing = rate_smoothing
+        self.poll_pages = poll_pages
+        self.full_sweep_interval = full_sweep_interval
+        self.search_budget_share = search_budget_share
+        self.budget_carryover = budget_carryover
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.delay_factor = delay_factor
+        self.max_delay = max_delay
+        self.current_delay = retry_delay  # Delay before the next retry of a failed event
+
+        self.events = []
+        self.event_counter = itertools.count()
+        self.listings = {}  # (PlayerID, Deadline): {'row': pd.Series, 'stored': bool, 'skipped': bool}
+        self.new_listing_rate = None  # Smoothed new listings per second
+        self.last_search_time = None
+        self.last_full_sweep_time = None
+        self.last_search_cost = 1  # Requests made by the latest search
+        self.listing_allowance = None  # Requests the detail and resolve events can still make
+        self.last_allowance_time = None
+
+    def schedule(self, when: datetime, kind: str, payload=None) -> None:
+        heapq.heappush(self.events, (when, next(self.event_counter), kind, payload))
+
+    def take_events(self, kind: str, until: datetime) -> list:
+        """
+        Removes and returns every event of a kind that is due by the given time.
+        """
+        taken = [event for event in self.events if event[2] == kind and event[0] <= until]
+        if taken:
+            self.events = [event for event in self.events if not (event[2] == kind and event[0] <= until)]
+            heapq.heapify(self.events)
+
+        return taken
+
+    @staticmethod
+    def get_request_rate() -> float:
+        """
+        Returns the number of requests per second that can be made without using up any of the browser's rate limit
+        windows: the requests remaining in each window, spread over its duration.
+        """
+        return min(remaining / duration for duration, remaining in browser.rate_limiter.remaining())
+
+    @staticmethod
+    def count_remaining_requests() -> int:
+        # The requests remaining in the longest window only fall as requests are made, until week-old requests expire
+        return max(browser.rate_limiter.remaining())[1]
+
+    def update_listing_allowance(self, now: datetime) -> float:
+        """
+        Adds the share of the request rate not used by searches to the listing allowance for the time since it was
+        last updated, up to budget_carryover worth of requests, and returns the allowance.
+        """
+        listing_rate = (1 - self.search_budget_share) * self.get_request_rate()
+        max_allowance = listing_rate * self.budget_carryover.total_seconds()
+        if self.listing_allowance is None:
+            self.listing_allowance = max_allowance
+        else:
+            self.listing_allowance = min(self.listing_allowance + listing_rate * (now - self.last_allowance_time).total_seconds(), max_allowance)
+        self.last_allowance_time = now
+
+        return self.listing_allowance
+
+    def get_poll_interval(self, now: datetime, latest_deadline: Optional[datetime]) -> timedelta:
+        if self.new_listing_rate:
+            interval = timedelta(seconds=self.target_new_listings_per_poll / self.new_listing_rate)
+        else:
+            interval = self.max_poll_interval
+
+        # Search again before the listings beyond the current page could be due for their details
+        if latest_deadline is not None:
+            interval = min(interval, latest_deadline - self.detail_lead - now)
+
+        interval = min(max(interval, self.min_poll_interval), self.max_poll_interval)
+
+        # Leave enough time for the requests made by the latest search to fit in the search budget
+        search_rate = self.search_budget_share * self.get_request_rate()
+        if search_rate > 0:
+            interval = max(interval, timedelta(seconds=self.last_search_cost / search_rate))
+
+        return interval
+
+    def handle_search(self, now: datetime, payload=None) -> None:
+        full_sweep = self.last_full_sweep_time is None or now - self.last_full_sweep_time >= self.full_sweep_interval
+        remaining_requests = self.count_remaining_requests()
+        if full_sweep:
+            listings = search_transfer_listings(self.search_settings)
+            self.last_full_sweep_time = now
+        else:
+            listings = search_transfer_listings(self.search_settings, max_pages=self.poll_pages, shard_fields=[])
+        self.last_search_cost = max(remaining_requests - self.count_remaining_requests(), 1)
+
+        n_new_listings = 0
+        for n, listing in listings.iterrows():
+            key = (str(listing['PlayerID']), listing['Deadline'])
+            if key in self.listings:
+                self.listings[key]['row'] = listing
+                continue
+
+            n_new_listings += 1
+            self.listings[key] = {'row': listing, 'stored': False, 'skipped': False}
+            deadline = datetime.strptime(listing['Deadline'], TIMESTAMP_FORMAT)
+            self.schedule(max(now, deadline - self.detail_lead), 'detail', key)
+
+        # A full sweep finds listings beyond the polled pages, which are not newly listed
+        if self.last_search_time is not None and not full_sweep:
+            observed_rate = n_new_listings / max((now - self.last_search_time).total_seconds(), 1)
+            if self.new_listing_rate is None:
+                self.new_listing_rate = observed_rate
+            else:
+                self.new_listing_rate = self.rate_smoothing * observed_rate + (1 - self.rate_smoothing) * self.new_listing_rate
+        self.last_search_time = now
+
+        # Listings whose deadline has passed no longer appear in the search results
+        expired_cutoff = (now - timedelta(hours=1)).strftime(TIMESTAMP_FORMAT)
+        self.listings = {key: listing for key, listing in self.listings.items() if key[1] >= expired_cutoff}
+
+        latest_deadline = datetime.strptime(listings['Deadline'].max(), TIMESTAMP_FORMAT) if not listings.empty else None
+        poll_interval = self.get_poll_interval(now, latest_deadline)
+        self.schedule(now + poll_interval, 'search')
+
+        CoreUtils.log_event(f'{n_new_listings} new listings found, {len(self.listings)} listings tracked. {self.last_search_cost} requests were made, '
+                            f'the next search is in {int(poll_interval.total_seconds() // 60)} minutes.', ind_level=1)
+
+    def handle_detail(self, now: datetime, first_key) -> None:
+        keys = [first_key] + [event[3] for event in self.take_events('detail', now + self.detail_batch_window)]
+        keys = sorted((key for key in dict.fromkeys(keys) if key in self.listings and not (self.listings[key]['stored'] or self.listings[key]['skipped'])),
+                      key=lambda key: key[1])
+        if not keys:
+            return
+
+        n_affordable = int(self.update_listing_allowance(now) // REQUESTS_PER_LISTING)
+        if n_affordable < len(keys):
+            CoreUtils.log_event(f'The request budget only allows {n_affordable} of {len(keys)} listings to be archived. {len(keys) - n_affordable} listings are skipped.', ind_level=1)
+            for key in keys[n_affordable:]:
+                self.listings[key]['skipped'] = True
+            keys = keys[:n_affordable]
+            if not keys:
+                return
+
+        listings = pd.DataFrame([self.listings[key]['row'] for key in keys]).reset_index(drop=True)
+        try:
+            players = finalise_transfer_listings(listings, additional_columns=['all_visible'])
+            n_added_players, n_filtered_players = save_market_listings(self.store, players)
+        except Exception:
+            # run only re-schedules the event being handled, so the other listings taken into the batch are retried
+            # along with it
+            retry_time = now + timedelta(seconds=self.current_delay)
+            for taken_key in keys:
+                if taken_key != first_key:
+                    self.schedule(retry_time, 'detail', taken_key)
+            raise
+
+        for key in keys:
+            self.listings[key]['stored'] = True
+        self.listing_allowance -= REQUESTS_PER_LISTING * len(keys)
+
+        CoreUtils.log_event(f'{n_added_players} players have been added to the database.' + (
+            f' {n_filtered_players} recent duplicates were filtered out due to already existing in the database. ' if n_filtered_players > 0 else ''), ind_level=1)
+
+        latest_deadline = max(datetime.strptime(key[1], TIMESTAMP_FORMAT) for key in keys)
+        self.schedule(max(now, latest_deadline + self.resolution_delay + timedelta(minutes=1)), 'resolve')
+
+    def handle_resolve(self, now: datetime, payload=None) -> None:
+        self.take_events('resolve', now)
+        self.transaction_resolver.resolve(now)
+
+    def run(self, max_events: Optional[int] = None) -> None:
+        """
+        Runs the scheduler, sleeping until each event is due.
+
+        Parameters:
+        - max_events (Optional[int]): Stop after handling this many events, runs forever if not given.
+        """
+        if not self.events:
+            now = datetime.utcnow()
+            self.schedule(now, 'search')
+            self.schedule(now, 'resolve')  # Catch up on listings that expired while the monitor was not running
+
+        handlers = {'search': self.handle_search, 'detail': self.handle_detail, 'resolve': self.handle_resolve}
+        retries = 0
+        self.current_delay = self.retry_delay
+
+        for n_events in itertools.count():
+            if max_events is not None and n_events >= max_events:
+                break
+
+            when, _, kind, payload = heapq.heappop(self.events)
+            wait_time = (when - datetime.utcnow()).total_seconds()
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+            try:
+                handlers[kind](datetime.utcnow(), payload)
+                retries = 0
+                self.current_delay = self.retry_delay
+            except Exception as e:
+                retries += 1
+                CoreUtils.log_event(f'Error handling {kind} event: {e}. Retrying in {self.current_delay} seconds.')
+                if retries > self.max_retries:
+                    CoreUtils.log_event('Maximum retries reached. Exiting.')
+                    raise
+
+                self.schedule(datetime.utcnow() + timedelta(seconds=self.current_delay), kind, payload)
+                self.current_delay = min(self.current_delay * self.delay_factor, self.max_delay)
+
@@ -0,0 +1,116 @@
+import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class CacheMissError(Exception):
+    pass
+
+
+class PageCache:
+    """
+    On-disk cache of downloaded pages, used by FTPBrowser._ftpopen.
+
+    Page bodies are stored zlib-compressed and content-addressed by their SHA-256 hash, so identical pages fetched
+    from different URLs are only stored once. A separate table maps each URL to its latest body and fetch time.
+
+    Whether a URL is cached, and for how long, is decided by the first matching entry of the policy list:
+    - 'pattern' (str): Regular expression searched for in the URL.
+    - 'ttl' (Optional[datetime.timedelta]): How long a cached page stays fresh, None for pages that never change.
+    - 'require' (Optional[str]): Text that must be present in the page for it to be cached, e.g. the result of a
+      finished game, so that pages that are still changing are not stored.
+
+    Club pages are cached for their team's name, region and ground. They also show the current season and week, so
+    callers that read those download the page instead (FTPBrowser.open with use_cache=False).
+
+    In offline mode every stored page is served regardless of its age or policy, and a missing page raises
+    CacheMissError instead of being downloaded.
+    """
+    DEFAULT_POLICY = [
+        {'pattern': r'scorecard\.htm\?gameId=', 'ttl': None, 'require': 'Result:'},
+        {'pattern': r'ratings\.htm\?gameId=', 'ttl': None, 'require': 'class="data stats"'},
+        {'pattern': r'(nat)?club\.htm\?teamId=', 'ttl': datetime.timedelta(days=7), 'require': None},
+        {'pattern': r'leaguefixtures\.htm\?lsId=', 'ttl': datetime.timedelta(hours=1), 'require': None},
+        {'pattern': r'playertransfers\.htm\?playerId=', 'ttl': datetime.timedelta(hours=1), 'require': None},
+    ]
+
+    def __init__(self, db_path='data/page_cache.db', policy=None, offline=False, record_all=False):
+        self.db_path = db_path
+        self.policy = [dict(rule, regex=re.compile(rule['pattern'])) for rule in (policy if policy is not None else self.DEFAULT_POLICY)]
+        self.offline = offline
+        self.record_all = record_all
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS bodies (ContentHash TEXT PRIMARY KEY, Body BLOB)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (URL TEXT PRIMARY KEY, ContentHash TEXT, FetchedAt REAL)')
+        self.conn.commit()
+
+    @staticmethod
+    def normalise_url(url):
+        return re.sub(r'^https?://', '', url).split('#')[0]
+
+    def get_rule(self, url):
+        for rule in self.policy:
+            if rule['regex'].search(url):
+                return rule
+        return None
+
+    def get(self, url):
+        """
+        Returns the cached body of a URL as bytes, or None if it is not cached or has expired.
+        Raises CacheMissError in offline mode if the URL has never been stored.
+        """
+        rule = self.get_rule(url)
+        if rule is None and not self.offline:
+            return None
+
+        with self.lock:
+            row = self.conn.execute('SELECT b.Body, p.FetchedAt FROM pages p JOIN bodies b ON p.ContentHash = b.ContentHash WHERE p.URL = ?',
+                                    (self.normalise_url(url),)).fetchone()
+
+        if row is None:
+            if self.offline:
+                raise CacheMissError(f'Page not available offline: {url}')
+            return None
+
+        body, fetched_at = row
+        if not self.offline and rule['ttl'] is not None and time.time() - fetched_at > rule['ttl'].total_seconds():
+            return None
+
+        return zlib.decompress(body)
+
+    def put(self, url, content):
+        rule = self.get_rule(url)
+        if rule is None and not self.record_all:
+            return False
+        if rule is not None and rule['require'] and rule['require'].encode() not in content:
+            return False
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            self.conn.execute('INSERT OR IGNORE INTO bodies (ContentHash, Body) VALUES (?, ?)', (content_hash, zlib.compress(content)))
+            self.conn.execute('INSERT OR REPLACE INTO pages (URL, ContentHash, FetchedAt) VALUES (?, ?, ?)',
+                              (self.normalise_url(url), content_hash, time.time()))
+            self.conn.commit()
+
+        return True
+
+    def prune(self):
+        """
+        Removes stored bodies that are no longer referenced by any URL.
+        """
+        with self.lock:
+            removed = self.conn.execute('DELETE FROM bodies WHERE ContentHash NOT IN (SELECT ContentHash FROM pages)').rowcount
+            self.conn.commit()
+
+        return removed
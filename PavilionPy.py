@@ -4,18 +4,23 @@ browser = CoreUtils.initialize_browser()
 import sqlite3
 import os
 import json
-import jsonschema
 import re
-import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import pandas as pd
 from io import StringIO
-from jsonschema import validate
 from typing import Dict, Optional, List, Union
 import FTPUtils
+from Pipeline import Pipeline
+import ArchiveSchema
+from ArchiveStore import open_store
 from FTPConstants import *
 
+TRANSFER_RESULTS_PER_PAGE = 20
+TRANSFER_SEARCH_MAX_PAGES = 10  # Results pages shown by the site for one search, used when a results page has no pager
+TRANSFER_SEARCH_SHARD_FIELDS = ['country']
+
 
 def get_player(playerid, return_numeric=True):
     player_df = pd.DataFrame({'PlayerID': [str(playerid)]})
@@ -29,7 +34,8 @@ def get_player(playerid, return_numeric=True):
 
 
 def transfer_market_search(search_settings: Dict = {}, additional_columns: Optional[List[str]] = None,
-                           skill_level_format: str = 'numeric', column_ordering_keyword: str = 'col_ordering_transfer', players_to_download: int = 20) -> Optional[pd.DataFrame]:
+                           skill_level_format: str = 'numeric', column_ordering_keyword: str = 'col_ordering_transfer',
+                           players_to_download: Optional[int] = None, max_pages: Optional[int] = None) -> Optional[pd.DataFrame]:
     """
     Searches the transfer market for players based on given search settings, processes the data,
     and returns a pandas DataFrame.
@@ -39,95 +45,320 @@ def transfer_market_search(search_settings: Dict = {}, additional_columns: Optio
     - additional_columns (Optional[List[str]]): List of additional columns to add to the DataFrame, if any.
     - skill_level_format (str): Format for skill levels, 'numeric' by default.
     - column_ordering_keyword (str): Specification file for the ordering of columns in the returned DataFrame, 'col_ordering_transfer' by default.
-    - players_to_download (int): Players to return, or to download when adding additional columns, useful for testing. Defaults to 20, or one transfer market page.
+    - players_to_download (Optional[int]): Players to return, or to download when adding additional columns, useful for testing. Defaults to every listing found.
+      Only the results pages holding those players are downloaded, and the search is not split past the site's page limit.
+    - max_pages (Optional[int]): Maximum number of results pages to download per search, defaults to every page the site shows.
 
     Returns:
     - Optional[pd.DataFrame]: A DataFrame containing the transfer market data, or None if the search fails.
     """
     try:
-        CoreUtils.log_event(f"Searching for players on the transfer market..." + (
-            f" Additional search filters: {search_settings}" if search_settings else ""))
-
-        url = 'https://www.fromthepavilion.org/transfer.htm'
-        browser.open(url)
-        search_settings_form = browser.get_form()
-        for setting in search_settings.keys():
-            search_settings_form[setting] = str(search_settings[setting])
-        browser.submit_form(search_settings_form)
-        html_content = str(browser.parsed)
-
-        players_df = pd.read_html(StringIO(html_content))[0]
-        del players_df['Nat']
-        player_ids = [x[9:] for x in re.findall('playerId=[0-9]+', html_content)][::2]
-        region_ids = [x[9:] for x in re.findall('regionId=[0-9]+', html_content)][9:]
-        bidding_team_ids = [x[7:] for x in re.findall('teamId=[0-9]+', html_content[html_content.index('Transfer Search Results'):])]
+        if players_to_download is not None:
+            pages_needed = max(-(-players_to_download // TRANSFER_RESULTS_PER_PAGE), 1)
+            max_pages = pages_needed if max_pages is None else min(max_pages, pages_needed)
+            players_df = search_transfer_listings(search_settings, max_pages=max_pages, shard_fields=[])
 
-        players_df.insert(loc=3, column='Nationality', value=region_ids)
-        players_df.insert(loc=1, column='PlayerID', value=player_ids)
+            # Reduce players to reduce bandwith when testing
+            players_df = players_df[:players_to_download]
+        else:
+            players_df = search_transfer_listings(search_settings, max_pages=max_pages)
 
-        # Convert to ISO8601 for database
-        players_df['Deadline'] = [deadline[:-5] + ' ' + deadline[-5:] for deadline in players_df['Deadline']]
-        players_df['Deadline'] = pd.to_datetime(players_df['Deadline'], format='%d %b. %Y %H:%M').dt.strftime('%Y-%m-%dT%H:%M:%S')
+        return finalise_transfer_listings(players_df, additional_columns=additional_columns, skill_level_format=skill_level_format,
+                                          column_ordering_keyword=column_ordering_keyword)
 
-        cur_bids_full = [bid for bid in players_df['Current Bid']]
-        split_bids = [b.split(' ', 1) for b in cur_bids_full]
-        bids = [b[0] for b in split_bids]
+    except ZeroDivisionError: #Exception as e:
+        CoreUtils.log_event(f"Error in transfer_market_search: {e}")
+        return None
 
-        bid_ints = [int(''.join([x for x in b if x.isdigit()])) for b in bids]
-        players_df['CurrentBid'] = pd.Series(bid_ints)
-        team_names = pd.Series([b[1].replace(' ', '') for b in split_bids])
-        players_df.insert(loc=3, column='BiddingTeam', value=team_names)
 
-        bidding_team_ids_filled = []
-        k = 0
-        for bidding_team in players_df['BiddingTeam']:
-            if bidding_team == '(opening)':
-                bidding_team_ids_filled.append(-1)
-            else:
-                bidding_team_ids_filled.append(bidding_team_ids[k])
-                k += 1
+def open_transfer_search_form(search_settings: Dict = {}):
+    """
+    Opens the transfer market search form and fills in the given search settings. The search page is only opened
+    for the first search of the session, later searches reuse its form.
 
-        players_df.insert(loc=3, column='BiddingTeamID', value=bidding_team_ids_filled)
-        players_df = FTPUtils.add_timestamp_info(players_df, html_content)
+    Parameters:
+    - search_settings (Dict): A dictionary of search settings for the transfer market.
 
-        # Reduce players to reduce bandwith when testing
-        players_df = players_df[:players_to_download]
+    Returns:
+    - The search form, ready to be submitted with submit_transfer_search_page.
+    """
+    CoreUtils.log_event(f"Searching for players on the transfer market..." + (
+        f" Additional search filters: {search_settings}" if search_settings else ""))
 
-        # This will iterate through each players page. There is more information, but less efficient than just fetching
-        # is available from the transfer market page
-        if additional_columns:
-            players_df = add_player_columns(players_df, additional_columns)
+    search_settings_form = browser.get_page_form('https://www.fromthepavilion.org/transfer.htm')
+    for setting in search_settings.keys():
+        search_settings_form[setting] = str(search_settings[setting])
 
-        rename_dict = {
-            "Bat": "Batting",
-            "Bowl": "Bowling",
-            "Tech": "Technique",
-            "Pow": "Power",
-            "Keep": "Keeping",
-            "Field": "Fielding",
-            "End": "Endurance"
-        }
+    return search_settings_form
 
-        players_df.rename(columns=rename_dict, inplace=True)
 
-        if skill_level_format == 'numeric':
-            players_df = FTPUtils.convert_text_to_numeric_skills(players_df)
+def submit_transfer_search_page(search_settings_form, page: int = 0) -> str:
+    """
+    Submits the transfer market search form for one page of results and returns the results page.
+    """
+    search_settings_form['page'] = str(page)
+    return browser.submit_form(search_settings_form).text
+
+
+def count_transfer_listings(html_content: str) -> int:
+    """
+    Counts the listings on a transfer market results page without parsing its table. Each listing links to its
+    player twice.
+    """
+    return len(re.findall('playerId=[0-9]+', html_content)[::2])
 
-        players_df.drop(columns=[x for x in ['#', 'Unnamed: 18', 'Current Bid', 'BT', 'Age'] if x in players_df.columns], inplace=True)
-        ordered_df = apply_column_ordering(players_df, f'data/schema/{column_ordering_keyword}.txt')
 
-        return ordered_df
+def get_transfer_search_page_count(html_content: str) -> Optional[int]:
+    """
+    Returns the number of results pages the site shows for a transfer market search, read from the pager of one of
+    its results pages ("Page 1 of 4"), or None if the page has no pager.
+    """
+    pager_match = re.search(r'Page\s+\d+\s+of\s+(\d+)', html_content)
+    return int(pager_match.group(1)) if pager_match else None
+
+
+def iter_transfer_search_pages(search_settings_form, max_pages: Optional[int] = None):
+    """
+    Yields the results pages of a transfer market search in order, stopping after the last page shown by the pager
+    of the first page, or after the first page that is not full.
+
+    Pages are downloaded in a background thread, so the next page is already downloading while the caller parses
+    the current one. The browser is only used by the background thread while the generator is running.
+
+    Parameters:
+    - search_settings_form: The search form returned by open_transfer_search_form.
+    - max_pages (Optional[int]): Maximum number of pages to download, defaults to the number of pages the site shows
+      (TRANSFER_SEARCH_MAX_PAGES if the results have no pager).
+
+    Yields:
+    - Tuple[int, str]: The page number and the HTML content of the page.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(submit_transfer_search_page, search_settings_form, 0)
+        page, page_count = 0, None
+        while True:
+            html_content = next_page.result()
+            if page_count is None:
+                page_count = get_transfer_search_page_count(html_content) or TRANSFER_SEARCH_MAX_PAGES
+                if max_pages is not None:
+                    page_count = min(page_count, max_pages)
+
+            page_is_full = count_transfer_listings(html_content) >= TRANSFER_RESULTS_PER_PAGE
+            has_next_page = page_is_full and page + 1 < page_count
+            if has_next_page:
+                next_page = executor.submit(submit_transfer_search_page, search_settings_form, page + 1)
+
+            yield page, html_content
+
+            if not has_next_page:
+                break
+            page += 1
+
+
+def get_transfer_search_shards(search_settings_form, search_settings: Dict, shard_fields: List[str]) -> List[Dict]:
+    """
+    Splits a search into one search per option of the first field in shard_fields that is not already set.
+    Returns an empty list if every shard field is already set.
+    """
+    for field in shard_fields:
+        if field in search_settings:
+            continue
+
+        default_value = search_settings_form[field].value
+        return [dict(search_settings, **{field: value}) for value in search_settings_form[field].options if value != default_value]
+
+    return []
+
+
+def search_transfer_listings(search_settings: Dict = {}, max_pages: Optional[int] = None,
+                             shard_fields: List[str] = TRANSFER_SEARCH_SHARD_FIELDS) -> pd.DataFrame:
+    """
+    Downloads every results page of a transfer market search and parses the listings, without visiting player pages.
+
+    The site only shows a limited number of results pages, so a search whose last page is still full is repeated
+    once for each option of the next field in shard_fields (e.g. once per country), and the shards'
+    listings are combined. Listings are deduplicated by PlayerID and deadline, since a listing can move between
+    pages, or appear in more than one shard, while the search is running.
+
+    Parameters:
+    - search_settings (Dict): A dictionary of search settings for the transfer market.
+    - max_pages (Optional[int]): Maximum number of results pages to download per search, defaults to every page the
+      site shows.
+    - shard_fields (List[str]): Search fields to split a truncated search on, in order of preference. An empty list
+      downloads only the pages of the search itself.
+
+    Returns:
+    - pd.DataFrame: The listings, as returned by parse_transfer_search_results.
+    """
+    search_settings_form = open_transfer_search_form(search_settings)
+
+    listings = []
+    page_is_full, n_pages = False, 0
+    for page, html_content in iter_transfer_search_pages(search_settings_form, max_pages=max_pages):
+        n_page_listings = count_transfer_listings(html_content)
+        page_is_full, n_pages = n_page_listings >= TRANSFER_RESULTS_PER_PAGE, page + 1
+        if n_page_listings > 0:
+            listings.append(parse_transfer_search_results(html_content))
+
+    if page_is_full and shard_fields:
+        shards = get_transfer_search_shards(search_settings_form, search_settings, shard_fields)
+        if shards:
+            CoreUtils.log_event(f'Transfer search has more than {n_pages} pages of results, splitting it into {len(shards)} searches.', ind_level=1)
+            listings = [search_transfer_listings(shard_settings, max_pages=max_pages, shard_fields=shard_fields) for shard_settings in shards]
+        else:
+            CoreUtils.log_event(f'Transfer search has more than {n_pages} pages of results and cannot be split further. Only the first {n_pages} pages were downloaded.', ind_level=1)
+
+    if not listings:
+        return pd.DataFrame(columns=['PlayerID', 'Deadline'])
+
+    listings_df = pd.concat(listings, ignore_index=True)
+    return listings_df.drop_duplicates(subset=['PlayerID', 'Deadline'], keep='last').reset_index(drop=True)
+
+
+def parse_transfer_search_results(html_content: str) -> pd.DataFrame:
+    """
+    Parses a transfer market search results page into one row per listing, with the deadline, current bid and
+    bidding team of each listing and the time the page was downloaded.
+
+    Parameters:
+    - html_content (str): The HTML content of the search results.
+
+    Returns:
+    - pd.DataFrame: The listings, with the columns shown on the results page.
+    """
+    players_df = pd.read_html(StringIO(html_content))[0]
+    del players_df['Nat']
+    player_ids = [x[9:] for x in re.findall('playerId=[0-9]+', html_content)][::2]
+    region_ids = [x[9:] for x in re.findall('regionId=[0-9]+', html_content)][9:]
+    bidding_team_ids = [x[7:] for x in re.findall('teamId=[0-9]+', html_content[html_content.index('Transfer Search Results'):])]
+
+    players_df.insert(loc=3, column='Nationality', value=region_ids)
+    players_df.insert(loc=1, column='PlayerID', value=player_ids)
+
+    # Convert to ISO8601 for database
+    players_df['Deadline'] = [deadline[:-5] + ' ' + deadline[-5:] for deadline in players_df['Deadline']]
+    players_df['Deadline'] = pd.to_datetime(players_df['Deadline'], format='%d %b. %Y %H:%M').dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+    cur_bids_full = [bid for bid in players_df['Current Bid']]
+    split_bids = [b.split(' ', 1) for b in cur_bids_full]
+    bids = [b[0] for b in split_bids]
+
+    bid_ints = [int(''.join([x for x in b if x.isdigit()])) for b in bids]
+    players_df['CurrentBid'] = pd.Series(bid_ints)
+    team_names = pd.Series([b[1].replace(' ', '') for b in split_bids])
+    players_df.insert(loc=3, column='BiddingTeam', value=team_names)
+
+    bidding_team_ids_filled = []
+    k = 0
+    for bidding_team in players_df['BiddingTeam']:
+        if bidding_team == '(opening)':
+            bidding_team_ids_filled.append(-1)
+        else:
+            bidding_team_ids_filled.append(bidding_team_ids[k])
+            k += 1
+
+    players_df.insert(loc=3, column='BiddingTeamID', value=bidding_team_ids_filled)
+    players_df = FTPUtils.add_timestamp_info(players_df, html_content)
+
+    return players_df
+
+
+def finalise_transfer_listings(players_df: pd.DataFrame, additional_columns: Optional[List[str]] = None, skill_level_format: str = 'numeric',
+                               column_ordering_keyword: str = 'col_ordering_transfer') -> pd.DataFrame:
+    """
+    Adds player page columns to listings from parse_transfer_search_results and converts them to the archive format.
+
+    Parameters:
+    - players_df (pd.DataFrame): Listings returned by parse_transfer_search_results.
+    - additional_columns (Optional[List[str]]): List of additional columns to add to the DataFrame, if any.
+    - skill_level_format (str): Format for skill levels, 'numeric' by default.
+    - column_ordering_keyword (str): Specification file for the ordering of columns in the returned DataFrame, 'col_ordering_transfer' by default.
+
+    Returns:
+    - pd.DataFrame: The listings in archive format.
+    """
+    players_df = players_df.copy()
+
+    # Columns the search results already hold are taken from them, and the player pages are only downloaded for the rest
+    if additional_columns:
+        players_df = add_player_columns(players_df, additional_columns)
+
+    rename_dict = {
+        "Bat": "Batting",
+        "Bowl": "Bowling",
+        "Tech": "Technique",
+        "Pow": "Power",
+        "Keep": "Keeping",
+        "Field": "Fielding",
+        "End": "Endurance"
+    }
+
+    players_df.rename(columns=rename_dict, inplace=True)
+
+    if skill_level_format == 'numeric':
+        players_df = FTPUtils.convert_text_to_numeric_skills(players_df)
+
+    players_df.drop(columns=[x for x in ['#', 'Unnamed: 18', 'Current Bid', 'BT', 'Age'] if x in players_df.columns], inplace=True)
+    ordered_df = apply_column_ordering(players_df, f'data/schema/{column_ordering_keyword}.txt')
+
+    return ordered_df
+
+
+PLAYER_DETAIL_COLUMNS = ['Player', 'PlayerID', 'TeamName', 'TeamID', 'Nationality', 'AgeDisplay', 'AgeYear', 'AgeWeeks', 'WageReal',
+                         'Rating', 'BatHand', 'BowlType', 'Talent1', 'Talent2'] + ORDERED_SKILLS + \
+                        ['Experience', 'Captaincy', 'Form', 'Fatigue', 'Training', 'DataSeason', 'DataWeek', 'DataTimestamp']
 
-    except ZeroDivisionError: #Exception as e:
-        CoreUtils.log_event(f"Error in transfer_market_search: {e}")
-        return None
+
+def get_stored_columns(db_path, columns, table='players'):
+    """
+    Returns the subset of columns that exist in a table of an archive, keeping their order.
+    """
+    with open_store(db_path).connection() as conn:
+        stored_columns = ArchiveSchema.table_columns(conn, table)
+
+    return [column for column in columns if column in stored_columns]
+
+
+def load_players(player_ids, db_path, columns=PLAYER_DETAIL_COLUMNS, latest_only=True, chunk_size=500):
+    """
+    Loads the stored rows of many players from an archive with indexed, parameterised queries.
+
+    Parameters:
+    - player_ids (list): The IDs of the players to load.
+    - db_path (str): Path to the archive database.
+    - columns (list): Columns to load, columns missing from the archive are skipped.
+    - latest_only (bool): Only load each player's most recent row, defaults to True.
+    - chunk_size (int): Number of IDs bound per query, kept below SQLite's bound parameter limit.
+
+    Returns:
+    - pd.DataFrame: The players' rows, ordered by PlayerID and DataTimestamp.
+    """
+    store = open_store(db_path)
+    columns = get_stored_columns(db_path, list(dict.fromkeys(['PlayerID', 'DataTimestamp'] + list(columns))))
+    player_ids = list(dict.fromkeys(str(player_id) for player_id in player_ids))
+
+    chunks = []
+    for i in range(0, len(player_ids), chunk_size):
+        chunk_ids = player_ids[i:i + chunk_size]
+        query = f'SELECT {", ".join(f"p.{column}" for column in columns)} FROM players p WHERE p.PlayerID IN ({", ".join("?" * len(chunk_ids))})'
+        if latest_only:
+            query += ' AND p.DataTimestamp = (SELECT MAX(DataTimestamp) FROM players WHERE PlayerID = p.PlayerID)'
+        chunks.append(store.read_dataframe(query, params=chunk_ids))
+
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+
+    players = pd.concat(chunks, ignore_index=True).sort_values(by=['PlayerID', 'DataTimestamp'], kind='mergesort')
+    if latest_only:
+        players = players.drop_duplicates('PlayerID', keep='last')
+
+    return players.reset_index(drop=True)
 
 
 def load_player_from_database(player_id, db_path, return_numeric=True):
-    conn = sqlite3.connect(db_path)
-    query = f"SELECT * FROM players WHERE PlayerID = {player_id} ORDER BY DataTimestamp DESC"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    columns = get_stored_columns(db_path, PLAYER_DETAIL_COLUMNS)
+    query = f'SELECT {", ".join(columns)} FROM players WHERE PlayerID = ? ORDER BY DataTimestamp DESC LIMIT 1'
+    df = open_store(db_path).read_dataframe(query, params=[str(player_id)])
 
     player_skill_levels = df[ORDERED_SKILLS].iloc[0].values
 
@@ -156,82 +387,91 @@ def best_player_search(search_settings: Dict = {}, players_to_download: int = 30
     - Optional[pd.DataFrame]: A DataFrame containing the best players data, or None if the search fails.
     """
     try:
-        CoreUtils.log_event("Searching for best players with parameters {}".format(search_settings))
+        all_players = list(iter_best_players(search_settings, players_to_download=players_to_download, columns_to_add=columns_to_add,
+                                             skill_level_format=skill_level_format))
+        return pd.concat(all_players) if all_players else pd.DataFrame()
 
-        url = 'https://www.fromthepavilion.org/playerranks.htm?regionId=1'
-        browser.open(url)
-        search_settings_form = browser.get_form()
+    except Exception as e:
+        CoreUtils.log_event(f"Error in best_player_search: {e}")
+        return None
 
-        # Set default pages if not specified
-        if 'pages' not in search_settings:
-            search_settings['pages'] = 1
 
-        if search_settings['pages'] == 'all':
-            search_settings['pages'] = 10 # maximum pages just in case
+def iter_best_players(search_settings: Dict = {}, players_to_download: int = 30, columns_to_add: str = 'all_public', skill_level_format: str = 'text',
+                      ignore_players: list = []):
+    """
+    Searches for the best players based on given search settings, yielding each page of players as soon as its
+    player pages have been downloaded. Combined with save_player_batches, long searches are written to the database
+    page by page instead of being held in memory until the end.
 
-        # Populate search settings form
-        for search_setting, value in search_settings.items():
-            if search_setting in ['country', 'region', 'sortByWage', 'age', 'ageWeeks']:
-                search_settings_form[search_setting].value = str(value)
+    Parameters:
+    - search_settings (Dict): A dictionary of search settings for the best players search.
+    - players_to_download (int): Number of players to return from each page, useful for testing. Defaults to 30.
+    - columns_to_add (str): Specifies which columns to add to the DataFrame. Defaults to 'all_public'.
+    - skill_level_format (str): The format of skill levels ('text' or 'numeric'). Defaults to 'text'.
+    - ignore_players (list): List of PlayerID strings to skip, e.g. players already saved by an interrupted run.
 
-        browser.submit_form(search_settings_form)
-        all_players = []
+    Yields:
+    - pd.DataFrame: The players of one results page.
+    """
+    CoreUtils.log_event("Searching for best players with parameters {}".format(search_settings))
 
-        for page in range(int(search_settings['pages'])):
-            player_ids = []
-            region_ids = []
-            players_df = pd.DataFrame()
+    search_settings_form = browser.get_page_form('https://www.fromthepavilion.org/playerranks.htm?regionId=1')
 
-            search_settings_form['page'].value = str(page)
-            browser.submit_form(search_settings_form)
-            html_content = str(browser.parsed)
+    # Set default pages if not specified
+    pages = search_settings.get('pages', 1)
+    if pages == 'all':
+        pages = 10 # maximum pages just in case
 
-            pageplayers_df = pd.read_html(StringIO(html_content))[1]
+    # Populate search settings form
+    for search_setting, value in search_settings.items():
+        if search_setting in ['country', 'region', 'sortByWage', 'age', 'ageWeeks']:
+            search_settings_form[search_setting].value = str(value)
 
-            players_df = pd.concat([players_df, pageplayers_df])
+    ignore_players = set(map(str, ignore_players))
 
-            page_player_ids = [x[9:] for x in re.findall('playerId=[0-9]+', html_content)][::2]
-            page_region_ids = [x[9:] for x in re.findall('regionId=[0-9]+', html_content)][20:]
+    if columns_to_add == 'all_visible':
+        column_ordering_schema = 'data/schema/col_ordering_visibleplayers.txt'
+    else:
+        column_ordering_schema = 'data/schema/col_ordering_hiddenplayers.txt'
 
-            player_ids += page_player_ids
-            region_ids += page_region_ids
+    for page in range(int(pages)):
+        search_settings_form['page'].value = str(page)
+        html_content = browser.submit_form(search_settings_form).text
 
-            players_df.insert(loc=3, column='Nationality', value=region_ids)
-            players_df.insert(loc=1, column='PlayerID', value=player_ids)
-            players_df['Wage'] = players_df['Wage'].str.replace(r'\D+', '', regex=True)
+        players_df = pd.read_html(StringIO(html_content))[1]
 
-            players_df = players_df[:players_to_download]
-            players_df['Player'] = players_df['Players']
-            players_df['AgeDisplay'] = players_df['Age']
-            players_df['Wage'] = [int(''.join([c for c in w if c.isdigit()])) for w in players_df['Wage']]
-            players_df = players_df[['PlayerID', 'Player', 'Nationality', 'AgeDisplay', 'Rating', 'Wage']]
-            players_df = FTPUtils.add_timestamp_info(players_df, html_content)
+        player_ids = [x[9:] for x in re.findall('playerId=[0-9]+', html_content)][::2]
+        region_ids = [x[9:] for x in re.findall('regionId=[0-9]+', html_content)][20:]
 
-            players_df.drop(columns=[x for x in ['Age', '30'] if x in players_df.columns], inplace=True)
+        players_df.insert(loc=3, column='Nationality', value=region_ids)
+        players_df.insert(loc=1, column='PlayerID', value=player_ids)
+        players_df['Wage'] = players_df['Wage'].str.replace(r'\D+', '', regex=True)
 
-            if not isinstance(columns_to_add, type(None)):
-                players_df = add_player_columns(players_df, column_types=[columns_to_add])
-            all_players.append(players_df)
+        players_df = players_df[:players_to_download]
+        players_df['Player'] = players_df['Players']
+        players_df['AgeDisplay'] = players_df['Age']
+        players_df['Wage'] = [int(''.join([c for c in w if c.isdigit()])) for w in players_df['Wage']]
+        players_df = players_df[['PlayerID', 'Player', 'Nationality', 'AgeDisplay', 'Rating', 'Wage']]
+        players_df = FTPUtils.add_timestamp_info(players_df, html_content)
 
-            if len(players_df) < 30:
-                break
+        players_df.drop(columns=[x for x in ['Age', '30'] if x in players_df.columns], inplace=True)
+        last_page = len(players_df) < 30
 
-        all_players_df = pd.concat(all_players)
+        if ignore_players:
+            players_df = players_df[~players_df['PlayerID'].astype(str).isin(ignore_players)]
 
-        if columns_to_add == 'all_visible':
-            column_ordering_schema = 'data/schema/col_ordering_visibleplayers.txt'
-        else:
-            column_ordering_schema = 'data/schema/col_ordering_hiddenplayers.txt'
-        all_players_df = apply_column_ordering(all_players_df, column_ordering_schema)
+        if len(players_df) > 0:
+            if not isinstance(columns_to_add, type(None)):
+                players_df = add_player_columns(players_df, column_types=[columns_to_add])
+            players_df = apply_column_ordering(players_df, column_ordering_schema)
 
-        if skill_level_format == 'numeric':
-            all_players_df = FTPUtils.convert_text_to_numeric_skills(all_players_df)
+            if skill_level_format == 'numeric':
+                players_df = FTPUtils.convert_text_to_numeric_skills(players_df)
 
-        return all_players_df
+            yield players_df
 
-    except Exception as e:
-        CoreUtils.log_event(f"Error in best_player_search: {e}")
-        return None
+        if last_page:
+            break
 
 
 def apply_column_ordering(df: pd.DataFrame, column_ordering_schema_file: str) -> pd.DataFrame:
@@ -301,201 +541,71 @@ def add_player_columns(player_df: pd.DataFrame, column_types: List[str]) -> pd.D
     column_types = expand_columns(column_list)
     column_types = [c for c in column_types if c in column_groups['Ages']] + [c for c in column_types if c not in column_groups['Ages']]
 
-    all_player_data = []
-
-    for player_id in player_df['PlayerID']:
-        player_data = []
-        player_page = None
-
-        if any(col for col in column_types if col != 'Training'):
-            browser.open(f'https://www.fromthepavilion.org/player.htm?playerId={player_id}')
-            player_page = str(browser.parsed)
-
-        for column_name in column_types:
-            if 'Wage' in column_name:
-                WageReal, WagePaid, WageDiscount = FTPUtils.get_player_wage(player_id, page=player_page, return_type='tuple')
-                break
-
-        for column_name in column_types:
-            if 'Talent' in column_name:
-                talent1, talent2 = FTPUtils.get_player_talents(player_id, player_page)
-                break
-
-        for column_name in column_types:
-            if column_name == 'Training':
-                browser.open(f'https://www.fromthepavilion.org/playerpopup.htm?playerId={player_id}')
-                html_content = str(browser.parsed)
-                popup_page_info = pd.read_html(StringIO(html_content))
-                try:
-                    training_selection = popup_page_info[0][3][9]
-                except KeyError:
-                    training_selection = 'Hidden'
-                player_data.append(training_selection)
-
-            elif column_name in ['Age', 'AgeDisplay', 'AgeYear', 'AgeWeeks', 'AgeValue']:
-                # The same function generates many age forms
-                player_age = FTPUtils.get_player_age(player_id, player_page, column_name)
-                player_data.append(player_age)
-
-            elif column_name == 'Experience':
-                player_experience = FTPUtils.get_player_experience(player_id, player_page)
-                player_data.append(player_experience)
-
-            elif column_name == 'Form':
-                player_form = FTPUtils.get_player_form(player_id, player_page)
-                player_data.append(player_form)
-
-            elif column_name == 'Fatigue':
-                player_fatigue = FTPUtils.get_player_fatigue(player_id, player_page)
-                player_data.append(player_fatigue)
-
-            elif column_name == 'Player': #PlayerName
-                player_name = FTPUtils.get_player_name(player_id, player_page)
-                player_data.append(player_name)
-
-            elif column_name == 'TeamName':
-                player_teamname = FTPUtils.get_player_teamname(player_id, player_page)
-                player_data.append(player_teamname)
-
-            elif column_name == 'TeamID':
-                player_teamid = FTPUtils.get_player_teamid(player_id, player_page)
-                player_data.append(player_teamid)
-
-            elif column_name == 'Captaincy':
-                player_captaincy = FTPUtils.get_player_captaincy(player_id, player_page)
-                player_data.append(player_captaincy)
-
-            elif column_name == 'BatHand':
-                player_bathand = FTPUtils.get_player_batting_type(player_id, player_page)
-                player_data.append(player_bathand)
-
-            elif column_name == 'BowlType':
-                player_BT = FTPUtils.get_player_bowling_type(player_id, player_page)
-                player_data.append(player_BT)
-
-            elif column_name == 'SummaryBat':
-                player_skill_summary = FTPUtils.get_player_skills_summary(player_id, player_page)
-                player_data.append(player_skill_summary['Batsman'])
-
-            elif column_name == 'SummaryBowl':
-                player_skill_summary = FTPUtils.get_player_skills_summary(player_id, player_page)
-                player_data.append(player_skill_summary['Bowler'])
-
-            elif column_name == 'SummaryKeep':
-                player_skill_summary = FTPUtils.get_player_skills_summary(player_id, player_page)
-                player_data.append(player_skill_summary['Keeper'])
-
-            elif column_name == 'SummaryAllr':
-                player_skill_summary = FTPUtils.get_player_skills_summary(player_id, player_page)
-                player_data.append(player_skill_summary['Allrounder'])
-
-            elif column_name == 'Batting':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Batting', 'Not Available'))
-
-            elif column_name == 'Bowling':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Bowling', 'Not Available'))
-
-            elif column_name == 'Keeping':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Keeping', 'Not Available'))
-
-            elif column_name == 'Fielding':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Fielding', 'Not Available'))
-
-            elif column_name == 'Endurance':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Endurance', 'Not Available'))
-
-            elif column_name == 'Technique':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Technique', 'Not Available'))
-
-            elif column_name == 'Power':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Power', 'Not Available'))
-
-            elif column_name == 'Power':
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                player_data.append(player_skills.get('Power', 'Not Available'))
-
-            elif column_name == 'Nationality':
-                player_nationality_id = FTPUtils.get_player_nationality(player_id, player_page)
-                player_data.append(player_nationality_id)
-
-            elif column_name == 'Rating':
-                player_rating = FTPUtils.get_player_rating(player_id, player_page)
-                player_data.append(player_rating)
-
-            elif column_name == 'SpareRating':
-                player_rating = FTPUtils.get_player_rating(player_id, player_page)
-                player_skills = FTPUtils.get_player_skills(player_id, player_page)
-                spare_rating = player_rating - FTPUtils.calculate_rating_from_skills(list(player_skills.values()))
-                player_data.append(spare_rating)
-
-            elif column_name == 'Talent1':
-                player_data.append(talent1)
+    column_sources, pages_needed = plan_player_columns(player_df, column_types)
 
-            elif column_name == 'Talent2':
-                player_data.append(talent2)
+    # Values already in a results table column are renamed to their player page name rather than downloaded
+    table_columns = {source_column: column_name for column_name, (source, source_column) in column_sources.items() if source == 'table'}
+    player_df = player_df.drop(columns=[c for c in table_columns.values() if c in player_df.columns]).rename(columns=table_columns)
+    download_columns = [c for c in column_types if column_sources[c][0] in ('player_page', 'popup', 'team_cache')]
+    if not download_columns:
+        return player_df
 
+    all_player_data = []
+    player_ids = list(player_df['PlayerID'])
 
-            elif column_name == 'WageReal':
-                player_data.append(WageReal)
-
-            elif column_name == 'WagePaid':
-                player_data.append(WagePaid)
-
-            elif column_name == 'WageDiscount':
-                player_data.append(WageDiscount)
+    # The pooled sessions download the pages while earlier players' pages are being parsed
+    player_records = {}
+    if pages_needed & {'player_page', 'popup'}:
+        def fetch_player_pages(player_id):
+            return (browser.fetch(f'https://www.fromthepavilion.org/player.htm?playerId={player_id}') if 'player_page' in pages_needed else None,
+                    browser.fetch(f'https://www.fromthepavilion.org/playerpopup.htm?playerId={player_id}') if 'popup' in pages_needed else None)
 
-            elif column_name == 'NatSquad':
-                if 'This player is a member of the national squad' in player_page:
-                    player_data.append(True)
-                else:
-                    player_data.append(False)
+        def store_player_records(records):
+            for record in records:
+                player_records.update(record)
 
-            elif column_name == 'Touring':
-                if 'This player is on tour with the national team' in player_page:
-                    player_data.append(True)
-                else:
-                    player_data.append(False)
+        errors = Pipeline(fetch_player_pages, parse_player_pages, store_player_records, name='Player pages').run(player_ids)
+        if errors:
+            raise next(iter(errors.values()))
 
-            elif column_name == 'TeamID':
-                player_teamid = FTPUtils.get_player_teamid(player_id, player_page)
-                player_data.append(player_teamid)
+    team_regions = {}
+    for n, player_id in enumerate(player_ids):
+        player_data = []
+        player_record = player_records.get(player_id, {})
+
+        def known_value(column_name):
+            # The caller's value if it has one, otherwise the player page's
+            if column_name in player_df.columns and pd.notna(player_df[column_name].iloc[n]):
+                return player_df[column_name].iloc[n]
+            return player_record[column_name]
+
+        if 'team_cache' in pages_needed:
+            # Every player of a team has the same country of residence, so each team is looked up once
+            team_id = known_value('TeamID')
+            if team_id not in team_regions:
+                team_regions[team_id] = FTPUtils.get_team_info(team_id, 'TeamRegionID')
+            player_country_of_residence = team_regions[team_id]
+
+        for column_name in download_columns:
+            if column_name == 'Training':
+                player_data.append(player_record['Training'])
 
             elif column_name == 'CountryOfResidence':
-                player_teamid = FTPUtils.get_player_teamid(player_id, player_page)
-                player_country_of_residence = FTPUtils.get_team_info(player_teamid, 'TeamRegionID')
                 player_data.append(player_country_of_residence)
 
             elif column_name == 'TrainedThisWeek':
-                player_teamid = FTPUtils.get_player_teamid(player_id, player_page)
-                player_country_of_residence = FTPUtils.get_team_info(player_teamid, 'TeamRegionID')
-                if 'AgeYear' in player_df.columns:
-                    age_group = 'youth' if player_df[player_df['PlayerID'] == player_id].iloc[0]['AgeYear'] < 21 else 'senior'
-                else:
-                    age_group = 'youth' if player_data[column_types.index('AgeYear')] < 21 else 'senior'
+                age_group = 'youth' if known_value('AgeYear') < 21 else 'senior'
                 trained = FTPUtils.has_training_occurred(player_country_of_residence, age_group)
                 player_data.append(trained)
 
-            elif column_name == 'DataTimestamp':
-                timestamp, season, week = FTPUtils.get_timestamp_info_from_page(player_page)
-                player_data.append(timestamp)
-            elif column_name == 'DataSeason':
-                timestamp, season, week = FTPUtils.get_timestamp_info_from_page(player_page)
-                player_data.append(season)
-            elif column_name == 'DataWeek':
-                timestamp, season, week = FTPUtils.get_timestamp_info_from_page(player_page)
-                player_data.append(week)
+            elif column_name in player_record:
+                player_data.append(player_record[column_name])
+
             else:
                 player_data.append('UnknownColumn')
         all_player_data.append(player_data)
 
-    for n, column_name in enumerate(column_types):
+    for n, column_name in enumerate(download_columns):
         values = [v[n] for v in all_player_data]
         if column_name in player_df.columns:
             player_df[column_name] = values
@@ -505,6 +615,88 @@ def add_player_columns(player_df: pd.DataFrame, column_types: List[str]) -> pd.D
     return player_df
 
 
+def parse_player_pages(player_id, pages) -> Dict:
+    """
+    Parses the pages downloaded for a player by add_player_columns. Runs in a parsing process of its Pipeline.
+
+    Parameters:
+    - player_id: The player's ID.
+    - pages (tuple): The player's player.htm and playerpopup.htm pages, each None if it was not downloaded.
+
+    Returns:
+    - Dict: {player_id: the player's record from FTPUtils.parse_player_page, with Training if the popup was downloaded}.
+    """
+    player_page, popup_page = pages
+    player_record = FTPUtils.parse_player_page(player_page, player_id) if player_page is not None else {}
+    if popup_page is not None:
+        try:
+            player_record['Training'] = pd.read_html(StringIO(popup_page))[0][3][9]
+        except KeyError:
+            player_record['Training'] = 'Hidden'
+
+    return {player_id: player_record}
+
+
+# Results table columns (squad, transfer search and player rankings pages) holding the same values as a player page
+# column, by player page column name. Only the seven skills are taken from the tables. Experience, Captaincy and
+# Fatigue are still read from the player page, whatever the table's Exp, Capt and Fatg columns show
+TABLE_COLUMN_ALIASES = {
+    'Batting': ['Bat'],
+    'Bowling': ['Bowl'],
+    'Keeping': ['Keep'],
+    'Fielding': ['Field'],
+    'Endurance': ['End'],
+    'Technique': ['Tech'],
+    'Power': ['Pow'],
+}
+TEAM_CACHE_COLUMNS = ['CountryOfResidence', 'TrainedThisWeek']
+POPUP_COLUMNS = ['Training']
+
+
+def plan_player_columns(player_df: pd.DataFrame, columns: List[str]) -> tuple:
+    """
+    Chooses the cheapest source of each column requested from add_player_columns, so that only the pages that are
+    needed are downloaded. In order of preference, a column is read from:
+    - 'dataframe': The column is already in player_df, with a value for every player.
+    - 'table': A results table column with another name holds the same skill values (see TABLE_COLUMN_ALIASES).
+    - 'team_cache': The team database, from the player's TeamID (CountryOfResidence and TrainedThisWeek).
+    - 'popup': The player's playerpopup.htm page (Training).
+    - 'player_page': The player's player.htm page, for every other column.
+
+    Parameters:
+    - player_df (pd.DataFrame): The players the columns are added to.
+    - columns (List[str]): The requested columns, with the column groups already expanded.
+
+    Returns:
+    - tuple: A dict of column name to (source, source column name), and the set of sources that must be downloaded
+      ('player_page', 'popup' and 'team_cache'). Team cache lookups need the player page if player_df has no TeamID
+      (or no AgeYear, for TrainedThisWeek).
+    """
+    def available(column_name):
+        return column_name in player_df.columns and player_df[column_name].notna().all()
+
+    column_sources = {}
+    for column_name in columns:
+        table_column = next((alias for alias in TABLE_COLUMN_ALIASES.get(column_name, []) if available(alias)), None)
+        if available(column_name):
+            column_sources[column_name] = ('dataframe', column_name)
+        elif table_column is not None:
+            column_sources[column_name] = ('table', table_column)
+        elif column_name in TEAM_CACHE_COLUMNS:
+            column_sources[column_name] = ('team_cache', 'TeamID')
+        elif column_name in POPUP_COLUMNS:
+            column_sources[column_name] = ('popup', column_name)
+        else:
+            column_sources[column_name] = ('player_page', column_name)
+
+    pages_needed = {source for source, _ in column_sources.values() if source in ('player_page', 'popup', 'team_cache')}
+    if 'team_cache' in pages_needed:
+        if not available('TeamID') or (column_sources.get('TrainedThisWeek', ('',))[0] == 'team_cache' and not available('AgeYear')):
+            pages_needed.add('player_page')
+
+    return column_sources, pages_needed
+
+
 def get_team_players(teamid: int, age_group: str = 'all', squad_type: str = 'domestic_team', skill_level_format: str = 'numeric', column_ordering_keyword: str = 'col_ordering_transfer', columns_to_add='all_public', ignore_players: list = []) -> Optional[pd.DataFrame]:
     """
     Fetches and processes the team players based on the given team ID, age group, and squad type. Returns a pandas DataFrame.
@@ -521,6 +713,32 @@ def get_team_players(teamid: int, age_group: str = 'all', squad_type: str = 'dom
     Returns:
     - Optional[pd.DataFrame]: A DataFrame containing the team players data, or None if the fetching fails.
     """
+    team_players = list(iter_team_players(teamid, age_group=age_group, squad_type=squad_type, skill_level_format=skill_level_format,
+                                          column_ordering_keyword=column_ordering_keyword, columns_to_add=columns_to_add,
+                                          ignore_players=ignore_players, batch_size=None))
+
+    return pd.concat(team_players) if team_players else pd.DataFrame()
+
+
+def iter_team_players(teamid: int, age_group: str = 'all', squad_type: str = 'domestic_team', skill_level_format: str = 'numeric', column_ordering_keyword: str = 'col_ordering_transfer',
+                      columns_to_add='all_public', ignore_players: list = [], batch_size: Optional[int] = 10):
+    """
+    Fetches the team players based on the given team ID, age group, and squad type, yielding them in batches as
+    soon as each batch's player pages have been downloaded.
+
+    Parameters:
+    - teamid (int): The team ID to fetch the players from.
+    - age_group (str): The age group of the team ('all', 'seniors', or 'youths'). Defaults to 'all'.
+    - squad_type (str): The type of squad ('domestic_team' or 'national_team'). Auto-adjusted based on team ID range.
+    - skill_level_format (str): The format of skill levels ('numeric'). Defaults to 'numeric'.
+    - column_ordering_keyword (str): The keyword to determine column ordering. Defaults to 'col_ordering_transfer'.
+    - columns_to_add (str): Specifies which columns to add to the DataFrame. Defaults to 'all_public'.
+    - ignore_players (list): List of PlayerID strings to be skipped. Defaults to an empty list.
+    - batch_size (Optional[int]): Number of players in each batch, or None to yield the whole squad at once. Defaults to 10.
+
+    Yields:
+    - pd.DataFrame: A batch of the team's players.
+    """
 
     if int(teamid) in range(3001, 3019) or int(teamid) in range(3021, 3039) and squad_type == 'domestic_team':
         squad_type = 'national_team'
@@ -540,43 +758,154 @@ def get_team_players(teamid: int, age_group: str = 'all', squad_type: str = 'dom
     try:
         CoreUtils.log_event(f"Downloading players from team ID {teamid}")
         browser.open(squad_url)
-        html_content = str(browser.parsed)
+        html_content = browser.text
         team_players = pd.read_html(StringIO(html_content))[0]
 
         team_players['PlayerID'] = [x[9:] for x in re.findall('playerId=[0-9]+', html_content)][::2]
 
+        if squad_type == 'domestic_team':
+            team_players['Nationality'] = [x[-2:].replace('=', '') for x in re.findall('regionId=[0-9]+', html_content)][-len(team_players['PlayerID']):]
+
         if ignore_players:
-            CoreUtils.log_event(f'Ignoring players: {",".join(ignore_players)}')
+            CoreUtils.log_event(f'Ignoring players: {",".join(map(str, ignore_players))}')
             team_players = team_players[~team_players['PlayerID'].astype(str).isin(map(str, ignore_players))]
 
         if len(team_players) == 0:
             CoreUtils.log_event('No remaining players to download!')
-            return team_players
+            return
 
-        team_players['WageReal'] = team_players['Wage'].str.replace(r'\D+', '', regex=True)
         if squad_type == 'domestic_team':
-            team_players['Nationality'] = [x[-2:].replace('=', '') for x in re.findall('regionId=[0-9]+', html_content)][-len(team_players['PlayerID']):]
+            team_players['TeamID'] = str(teamid)
 
         team_players = FTPUtils.add_timestamp_info(team_players, html_content)
 
-        team_players.drop(columns=[x for x in ['Age', 'Nat', '#', 'BT', 'Exp', 'Fatg', 'Wage', 'Role', 'End', 'Bat', 'Bowl', 'Tech', 'Power', 'Keep', 'Field', 'Capt', 'Unnamed: 18'] if x in team_players.columns], inplace=True)
-
-        team_players = add_player_columns(team_players, column_types=[columns_to_add])
-        team_players = apply_column_ordering(team_players, f'data/schema/{column_ordering_keyword}.txt')
+        # The skill, experience, captaincy and fatigue columns are kept for add_player_columns to use in place of
+        # the player pages, and dropped once it has run
+        team_players.drop(columns=[x for x in ['Age', 'Nat', '#', 'BT', 'Role', 'Unnamed: 18'] if x in team_players.columns], inplace=True)
+        team_players.rename(columns={'Power': 'Pow'}, inplace=True)
+        team_players = team_players.reset_index(drop=True)
 
     except Exception as e:
         CoreUtils.log_event(f"Error fetching team players for team ID {teamid}: {e}")
         raise
 
-    if skill_level_format == 'numeric':
-        team_players = FTPUtils.convert_text_to_numeric_skills(team_players)
+    batch_size = batch_size or len(team_players)
+    for batch_start in range(0, len(team_players), batch_size):
+        batch_players = team_players[batch_start:batch_start + batch_size]
+
+        try:
+            batch_players = add_player_columns(batch_players, column_types=[columns_to_add])
+            if 'WageReal' not in batch_players.columns:
+                # The squad page shows the wage paid, which is used when the real wage was not downloaded
+                batch_players['WageReal'] = batch_players['Wage'].str.replace(r'\D+', '', regex=True)
+            batch_players = batch_players.drop(columns=[x for x in ['Exp', 'Fatg', 'Wage', 'End', 'Bat', 'Bowl', 'Tech', 'Pow', 'Keep', 'Field', 'Capt'] if x in batch_players.columns])
+            batch_players = apply_column_ordering(batch_players, f'data/schema/{column_ordering_keyword}.txt')
+        except Exception as e:
+            CoreUtils.log_event(f"Error fetching team players for team ID {teamid}: {e}")
+            raise
+
+        if skill_level_format == 'numeric':
+            batch_players = FTPUtils.convert_text_to_numeric_skills(batch_players)
+
+        yield batch_players
+
+
+def get_stored_player_ids(store, data_season: Optional[int] = None, data_week: Optional[int] = None, table: str = 'players') -> List[str]:
+    """
+    Returns the PlayerIDs already saved to an archive, optionally only those saved in a given game week. Passing
+    these as ignore_players lets an interrupted collection run resume where it stopped.
+
+    Parameters:
+    - store (ArchiveStore): The archive.
+    - data_season (Optional[int]): Only include players saved in this season.
+    - data_week (Optional[int]): Only include players saved in this week of the season.
+    - table (str): The table the players are saved in, defaults to 'players'.
+
+    Returns:
+    - List[str]: The stored PlayerIDs, or an empty list if the table does not exist yet.
+    """
+    with store.connection() as conn:
+        if not ArchiveSchema.table_columns(conn, table):
+            return []
+
+    conditions, params = [], []
+    if data_season is not None:
+        conditions.append('DataSeason = ?')
+        params.append(int(data_season))
+    if data_week is not None:
+        conditions.append('DataWeek = ?')
+        params.append(int(data_week))
 
-    return team_players
+    query = f'SELECT DISTINCT PlayerID FROM "{table}"' + (f' WHERE {" AND ".join(conditions)}' if conditions else '')
+    return [str(row[0]) for row in store.fetchall(query, params)]
 
 
-def watch_transfer_market(db_file, retry_delay=60, max_retries=10, delay_factor=2.0, max_delay=3600, max_players_per_download=20):
+def save_player_batches(store, batches, table: str = 'players') -> int:
     """
-    Continuously monitors and updates the database with player information from the transfer market.
+    Appends batches of players to an archive as they are produced, each batch in its own transaction, so a long
+    collection run keeps only one batch in memory and everything saved before a failure is kept.
+
+    Parameters:
+    - store (ArchiveStore): The archive to save to.
+    - batches (Iterable[pd.DataFrame]): Batches of players, e.g. from iter_best_players or iter_team_players.
+    - table (str): The table to append to, defaults to 'players'.
+
+    Returns:
+    - int: The total number of players saved.
+    """
+    n_saved_players = 0
+    for batch in batches:
+        if len(batch) == 0:
+            continue
+
+        n_saved_players += store.append_dataframe(batch, table)
+        CoreUtils.log_event(f'{len(batch)} players saved to the database ({n_saved_players} in total).', ind_level=1)
+
+    return n_saved_players
+
+
+def save_market_listings(store, players: pd.DataFrame, recent_days: int = 2) -> tuple:
+    """
+    Adds transfer market listings to a market archive, each with a new TransactionID, skipping players that were
+    already added in the last few days so repeated searches do not store the same listing several times.
+
+    Parameters:
+    - store (ArchiveStore): The market archive.
+    - players (pd.DataFrame): Listings in archive format, as returned by transfer_market_search.
+    - recent_days (int): Players added within this many days are skipped, defaults to 2.
+
+    Returns:
+    - tuple: The number of listings added and the number filtered out as recent duplicates.
+    """
+    with store.transaction() as conn:
+        # ENSURE PLAYERS ARE NOT ADDED MANY TIMES IN THE SAME WEEK BY SEQUENTIAL TRANSFER DOWNLOADS
+        # Retrieve existing players with their latest timestamp
+        recent_players_query = "SELECT PlayerID, MAX(DataTimestamp) FROM players GROUP BY PlayerID"
+        recent_players_df = pd.read_sql_query(recent_players_query, conn)
+        recent_players = {
+            row['PlayerID']: datetime.strptime(row['MAX(DataTimestamp)'], '%Y-%m-%dT%H:%M:%S')
+            for index, row in recent_players_df.iterrows()}
+
+        def check_recent_entry(player_id, recent_players):
+            if player_id in recent_players:
+                last_timestamp = recent_players[player_id]
+                if (datetime.utcnow() - last_timestamp).days < recent_days:
+                    return True
+            return False
+
+        players_to_add = players[~players['PlayerID'].apply(lambda x: check_recent_entry(str(x), recent_players))].copy()
+
+        players_to_add['TransactionID'] = [str(uuid.uuid4()) for _ in range(len(players_to_add))]
+        players_to_add.drop(columns=[x for x in ['SpareRating'] if x in players_to_add.columns], inplace=True)
+        ArchiveSchema.append_dataframe(players_to_add, 'players', conn)
+
+    return len(players_to_add), len(players) - len(players_to_add)
+
+
+def watch_transfer_market(db_file, retry_delay=60, max_retries=10, delay_factor=2.0, max_delay=3600, max_players_per_download=20, resolution_horizon=timedelta(days=1)):
+    """
+    Continuously monitors and updates the database with player information from the transfer market, with a
+    MarketScheduler.
 
     Parameters:
     - db_file (str): Path to the SQLite database file.
@@ -584,123 +913,19 @@ def watch_transfer_market(db_file, retry_delay=60, max_retries=10, delay_factor=
     - max_retries (int): Maximum number of retries after consecutive failures, defaults to 10.
     - delay_factor (float): Factor by which the delay increases after each failure, defaults to 2.0.
     - max_delay (int): Maximum delay in seconds, defaults to 3600.
-    - max_players_per_download (int): Maximum players to download and add to the database at once, defaults to 20 (one page on the transfer market).
+    - max_players_per_download (Optional[int]): Maximum listings each search downloads, defaults to 20 (one page on the transfer market).
+      None searches every results page, split by country, every time.
+    - resolution_horizon (timedelta): Time after a listing's deadline after which it is recorded as unsold if its transfer cannot be found, defaults to 1 day.
     """
+    from MarketScheduler import MarketScheduler
 
-    if not ('.' in db_file): # db_file is not a filename, and instead a archive name
-        database_file_dir = FTPUtils.get_database_from_name(db_file)
-        #database_config = load_config(f'{database_file_dir}.json')
-        db_file = f'{database_file_dir}.db'
-
-    retries = 0
-    current_delay = retry_delay
-
-    while True:
-        try:
-            players = transfer_market_search(additional_columns=['all_visible'], players_to_download=max_players_per_download)
-
-            if players is not None:
-                database_exists = os.path.exists(db_file)
-                with sqlite3.connect(db_file) as conn:
-                    # Check for 'transactions' table and create it if it doesn't exist
-                    conn.execute('CREATE TABLE IF NOT EXISTS transactions (TransactionID TEXT, Player TEXT, PlayerID INTEGER, FromTeamName TEXT, FromTeamID INTEGER, ToTeamName TEXT, ToTeamID INTEGER, FinalPrice REAL, CompletionTime TEXT)')
-                    conn.commit()
-
-                    if not database_exists:
-                        players.to_sql('players', conn, if_exists='append', index=False)
-                        n_added_players = len(players)
-                        n_filtered_players = 0
-                    else:
-                        # ENSURE PLAYERS ARE NOT ADDED MANY TIMES IN THE SAME WEEK BY SEQUENTIAL TRANSFER DOWNLOADS
-                        # Retrieve existing players with their latest timestamp
-                        recent_players_query = "SELECT PlayerID, MAX(DataTimestamp) FROM players GROUP BY PlayerID"
-                        recent_players_df = pd.read_sql_query(recent_players_query, conn)
-                        recent_players = {
-                            row['PlayerID']: datetime.strptime(row['MAX(DataTimestamp)'], '%Y-%m-%dT%H:%M:%S')
-                            for index, row in recent_players_df.iterrows()}
-
-                        def check_recent_entry(player_id, recent_players):
-                            if player_id in recent_players:
-                                last_timestamp = recent_players[player_id]
-                                if (datetime.utcnow() - last_timestamp).days < 2:
-                                    return True
-                            return False
-
-                        players_to_add = players[~players['PlayerID'].apply(lambda x: check_recent_entry(x, recent_players))]
-
-                        players_to_add['TransactionID'] = [str(uuid.uuid4()) for _ in range(len(players_to_add))]
-                        players_to_add.drop(columns=['SpareRating'], inplace=True)
-                        players_to_add.to_sql('players', conn, if_exists='append', index=False)
-
-                        n_added_players = len(players_to_add)
-                        n_filtered_players = len(players) - n_added_players
-
-                CoreUtils.log_event(f'{n_added_players} players have been added to the database.' + (
-                    f' {n_filtered_players} recent duplicates were filtered out due to already existing in the database. ' if n_filtered_players > 0 else ''), ind_level=1)
-
-                current_datetime = (datetime.utcnow() - timedelta(minutes=60)).strftime('%Y-%m-%dT%H:%M:%S')
-                query = f'''
-                SELECT p.* 
-                FROM players p
-                LEFT JOIN transactions t ON p.TransactionID = t.TransactionID
-                WHERE p.Deadline < '{current_datetime}'
-                  AND t.TransactionID IS NULL
-                ORDER BY p.Deadline
-                '''
-
-                with sqlite3.connect(db_file) as conn2:
-                    completed_transactions = pd.read_sql_query(query, conn2)
-
-                CoreUtils.log_event(f'Retrieving final transfer status for {len(completed_transactions)} transactions...')
-
-                all_transaction_data = []
-                for n, player in completed_transactions.iterrows():
-                    player_id = player['PlayerID']
-                    indicated_deadline = datetime.strptime(player['Deadline'], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
-                    transaction_data = FTPUtils.match_deadline_to_transaction(player_id, indicated_deadline)
-                    all_transaction_data.append(transaction_data)
-
-                transactions_df = pd.DataFrame({
-                    'TransactionID': completed_transactions['TransactionID'].values,
-                    'Player': completed_transactions['Player'].values,
-                    'PlayerID': completed_transactions['PlayerID'].values,
-                    'FromTeamName': completed_transactions['TeamName'].values,
-                    'FromTeamID': completed_transactions['TeamID'].values,
-                    'ToTeamName': [t['ToTeamName'] for t in all_transaction_data],
-                    'ToTeamID': [t['ToTeamID'] for t in all_transaction_data],
-                    'FinalPrice': [t['FinalPrice'] for t in all_transaction_data],
-                    'CompletionTime': [t['CompletionTime'] for t in all_transaction_data]
-                })
-
-                transactions_df.to_sql('transactions', conn, if_exists='append', index=False)
-                conn.commit()
-
-                # Continue looping
-                latest_deadline = max([datetime.strptime(player_deadline, '%Y-%m-%dT%H:%M:%S')
-                                       for player_deadline in list(players['Deadline'].values)]) - timedelta(minutes=2)
-                wait_time = (latest_deadline - datetime.utcnow()).total_seconds()
-                wait_time = max(wait_time, retry_delay)
-
-                CoreUtils.log_event(f'The next update is in {int(wait_time // 3600)} hours, {int((wait_time % 3600) // 60)} minutes, and {int(wait_time % 60)} seconds, at {latest_deadline.strftime("%Y-%m-%d %H:%M:%S")}.', ind_level=1)
-
-                time.sleep(wait_time)
-
-                retries = 0
-                current_delay = retry_delay  # Reset the delay after a successful operation
-            else:
-                CoreUtils.log_event('Failed to retrieve data from the transfer market.')
-                raise ValueError('Data retrieval failed')
-
-        except ZeroDivisionError as e:#Exception as e:
-            CoreUtils.log_event(f'Error occurred: {str(e)}. Retrying in {current_delay} seconds.')
-
-            retries += 1
-            if retries > max_retries:
-                CoreUtils.log_event('Maximum retries reached. Stopping the monitoring.')
-                break
+    if max_players_per_download is None:
+        scheduler_settings = {'full_sweep_interval': timedelta(0)}
+    else:
+        scheduler_settings = {'poll_pages': max(-(-max_players_per_download // TRANSFER_RESULTS_PER_PAGE), 1)}
 
-            time.sleep(current_delay)
-            current_delay = min(current_delay * delay_factor, max_delay)  # Increase delay and cap it at max_delay
+    MarketScheduler(db_file, resolution_horizon=resolution_horizon, retry_delay=retry_delay, max_retries=max_retries,
+                    delay_factor=delay_factor, max_delay=max_delay, **scheduler_settings).run()
 
 
 if __name__ == "__main__":
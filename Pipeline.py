@@ -0,0 +1,312 @@
+import CoreUtils
+browser = CoreUtils.initialize_browser()
+
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+# Parsing processes, leaving one CPU for the fetching and writing threads. With a single CPU pages are parsed in
+# the pipeline's own thread instead
+DEFAULT_PARSE_WORKERS = min(4, (os.cpu_count() or 1) - 1)
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_BATCH_SIZE = 50
+# Parsing processes are not forked from the pipeline's process, whose fetching and writing threads may hold a lock
+# (e.g. of the logging queue, the page cache or a requests session) at the moment of the fork, which the child would
+# then wait on forever. Scripts using a pipeline must keep their work under `if __name__ == '__main__':`, as the
+# parsing processes import the script's module
+PARSE_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_STOP = object()
+
+_process_pool = None
+_process_pool_workers = 0
+_process_pool_lock = threading.Lock()
+
+
+def _init_parse_process():
+    # Parsing processes never make requests, and must not save their copy of the rate limit state over the main
+    # process's when they exit
+    browser.rate_limiter.state_file = None
+
+
+def _timed_parse(parse, item, page):
+    start = time.perf_counter()
+    record = parse(item, page)
+    return record, time.perf_counter() - start
+
+
+def get_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool shared by every pipeline, started on first use and kept until the process exits, so
+    that a pipeline run over a small batch does not pay for starting the processes.
+    """
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        # A pool is broken for good once one of its processes dies (e.g. killed for using too much memory), so it is
+        # replaced rather than failing every later pipeline
+        pool_is_broken = _process_pool is not None and getattr(_process_pool, '_broken', False)
+        if _process_pool is None or pool_is_broken or _process_pool_workers < max_workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD),
+                                                initializer=_init_parse_process)
+            _process_pool_workers = max_workers
+        return _process_pool
+
+
+@atexit.register
+def _shutdown_process_pool():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+
+
+class StageStats:
+    """
+    Counters of one pipeline stage. busy_seconds is time spent working on items, idle_seconds time spent waiting
+    for the previous stage, and blocked_seconds time spent waiting for room in the next stage's queue, which is
+    where backpressure shows up.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, items=0, errors=0, busy_seconds=0.0, idle_seconds=0.0, blocked_seconds=0.0):
+        with self.lock:
+            self.items += items
+            self.errors += errors
+            self.busy_seconds += busy_seconds
+            self.idle_seconds += idle_seconds
+            self.blocked_seconds += blocked_seconds
+
+    def as_dict(self, elapsed_seconds):
+        return {'items': self.items, 'errors': self.errors, 'items_per_second': self.items / elapsed_seconds if elapsed_seconds else 0.0,
+                'busy_seconds': self.busy_seconds, 'idle_seconds': self.idle_seconds, 'blocked_seconds': self.blocked_seconds}
+
+
+class Pipeline:
+    """
+    Fetch, parse and store stages for bulk downloads, connected by bounded queues.
+
+    Fetcher threads download the pages of each item and put them on a queue, pages are parsed into records by a
+    process pool (or in the pipeline's own thread when there is a single CPU), and a single writer thread stores the
+    records in batches. Every queue is bounded, so a stage that falls behind makes the stages before it wait rather
+    than letting pages pile up in memory, and the fetchers never get further ahead of the writer than the queues
+    allow.
+
+    An item whose fetch or parse raises is left out and its exception is returned by run. If a parsing process dies,
+    the items it was parsing and every item after them fail with BrokenProcessPool, and the next pipeline starts a
+    new pool. An exception raised while storing stops the pipeline and is raised by run, as the records in the
+    failed batch were not stored. The items that failed to fetch or parse are then still available as errors.
+
+    Parameters:
+    - fetch (Callable): Downloads an item's pages, called as fetch(item) in a fetcher thread.
+    - parse (Callable): Parses the pages of an item into a record, called as parse(item, pages). When a process pool
+      is used it must be a module level function, and the item, pages and record must be picklable. Records that
+      are None are not stored.
+    - store (Callable): Stores a list of records, called from the writer thread only.
+    - fetch_workers (Optional[int]): Number of fetcher threads, defaults to the browser's pool_size.
+    - parse_workers (int): Number of parsing processes, 0 to parse in the pipeline's thread.
+    - queue_size (int): Maximum number of items waiting between two stages.
+    - batch_size (int): Maximum number of records stored at once. Records are also stored as soon as the writer has
+      nothing else waiting, so a slow download does not hold back records that are ready.
+    - name (str): Name used in the log.
+    """
+    def __init__(self, fetch: Callable, parse: Callable, store: Callable, fetch_workers: Optional[int] = None,
+                 parse_workers: int = DEFAULT_PARSE_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 name: str = 'pipeline'):
+        self.fetch = fetch
+        self.parse = parse
+        self.store = store
+        self.fetch_workers = fetch_workers or browser.pool_size
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.name = name
+        self.stats = {stage: StageStats(stage) for stage in ('fetch', 'parse', 'store')}
+        self.errors = {}
+        self.elapsed_seconds = 0.0
+
+    def _put(self, stage_queue, value, stage):
+        start = time.perf_counter()
+        stage_queue.put(value)
+        self.stats[stage].add(blocked_seconds=time.perf_counter() - start)
+
+    def _get(self, stage_queue, stage):
+        start = time.perf_counter()
+        value = stage_queue.get()
+        self.stats[stage].add(idle_seconds=time.perf_counter() - start)
+        return value
+
+    def run(self, items: Iterable) -> Dict:
+        """
+        Runs every item through the pipeline, returning once all of their records have been stored.
+
+        Parameters:
+        - items (Iterable): The items to download, e.g. player IDs. Items are taken from the iterable as the fetchers
+          become free, and must be hashable.
+
+        Returns:
+        - Dict: The exception raised for each item that failed to fetch or parse, by item.
+        """
+        self.stats = {stage: StageStats(stage) for stage in ('fetch', 'parse', 'store')}
+        items = iter(items)
+        items_lock = threading.Lock()
+        page_queue = queue.Queue(maxsize=self.queue_size)
+        parse_queue = queue.Queue(maxsize=max(self.parse_workers, 1) * 2)
+        record_queue = queue.Queue(maxsize=self.queue_size)
+        errors, errors_lock = {}, threading.Lock()
+        self.errors = errors
+        store_errors = []
+        fetchers_running = [self.fetch_workers]
+        pool = get_process_pool(self.parse_workers) if self.parse_workers > 0 else None
+        start_time = time.perf_counter()
+
+        def add_error(item, error, stage):
+            with errors_lock:
+                errors[item] = error
+            self.stats[stage].add(errors=1)
+
+        def fetcher():
+            try:
+                while not store_errors:
+                    with items_lock:
+                        item = next(items, _STOP)
+                    if item is _STOP:
+                        break
+
+                    start = time.perf_counter()
+                    try:
+                        pages = self.fetch(item)
+                    except Exception as e:
+                        add_error(item, e, 'fetch')
+                        continue
+                    self.stats['fetch'].add(items=1, busy_seconds=time.perf_counter() - start)
+                    self._put(page_queue, (item, pages), 'fetch')
+            finally:
+                with items_lock:
+                    fetchers_running[0] -= 1
+                    last_fetcher = fetchers_running[0] == 0
+                if last_fetcher:
+                    page_queue.put(_STOP)
+
+        def dispatcher():
+            # Parsing is started in the order pages arrive, and the bounded parse_queue limits how many are in progress.
+            # _STOP is always passed on, so the later stages finish even if this thread fails
+            pool_error = None
+            try:
+                while True:
+                    value = self._get(page_queue, 'parse')
+                    if value is _STOP:
+                        break
+
+                    item, pages = value
+                    future = Future()
+                    if pool_error is not None:
+                        # The pool stopped working (e.g. a parsing process died), so the remaining items fail
+                        future.set_exception(pool_error)
+                    elif pool is not None:
+                        try:
+                            future = pool.submit(_timed_parse, self.parse, item, pages)
+                        except Exception as e:
+                            pool_error = e
+                            future.set_exception(e)
+                    else:
+                        try:
+                            future.set_result(_timed_parse(self.parse, item, pages))
+                        except Exception as e:
+                            future.set_exception(e)
+                    self._put(parse_queue, (item, future), 'parse')
+            finally:
+                parse_queue.put(_STOP)
+
+        def collector():
+            try:
+                while True:
+                    value = parse_queue.get()
+                    if value is _STOP:
+                        break
+
+                    item, future = value
+                    try:
+                        record, parse_seconds = future.result()
+                    except Exception as e:
+                        add_error(item, e, 'parse')
+                        continue
+                    self.stats['parse'].add(items=1, busy_seconds=parse_seconds)
+                    if record is not None:
+                        self._put(record_queue, record, 'parse')
+            finally:
+                record_queue.put(_STOP)
+
+        def store_batch(batch):
+            start = time.perf_counter()
+            try:
+                self.store(batch)
+            except Exception as e:
+                store_errors.append(e)
+                self.stats['store'].add(errors=len(batch), busy_seconds=time.perf_counter() - start)
+                return
+            self.stats['store'].add(items=len(batch), busy_seconds=time.perf_counter() - start)
+
+        def writer():
+            batch = []
+            while True:
+                try:
+                    value = record_queue.get_nowait()
+                except queue.Empty:
+                    # Nothing else is ready, so the records waiting are stored rather than held for a full batch
+                    if batch and not store_errors:
+                        store_batch(batch)
+                    batch = []
+                    value = self._get(record_queue, 'store')
+
+                if value is _STOP:
+                    break
+                if store_errors:
+                    continue  # Records are drained without being stored, so the earlier stages can finish
+
+                batch.append(value)
+                if len(batch) >= self.batch_size:
+                    store_batch(batch)
+                    batch = []
+
+            if batch and not store_errors:
+                store_batch(batch)
+
+        threads = [threading.Thread(target=fetcher, name=f'{self.name}-fetch-{n}', daemon=True) for n in range(self.fetch_workers)]
+        threads += [threading.Thread(target=target, name=f'{self.name}-{target.__name__}', daemon=True) for target in (dispatcher, collector, writer)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.elapsed_seconds = time.perf_counter() - start_time
+        CoreUtils.log_event(f'{self.name}: {self.summary()}', ind_level=1)
+        if store_errors:
+            raise store_errors[0]
+
+        return errors
+
+    def get_stats(self) -> Dict:
+        """
+        Returns the counters of each stage of the last run, with its throughput in items per second.
+        """
+        return {stage: stats.as_dict(self.elapsed_seconds) for stage, stats in self.stats.items()}
+
+    def summary(self) -> str:
+        stage_summaries = []
+        for stage, stats in self.get_stats().items():
+            stage_summaries.append(f'{stage} {stats["items"]} ({stats["items_per_second"]:.1f}/s, busy {stats["busy_seconds"]:.1f}s, '
+                                   f'idle {stats["idle_seconds"]:.1f}s, blocked {stats["blocked_seconds"]:.1f}s'
+                                   + (f', {stats["errors"]} errors' if stats['errors'] else '') + ')')
+        return f'{self.elapsed_seconds:.1f}s, ' + ', '.join(stage_summaries)
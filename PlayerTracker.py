@@ -1,11 +1,17 @@
+import json
 import sqlite3
 import pandas as pd
 import numpy as np
+from ArchiveStore import open_store
 from FTPConstants import *
 from FTPUtils import calculate_player_birthweek, calculate_future_dates
-from TrainingTracker import SpareSkills, get_training, determine_training_talent, get_closest_academy
+from TrainingTracker import SpareSkills, get_training, determine_training_talent, get_closest_academy, get_training_many, get_training_table, ACADEMY_LEVELS
 from CoreUtils import log_event
 
+PLAYER_STATE_COLUMNS = ['PlayerID', 'Player', 'BatHand', 'BowlType', 'Talent1', 'Talent2', 'Training', 'Rating',
+                        'AgeYear', 'AgeWeeks', 'AgeDisplay', 'DataSeason', 'DataWeek', 'DataTimestamp'] + ORDERED_SKILLS
+
+
 class Player:
     def __init__(self, player_id):
         player = self.load_player_database_entries(player_id, limit_n=1).iloc[0]
@@ -22,9 +28,8 @@ class Player:
     def load_player_database_entries(player_id, limit_n=999):
         database_path = 'data/archives/team_archives/team_archives.db'
         #database_path = 'data/archives/uae_potentials/uae_potentials.db'
-        conn = sqlite3.connect(database_path)
-        df = pd.read_sql_query(f'SELECT * FROM players WHERE PlayerID = {player_id} LIMIT {limit_n}', conn)
-        conn.close()
+        query = f'SELECT {", ".join(PLAYER_STATE_COLUMNS)} FROM players WHERE PlayerID = ? ORDER BY DataTimestamp LIMIT ?'
+        df = open_store(database_path).read_dataframe(query, params=[str(player_id), limit_n])
 
         return df
 
@@ -86,7 +91,7 @@ class PlayerTracker(Player):
             for skill_name, points_gained in zip(ORDERED_SKILLS, estimated_training_increases):
                 self.spare_skills.update_skill(skill_name, points_gained, increased=False)
         else:
-            estimated_training_increases = np.zeros(7)
+            estimated_training_increases = np.zeros(7, dtype=np.int64)
 
         self.training_processing_results['observation_results'][self.recorded_weeks[0]] = {
                     'observation_exists': 'True',
@@ -136,6 +141,362 @@ class PlayerTracker(Player):
                 }
 
 
+class SquadTrainingEngine:
+    """
+    Runs the PlayerTracker spare sublevel inference for every player in an archive at once.
+
+    The whole players table is loaded in one query and arranged into (player x observation) arrays, then each
+    observation step is applied to all players together with array operations. The results match running
+    PlayerTracker for each player individually, except that observations with a training type or age missing
+    from the training database fail the training check instead of raising.
+    """
+    STATE_COLUMNS = PLAYER_STATE_COLUMNS
+
+    INFERENCE_TABLE = 'training_inference'
+    INFERENCE_JSON_COLUMNS = ['BirthWeek', 'FirstObservation', 'LastObservation', 'KnownSublevels', 'KnownSkills',
+                              'EstimatedSpare', 'EstimatedMaxTraining', 'SpareMin', 'SpareMax', 'ObservationResults']
+
+    def __init__(self, database_path='data/archives/team_archives/team_archives.db', academy='reasonable'):
+        self.database_path = database_path
+        self.academy = academy
+        self.inference_table_created = False
+
+    def get_store(self):
+        store = open_store(self.database_path)
+        if not self.inference_table_created:
+            with store.transaction() as conn:
+                self.create_inference_table(conn)
+            self.inference_table_created = True
+
+        return store
+
+    def load_player_states(self, player_ids=None):
+        columns = ', '.join(self.STATE_COLUMNS)
+        if player_ids is None:
+            df = self.get_store().read_dataframe(f'SELECT rowid AS RowOrder, {columns} FROM players')
+        else:
+            player_ids = [str(player_id) for player_id in player_ids]
+            placeholders = ', '.join('?' * len(player_ids))
+            df = self.get_store().read_dataframe(f'SELECT rowid AS RowOrder, {columns} FROM players WHERE PlayerID IN ({placeholders})', params=player_ids)
+
+        df['PlayerID'] = df['PlayerID'].astype(str)
+        return df
+
+    @staticmethod
+    def _training_lookup_inputs(training, age_years):
+        """
+        Replaces training types and ages missing from the training database with placeholders, and returns a mask
+        of which observations were valid.
+        """
+        training_table = get_training_table()
+        training_names = np.array([str(t).replace(' Technique', '-Tech').lower() for t in training.ravel()], dtype=object).reshape(training.shape)
+        known_training = np.isin(training_names, list(training_table['training_types'].keys()))
+        known_age = (age_years >= training_table['min_age']) & (age_years <= training_table['max_age'])
+
+        placeholder_training = next(iter(training_table['training_types']))
+        training_names = np.where(known_training, training_names, placeholder_training)
+        age_years = np.where(known_age, age_years, training_table['min_age'])
+
+        return training_names, age_years, known_training & known_age
+
+    def run(self, player_states=None, initial_states=None):
+        """
+        Infers spare skill sublevels for every player in player_states.
+
+        Parameters:
+        - player_states (Optional[pd.DataFrame]): Player observations with the STATE_COLUMNS columns, loaded from
+          the database if not given.
+        - initial_states (Optional[Dict]): Previously inferred state per PlayerID, as returned in the
+          'State' column of a previous run. For these players the first observation in player_states must be the
+          last observation already processed, and the inference continues from the stored bounds.
+
+        Returns:
+        - pd.DataFrame: One row per player, with permanent attributes, the final spare sublevel bounds, the
+          derived skill estimates and the per-week observation results.
+        """
+        if player_states is None:
+            player_states = self.load_player_states()
+        initial_states = initial_states or {}
+
+        if 'RowOrder' not in player_states.columns:
+            player_states = player_states.assign(RowOrder=np.arange(len(player_states)))
+        player_states = player_states.sort_values(by=['PlayerID', 'DataTimestamp', 'RowOrder'], kind='mergesort').reset_index(drop=True)
+
+        player_ids = player_states['PlayerID'].unique()
+        n_players = len(player_ids)
+        if n_players == 0:
+            return pd.DataFrame()
+
+        player_index = pd.Categorical(player_states['PlayerID'], categories=player_ids).codes
+        observation_index = player_states.groupby('PlayerID', sort=False).cumcount().to_numpy()
+        n_observations = np.bincount(player_index, minlength=n_players)
+        max_observations = n_observations.max()
+
+        def to_grid(values, fill, dtype):
+            grid = np.full((n_players, max_observations) + values.shape[1:], fill, dtype=dtype)
+            grid[player_index, observation_index] = values
+            return grid
+
+        skills = to_grid(player_states[ORDERED_SKILLS].to_numpy(dtype=np.int64), 0, np.int64)
+        ratings = to_grid(player_states['Rating'].to_numpy(dtype=np.int64), 0, np.int64)
+        age_years = to_grid(player_states['AgeYear'].to_numpy(dtype=np.int64), 0, np.int64)
+        training = to_grid(player_states['Training'].astype(str).to_numpy(dtype=object), 'None', object)
+        valid = to_grid(np.ones(len(player_states), dtype=bool), False, bool)
+        training_names, lookup_ages, known_training = self._training_lookup_inputs(training, age_years)
+
+        # Permanent attributes come from each player's earliest stored row, as in Player
+        first_rows = player_states.sort_values(by='RowOrder', kind='mergesort').drop_duplicates('PlayerID').set_index('PlayerID').loc[player_ids]
+        training_talents = np.array([initial_states[player_id]['TrainingTalent'] if player_id in initial_states else determine_training_talent([row.to_dict()])
+                                     for player_id, row in first_rows.iterrows()], dtype=object)
+
+        spare_min = np.zeros((n_players, 7), dtype=np.int64)
+        spare_max = np.full((n_players, 7), 999, dtype=np.int64)
+        continuing = np.array([player_id in initial_states for player_id in player_ids])
+        for i in np.flatnonzero(continuing):
+            spare_min[i] = initial_states[player_ids[i]]['SpareMin']
+            spare_max[i] = initial_states[player_ids[i]]['SpareMax']
+
+        estimated_increases = np.zeros((n_players, max_observations), dtype=np.int64)
+        true_increases = np.zeros((n_players, max_observations), dtype=np.int64)
+        estimated_academies = np.full((n_players, max_observations), '-', dtype=object)
+        passed_checks = np.zeros((n_players, max_observations), dtype=bool)
+
+        # Initial observation, estimated with the assumed academy unless the player has just been generated
+        first_age_weeks = player_states.groupby('PlayerID', sort=False)['AgeWeeks'].first().loc[player_ids].to_numpy()
+        initialise = ~continuing & ~((age_years[:, 0] == 16) & (first_age_weeks == 0))
+        initial_increases = get_training_many(training_names[:, 0], lookup_ages[:, 0], self.academy, training_talents, skills[:, 0] * 1000)
+        initial_increases = np.where((initialise & known_training[:, 0])[:, None], initial_increases, 0)
+        spare_min = np.minimum(spare_min + initial_increases, spare_max)
+        estimated_increases[:, 0] = initial_increases.sum(axis=1)
+
+        for week_n in range(1, max_observations):
+            players = np.flatnonzero(valid[:, week_n])
+            previous_skills, current_skills = skills[players, week_n - 1], skills[players, week_n]
+            true_rating_increase = ratings[players, week_n] - ratings[players, week_n - 1]
+            skill_popped = (current_skills - previous_skills) != 0
+
+            academy_increases = get_training_many(training_names[players, week_n][:, None], lookup_ages[players, week_n][:, None], np.array(ACADEMY_LEVELS)[None, :],
+                                                  training_talents[players][:, None], previous_skills[:, None, :])
+            academy_index = np.argmin(np.abs(true_rating_increase[:, None] - academy_increases.sum(axis=-1)), axis=1)
+            increases = academy_increases[np.arange(len(players)), academy_index]
+
+            estimated_rating_increase = increases.sum(axis=1)
+            epsilon = np.maximum(25, true_rating_increase * 0.15)
+            training_check_passed = (np.abs(true_rating_increase - estimated_rating_increase) < epsilon) & known_training[players, week_n]
+            increases = np.where(training_check_passed[:, None], increases, 0)
+
+            player_min, player_max = spare_min[players], spare_max[players]
+            unpopped_min = np.minimum(player_min + increases, player_max)
+            unpopped_max = np.where(player_max != 999, np.minimum(player_max + increases, 999), player_max)
+            spare_min[players] = np.where(skill_popped, 0, unpopped_min)
+            spare_max[players] = np.where(skill_popped, np.maximum(increases - 1, 0), unpopped_max)
+
+            estimated_increases[players, week_n] = estimated_rating_increase
+            true_increases[players, week_n] = true_rating_increase
+            estimated_academies[players, week_n] = np.array(ACADEMY_LEVELS, dtype=object)[academy_index]
+            passed_checks[players, week_n] = training_check_passed
+
+        observed_weeks = to_grid(player_states[['DataSeason', 'DataWeek']].to_numpy(dtype=np.int64), 0, np.int64)
+        week_numbers = observed_weeks[:, :, 0] * 15 + observed_weeks[:, :, 1]
+        missing_week_count = int(np.sum(np.maximum(np.diff(week_numbers, axis=1) - 1, 0) * valid[:, 1:]))
+        if missing_week_count:
+            log_event(f'WARNING: {missing_week_count} weekly measurements are missing across {n_players} players')
+
+        last_index = n_observations - 1
+        last_skills = skills[np.arange(n_players), last_index]
+        spare_rating = ratings[np.arange(n_players), last_index] - (last_skills * 1000).sum(axis=1)
+        total_known_sublevels = spare_min.sum(axis=1)
+        total_unknown_spare_rating = spare_rating - total_known_sublevels
+        solved_skills = spare_max != 999
+        n_unsolved_skills = 7 - solved_skills.sum(axis=1)
+        spare_per_unsolved_skill = np.divide(total_unknown_spare_rating, n_unsolved_skills, out=np.zeros(n_players), where=n_unsolved_skills > 0)
+
+        known_skills = last_skills * 1000 + spare_min
+        estimate_spare = np.where(solved_skills, 0, spare_per_unsolved_skill[:, None])
+        estimate_max_training = np.where(solved_skills, spare_max - spare_min, 0)
+
+        last_timestamps = player_states.groupby('PlayerID', sort=False)['DataTimestamp'].last().loc[player_ids].to_numpy()
+
+        results = []
+        for i, player_id in enumerate(player_ids):
+            first_row = first_rows.loc[player_id]
+            weeks = [tuple(week) for week in observed_weeks[i, :n_observations[i]].tolist()]
+
+            if continuing[i]:
+                observation_results = dict(initial_states[player_id]['ObservationResults'])
+                first_observation = initial_states[player_id]['FirstObservation']
+            else:
+                observation_results = {}
+                first_observation = weeks[0]
+            span = (weeks[-1][0] * 15 + weeks[-1][1]) - (first_observation[0] * 15 + first_observation[1]) + 1
+            for week in calculate_future_dates(first_observation[0], first_observation[1] - 1, span):
+                observation_results.setdefault(week, {
+                    'observation_exists': 'False',
+                    'indicated_training': '-',
+                    'estimated_rating_increase': '0',
+                    'true_rating_increase': '0',
+                    'estimated_academy': '-',
+                    'pass_check': 'False',
+                })
+
+            if not continuing[i]:
+                observation_results[weeks[0]] = {
+                    'observation_exists': 'True',
+                    'indicated_training': str(training[i, 0]),
+                    'estimated_rating_increase': int(estimated_increases[i, 0]),
+                    'true_rating_increase': '-',
+                    'estimated_academy': '-',
+                    'pass_check': '-'
+                }
+            for week_n in range(1, n_observations[i]):
+                observation_results[weeks[week_n]] = {
+                    'observation_exists': 'True',
+                    'indicated_training': str(training[i, week_n]),
+                    'estimated_rating_increase': str(estimated_increases[i, week_n]),
+                    'true_rating_increase': str(true_increases[i, week_n]),
+                    'estimated_academy': str(estimated_academies[i, week_n]),
+                    'pass_check': str(passed_checks[i, week_n]),
+                }
+
+            results.append({
+                'PlayerID': player_id,
+                'Player': first_row['Player'],
+                'BatHand': first_row['BatHand'],
+                'BowlType': first_row['BowlType'],
+                'Talent1': first_row['Talent1'],
+                'Talent2': first_row['Talent2'],
+                'TrainingTalent': training_talents[i],
+                'BirthWeek': calculate_player_birthweek(first_row),
+                'FirstObservation': first_observation,
+                'LastObservation': weeks[-1],
+                'LastTimestamp': last_timestamps[i],
+                'SpareRating': int(spare_rating[i]),
+                'KnownSublevels': spare_min[i].tolist(),
+                'TotalUnknownSpareRating': int(total_unknown_spare_rating[i]),
+                'KnownSkills': known_skills[i].tolist(),
+                'EstimatedSpare': estimate_spare[i].tolist(),
+                'EstimatedMaxTraining': estimate_max_training[i].tolist(),
+                'ObservationResults': observation_results,
+                'State': {'TrainingTalent': training_talents[i], 'SpareMin': spare_min[i].tolist(), 'SpareMax': spare_max[i].tolist(),
+                          'FirstObservation': first_observation, 'ObservationResults': observation_results},
+            })
+
+        return pd.DataFrame(results)
+
+    def create_inference_table(self, conn):
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.INFERENCE_TABLE} (
+            PlayerID TEXT PRIMARY KEY, Player TEXT, BatHand TEXT, BowlType TEXT, Talent1 TEXT, Talent2 TEXT,
+            TrainingTalent TEXT, BirthWeek TEXT, FirstObservation TEXT, LastObservation TEXT, LastTimestamp TEXT,
+            SpareRating INTEGER, TotalUnknownSpareRating INTEGER, KnownSublevels TEXT, KnownSkills TEXT,
+            EstimatedSpare TEXT, EstimatedMaxTraining TEXT, SpareMin TEXT, SpareMax TEXT, ObservationResults TEXT)''')
+
+    @staticmethod
+    def _encode_observation_results(observation_results):
+        return {f'{week[0]}_{week[1]}': result for week, result in sorted(observation_results.items())}
+
+    @staticmethod
+    def _decode_observation_results(observation_results):
+        return {tuple(int(x) for x in week.split('_')): result for week, result in observation_results.items()}
+
+    def _decode_inference_row(self, row):
+        record = dict(row)
+        for column in self.INFERENCE_JSON_COLUMNS:
+            record[column] = json.loads(record[column])
+        for column in ['BirthWeek', 'FirstObservation', 'LastObservation']:
+            record[column] = tuple(record[column])
+        record['ObservationResults'] = self._decode_observation_results(record['ObservationResults'])
+
+        return record
+
+    def update_inference_table(self, player_ids=None):
+        """
+        Brings the training_inference table up to date with the players table.
+
+        Players already in the table are continued from their stored state using only the observations recorded
+        after their last processed one, so each weekly update only replays the new week. Players not yet in the
+        table are processed from their first observation.
+
+        Parameters:
+        - player_ids (Optional[List]): Only update these players, all players in the archive if not given.
+
+        Returns:
+        - int: The number of players whose inference results were updated.
+        """
+        store = self.get_store()
+        columns = ', '.join(f'p.{column}' for column in self.STATE_COLUMNS)
+        query = (f'SELECT p.rowid AS RowOrder, {columns} FROM players p '
+                 f'LEFT JOIN {self.INFERENCE_TABLE} t ON p.PlayerID = t.PlayerID '
+                 f'WHERE (t.PlayerID IS NULL OR p.DataTimestamp >= t.LastTimestamp)')
+        params = []
+        if player_ids is not None:
+            params = [str(player_id) for player_id in player_ids]
+            query += f' AND p.PlayerID IN ({", ".join("?" * len(params))})'
+        player_states = store.read_dataframe(query, params=params)
+        player_states['PlayerID'] = player_states['PlayerID'].astype(str)
+
+        observed_players = set(player_states['PlayerID'])
+        with store.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            stored = {row['PlayerID']: self._decode_inference_row(row) for row in cursor.execute(f'SELECT * FROM {self.INFERENCE_TABLE}')
+                      if row['PlayerID'] in observed_players}
+
+        # Stored players only need updating if something was recorded after their last processed observation
+        new_observations = [player_id not in stored or timestamp > stored[player_id]['LastTimestamp']
+                            for player_id, timestamp in zip(player_states['PlayerID'], player_states['DataTimestamp'])]
+        players_to_update = set(player_states.loc[new_observations, 'PlayerID'])
+        player_states = player_states[player_states['PlayerID'].isin(players_to_update)]
+        if player_states.empty:
+            return 0
+
+        initial_states = {player_id: {'TrainingTalent': record['TrainingTalent'], 'SpareMin': record['SpareMin'], 'SpareMax': record['SpareMax'],
+                                      'FirstObservation': record['FirstObservation'], 'ObservationResults': record['ObservationResults']}
+                          for player_id, record in stored.items() if player_id in players_to_update}
+        results = self.run(player_states, initial_states=initial_states)
+
+        rows = []
+        for result in results.to_dict('records'):
+            state = result.pop('State')
+            result['SpareMin'], result['SpareMax'] = state['SpareMin'], state['SpareMax']
+            birth_week = stored[result['PlayerID']]['BirthWeek'] if result['PlayerID'] in initial_states else result['BirthWeek']
+            result['BirthWeek'] = [int(x) for x in birth_week]
+            result['ObservationResults'] = self._encode_observation_results(result['ObservationResults'])
+            for column in self.INFERENCE_JSON_COLUMNS:
+                result[column] = json.dumps(result[column])
+            rows.append(result)
+
+        columns = list(rows[0].keys())
+        with store.transaction() as conn:
+            conn.executemany(f'INSERT OR REPLACE INTO {self.INFERENCE_TABLE} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                             [[row[column] for column in columns] for row in rows])
+
+        log_event(f'Updated training inference for {len(rows)} players ({len(initial_states)} continued from stored state)')
+        return len(rows)
+
+    def load_inference(self, player_id):
+        """
+        Reads the stored inference results of one player, running the inference for them first if they are not in
+        the training_inference table yet.
+
+        Parameters:
+        - player_id (Union[int, str]): The player's ID.
+
+        Returns:
+        - Optional[Dict]: The stored results, or None if the player has no observations in the archive.
+        """
+        with self.get_store().connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            row = cursor.execute(f'SELECT * FROM {self.INFERENCE_TABLE} WHERE PlayerID = ?', (str(player_id),)).fetchone()
+
+        if row is None:
+            if self.update_inference_table([player_id]) == 0:
+                return None
+            return self.load_inference(player_id)
+
+        return self._decode_inference_row(row)
+
+
 if __name__ == '__main__':
     p = PlayerTracker('2291734')
 
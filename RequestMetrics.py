@@ -0,0 +1,199 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the histogram buckets, the last bucket holds everything slower
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# Stages of a request, each timed separately. connect excludes dns, and transfer is the rest of the download. Pages
+# are parsed lazily, if at all, so parse times are recorded when the parse happens rather than with the request
+STAGES = ('dns', 'connect', 'transfer', 'parse', 'rate_limit_sleep', 'total')
+REQUEST_STAGES = ('dns', 'connect', 'transfer', 'rate_limit_sleep', 'total')
+COUNTERS = ('requests', 'cache_hits', 'bytes', 'retries', 'relogins', 'errors')
+
+_PAGE_TYPE_RE = re.compile(r'^(?:https?://[^/]*)?/?([A-Za-z]+)\.htm')
+
+_current = threading.local()
+
+
+def page_type(url: str) -> str:
+    """
+    Returns the page type of a URL, the name of the page without .htm, e.g. 'player' for
+    https://www.fromthepavilion.org/player.htm?playerId=1. The front page is 'index'.
+    """
+    match = _PAGE_TYPE_RE.match(url or '')
+    return match.group(1) if match else 'index'
+
+
+def add_time(stage: str, seconds: float) -> None:
+    # Adds time to a stage of the request being timed by the calling thread, if any
+    timings = getattr(_current, 'timings', None)
+    if timings is not None:
+        timings[stage] += seconds
+
+
+class Histogram:
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list:
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class RequestMetrics:
+    """
+    Counters and latency histograms of the browser's requests, by page type.
+
+    Network requests are timed with time_request, which records how long the request spent resolving the host,
+    connecting, downloading and waiting for the rate limiter. Pages served from the page cache are counted as cache
+    hits, and the time spent parsing any page is recorded with record_parse. The metrics are read with snapshot, to_prometheus, or summary, which
+    covers the requests since the previous summary.
+
+    Parameters:
+    - summary_interval (float): Minimum seconds between the summaries returned by due_summary.
+    """
+    def __init__(self, summary_interval=300):
+        self.summary_interval = summary_interval
+        self.lock = threading.Lock()
+        self.counters = defaultdict(Counter)
+        self.histograms = defaultdict(Histogram)
+        self.last_summary_time = time.time()
+        self.summary_counters = defaultdict(Counter)
+        self.summary_seconds = Counter()
+
+    @contextmanager
+    def time_request(self, url):
+        """
+        Times a network request made inside the block. Yields the dict of stage timings, to which the request's
+        page size can be added as 'bytes'. A request that raises is counted as an error.
+        """
+        timings = Counter()
+        _current.timings = timings
+        start = time.perf_counter()
+        try:
+            yield timings
+        except Exception:
+            self.count(url, 'errors')
+            raise
+        finally:
+            _current.timings = None
+            timings['total'] = time.perf_counter() - start
+            self._record(page_type(url), timings)
+
+    @contextmanager
+    def time_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            add_time(stage, time.perf_counter() - start)
+
+    def _record(self, url_page_type, timings):
+        # The download was timed around the host lookup and connection, so they are taken out of it
+        timings['transfer'] = max(timings['transfer'] - timings['connect'] - timings['dns'], 0.0)
+        page_size = timings.pop('bytes', 0)
+
+        with self.lock:
+            for counters in (self.counters[url_page_type], self.summary_counters[url_page_type]):
+                counters['requests'] += 1
+                counters['bytes'] += page_size
+            for stage in REQUEST_STAGES:
+                self.histograms[(url_page_type, stage)].observe(timings[stage])
+                self.summary_seconds[stage] += timings[stage]
+
+    def record_cache_hit(self, url):
+        self.count(url, 'cache_hits')
+
+    def record_parse(self, url, seconds):
+        with self.lock:
+            self.histograms[(page_type(url), 'parse')].observe(seconds)
+            self.summary_seconds['parse'] += seconds
+
+    def count(self, url, counter, n=1):
+        with self.lock:
+            self.counters[page_type(url)][counter] += n
+            self.summary_counters[page_type(url)][counter] += n
+
+    def snapshot(self):
+        """
+        Returns the counters and histograms as a dict of {'counters': {page type: {counter: value}},
+        'histograms': {page type: {stage: {'count', 'sum', 'buckets'}}}}.
+        """
+        with self.lock:
+            histograms = defaultdict(dict)
+            for (url_page_type, stage), histogram in self.histograms.items():
+                histograms[url_page_type][stage] = {'count': histogram.count, 'sum': histogram.sum,
+                                                    'buckets': dict(zip(map(str, histogram.buckets), histogram.cumulative_counts()))}
+            return {'counters': {url_page_type: dict(counters) for url_page_type, counters in self.counters.items()},
+                    'histograms': dict(histograms)}
+
+    def to_prometheus(self, prefix='pavilionpy'):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for counter in COUNTERS:
+                name = f'{prefix}_request_{counter}_total'
+                lines.append(f'# TYPE {name} counter')
+                for url_page_type, counters in sorted(self.counters.items()):
+                    lines.append(f'{name}{{page_type="{url_page_type}"}} {counters[counter]}')
+
+            name = f'{prefix}_request_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for (url_page_type, stage), histogram in sorted(self.histograms.items()):
+                labels = f'page_type="{url_page_type}",stage="{stage}"'
+                for upper_bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append(f'{name}_bucket{{{labels},le="{"+Inf" if upper_bound == float("inf") else upper_bound}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        Returns a one line summary of the requests since the previous summary, and starts a new summary period.
+        """
+        with self.lock:
+            elapsed = time.time() - self.last_summary_time
+            totals = sum(self.summary_counters.values(), Counter())
+            by_type = ', '.join(f'{url_page_type} {counters["requests"]}' for url_page_type, counters in
+                                sorted(self.summary_counters.items(), key=lambda item: -item[1]['requests']) if counters['requests'])
+            n_requests = totals['requests']
+            mean = {stage: self.summary_seconds[stage] / n_requests if n_requests else 0.0 for stage in REQUEST_STAGES}
+            parse_seconds, rate_limit_sleep = self.summary_seconds['parse'], self.summary_seconds['rate_limit_sleep']
+
+            self.last_summary_time = time.time()
+            self.summary_counters = defaultdict(Counter)
+            self.summary_seconds = Counter()
+
+        return (f'{n_requests} requests in {elapsed:.0f}s' + (f' ({by_type})' if by_type else '') +
+                f', {totals["cache_hits"]} cached, {totals["bytes"] / 2 ** 20:.1f} MB, mean {mean["total"]:.2f}s'
+                f' (dns {mean["dns"]:.3f}, connect {mean["connect"]:.3f}, transfer {mean["transfer"]:.3f}),'
+                f' {parse_seconds:.1f}s parsing, rate limit sleep {rate_limit_sleep:.1f}s, {totals["retries"]} retries,'
+                f' {totals["relogins"]} re-logins, {totals["errors"]} errors')
+
+    def due_summary(self):
+        """
+        Returns the summary if summary_interval has passed since the previous one, otherwise None.
+        """
+        if self.summary_interval is None or time.time() - self.last_summary_time < self.summary_interval:
+            return None
+        return self.summary()
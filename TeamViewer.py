@@ -3,15 +3,15 @@ import FTPUtils
 
 browser = CoreUtils.initialize_browser(auto_login=False)
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, abort
 import pandas as pd
-import sqlite3
 import json
+from ArchiveStore import open_store
 from FTPConstants import *
-from PlayerTracker import PlayerTracker
+from PlayerTracker import SquadTrainingEngine
 from TrainingTracker import PlayerPredictor
 from TrainingTracker import PlayerTracker as StaticPlayerTracker
-from PavilionPy import get_player, load_player_from_database
+from PavilionPy import get_player, load_player_from_database, load_players
 from flask import redirect, url_for
 
 app = Flask(__name__)
@@ -24,6 +24,8 @@ SOURCE_MAP = {
 
 REVERSE_SOURCE_MAP = {v: k for k, v in SOURCE_MAP.items()}
 
+training_engine = SquadTrainingEngine(SOURCE_MAP['team'])
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -144,10 +146,8 @@ def reformat_data(training_processing_data):
 def get_players_in_database():
     database_path = 'data/archives/team_archives/team_archives.db'
     #database_path = 'data/archives/uae_potentials/uae_potentials.db'
-    conn = sqlite3.connect(database_path)
     query = 'SELECT Player, PlayerID, TeamName, AgeDisplay, AgeValue, DataTimestamp, DataSeason, DataWeek FROM players'
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    df = open_store(database_path).read_dataframe(query)
 
     df['DataTimestamp'] = pd.to_datetime(df['DataTimestamp'])
     df = df.loc[df.groupby('PlayerID')['AgeValue'].idxmax()]
@@ -161,33 +161,61 @@ def get_players_in_database():
     return jsonify({'players': sorted(players_list, key=lambda x:x['AgeValue'], reverse=True)})
 
 
-@app.route('/get_player_skills', methods=['POST'])
-def get_player_skills():
-    player_id = request.form['playerId']
-    player_tracker = PlayerTracker(player_id)
+@app.route('/get_players', methods=['POST'])
+def get_players():
+    data = request.get_json()
+    db_source = SOURCE_MAP.get(data.get('source', 'team'), SOURCE_MAP['team'])
+    if db_source == 'live':
+        return jsonify({'players': []})
+
+    players = load_players(data['player_ids'], db_source)
+    return jsonify({'players': players.astype(object).where(players.notnull(), None).to_dict('records')})
 
-    player_details = {k: str(v) for k, v in player_tracker.permanent_attributes.items()}
 
-    player_details['AgeDisplay'] = str(player_tracker.player_states.iloc[-1]['AgeDisplay'])
-    player_details['Rating'] = str(player_tracker.player_states.iloc[-1]['Rating'])
-    player_details['SpareRating'] = str(player_tracker.spare_rating)
-    player_details['UnknownSpareRating'] = str(player_tracker.total_unknown_spare_rating)
-    player_details['WageReal'] = str(player_tracker.player_states.iloc[-1]['WageReal'])
-    player_details['Experience'] = SKILL_LEVELS[int(player_tracker.player_states.iloc[-1]['Experience'])]
-    player_details['Captaincy'] = SKILL_LEVELS[int(player_tracker.player_states.iloc[-1]['Captaincy'])]
-    player_details['LatestData'] = str(player_tracker.recorded_weeks[-1])
+@app.route('/get_squad_training_estimates')
+def get_squad_training_estimates():
+    # The inference table is updated by save_teams after each download, so the viewer only reads it
+    squad_results = training_engine.get_store().read_dataframe(f'SELECT PlayerID, Player, TrainingTalent, SpareRating, TotalUnknownSpareRating, KnownSkills, '
+                                                               f'EstimatedSpare, EstimatedMaxTraining, LastObservation FROM {training_engine.INFERENCE_TABLE}')
 
-    known_skills = list([int(x) for x in player_tracker.known_skills])
-    estimate_spare = list([int(x) for x in player_tracker.estimate_spare])
-    estimated_max_training = list([int(x) for x in player_tracker.estimate_max_training])
+    for column in ['KnownSkills', 'EstimatedSpare', 'EstimatedMaxTraining']:
+        squad_results[column] = squad_results[column].apply(json.loads)
+    squad_results['LastObservation'] = ['{}_{}'.format(*json.loads(week)) for week in squad_results['LastObservation']]
 
-    training_processing_results = player_tracker.training_processing_results
-    observation_results_converted = {}
-    for key, value in training_processing_results['observation_results'].items():
-        str_key = f'{key[0]}_{key[1]}'
-        observation_results_converted[str_key] = value
+    return jsonify({'players': squad_results.to_dict('records')})
 
-    training_processing_results['observation_results'] = observation_results_converted
+
+@app.route('/get_player_skills', methods=['POST'])
+def get_player_skills():
+    player_id = request.form['playerId']
+    inference = load_player_inference(player_id)
+
+    latest_states = open_store(SOURCE_MAP['team']).read_dataframe('SELECT AgeDisplay, Rating, WageReal, Experience, Captaincy FROM players WHERE PlayerID = ? '
+                                                                  'ORDER BY DataTimestamp DESC LIMIT 1', params=[player_id])
+    if latest_states.empty:
+        abort(404, description=f'Player {player_id} is not in the team archive')
+    latest_state = latest_states.iloc[0]
+
+    player_details = {k: str(inference[k]) for k in ['Player', 'PlayerID', 'BatHand', 'BowlType', 'Talent1', 'Talent2', 'TrainingTalent', 'BirthWeek']}
+
+    player_details['AgeDisplay'] = str(latest_state['AgeDisplay'])
+    player_details['Rating'] = str(latest_state['Rating'])
+    player_details['SpareRating'] = str(inference['SpareRating'])
+    player_details['UnknownSpareRating'] = str(inference['TotalUnknownSpareRating'])
+    player_details['WageReal'] = str(latest_state['WageReal'])
+    player_details['Experience'] = SKILL_LEVELS[int(latest_state['Experience'])]
+    player_details['Captaincy'] = SKILL_LEVELS[int(latest_state['Captaincy'])]
+    player_details['LatestData'] = str(inference['LastObservation'])
+
+    known_skills = [int(x) for x in inference['KnownSkills']]
+    estimate_spare = [int(x) for x in inference['EstimatedSpare']]
+    estimated_max_training = [int(x) for x in inference['EstimatedMaxTraining']]
+
+    training_processing_results = {
+        'first_observation': inference['FirstObservation'],
+        'last_observation': inference['LastObservation'],
+        'observation_results': {f'{key[0]}_{key[1]}': value for key, value in inference['ObservationResults'].items()}
+    }
 
     return {
         'player_details': player_details,
@@ -197,12 +225,20 @@ def get_player_skills():
         'training_processing_results': reformat_data(training_processing_results)
     }
 
+def load_player_inference(player_id):
+    inference = training_engine.load_inference(player_id)
+    if inference is None:
+        abort(404, description=f'Player {player_id} is not in the team archive')
+
+    return inference
+
+
 def get_chart_data(player_id):
-    player_tracker = PlayerTracker(player_id)
-    player_details = {k: str(v) for k, v in player_tracker.permanent_attributes.items()}
-    known_skills = [int(x) for x in player_tracker.known_skills]
-    estimated_spare = [int(x) for x in player_tracker.estimate_spare]
-    estimated_max_training = [int(x) for x in player_tracker.estimate_max_training]
+    inference = load_player_inference(player_id)
+    player_details = {k: str(inference[k]) for k in ['Player', 'PlayerID', 'BatHand', 'BowlType', 'Talent1', 'Talent2', 'TrainingTalent', 'BirthWeek']}
+    known_skills = [int(x) for x in inference['KnownSkills']]
+    estimated_spare = [int(x) for x in inference['EstimatedSpare']]
+    estimated_max_training = [int(x) for x in inference['EstimatedMaxTraining']]
 
     return {
         'player_details': player_details,
@@ -213,16 +249,16 @@ def get_chart_data(player_id):
 
 
 def get_training_chart_data(player_id):
-    player_tracker = PlayerTracker(player_id)
+    inference = load_player_inference(player_id)
 
-    known_skills = [int(x) for x in player_tracker.known_skills]
-    estimated_spare = [int(x) for x in player_tracker.estimate_spare]
-    estimated_max_training = [int(x) for x in player_tracker.estimate_max_training]
+    known_skills = [int(x) for x in inference['KnownSkills']]
+    estimated_spare = [int(x) for x in inference['EstimatedSpare']]
+    estimated_max_training = [int(x) for x in inference['EstimatedMaxTraining']]
 
     observation_results = [
         [week[0], week[1], data['observation_exists'], data['indicated_training'], data['estimated_rating_increase'],
          data['true_rating_increase'], data['estimated_academy'], data['pass_check']]
-        for week, data in player_tracker.training_processing_results['observation_results'].items()
+        for week, data in inference['ObservationResults'].items()
     ]
 
     return {
@@ -239,6 +275,14 @@ def get_player_chart_data(playerid):
     return jsonify(chart_data)
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Request counters and latency histograms of this process's browser, by page type
+    if request.args.get('format') == 'json':
+        return jsonify(browser.metrics.snapshot())
+    return browser.metrics.to_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -1,51 +1,149 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import sqlite3
 import FTPUtils
 from FTPConstants import *
 
-trainingdb = pd.read_csv('data/training_db.csv')
-trainingdb['ID'] = trainingdb['ID'].str.lower()
+ACADEMY_LEVELS = ['minimal', 'meagre', 'inadequate', 'reasonable', 'satisfactory', 'good', 'excellent', 'superior', 'lavish', 'luxurious', 'deluxe']
+TRAINING_SKILLS = ['Bat', 'Bowl', 'Keep', 'Field', 'End', 'Tech', 'Power']
+
+
+def compile_training_table(trainingdb):
+    """
+    Compiles the training database into a dense array so that training lookups are array indexing rather than
+    DataFrame filtering.
+
+    Parameters:
+    - trainingdb (pd.DataFrame): The training database as read from data/training_db.csv.
+
+    Returns:
+    - dict: The lookup table, with keys:
+      'increases' (np.ndarray): Skill increases indexed by [academy, talent, training type, age - min age, skill],
+        with skills in TRAINING_SKILLS order and missing values as 0.
+      'available' (np.ndarray): Boolean array indexed by [academy, talent, training type], True where the
+        combination exists in the database.
+      'academies', 'talents', 'training_types' (dict): Lower case name to axis index.
+      'min_age', 'max_age' (int): The range of ages covered.
+    """
+    talent_names = trainingdb['Talent'].fillna('None')
+    academies = {name: i for i, name in enumerate(ACADEMY_LEVELS)}
+    talents = {name: i for i, name in enumerate(sorted(talent_names.str.lower().unique()))}
+    training_types = {name: i for i, name in enumerate(sorted(trainingdb['Training'].str.lower().unique()))}
+    ages = sorted({int(col[:2]) for col in trainingdb.columns if col[:2].isdigit()})
+    min_age, max_age = ages[0], ages[-1]
+
+    increases = np.zeros((len(academies), len(talents), len(training_types), max_age - min_age + 1, len(TRAINING_SKILLS)))
+    available = np.zeros((len(academies), len(talents), len(training_types)), dtype=bool)
+
+    skill_columns = [f'{age}{skill}' for age in range(min_age, max_age + 1) for skill in TRAINING_SKILLS]
+    row_values = trainingdb[skill_columns].fillna(0).to_numpy(dtype=float).reshape(len(trainingdb), max_age - min_age + 1, len(TRAINING_SKILLS))
+
+    for row_n, (academy, talent, training_type) in enumerate(zip(trainingdb['Academy'].str.lower(), talent_names.str.lower(), trainingdb['Training'].str.lower())):
+        index = (academies[academy], talents[talent], training_types[training_type])
+        increases[index] = row_values[row_n]
+        available[index] = True
+
+    return {'increases': increases, 'available': available, 'academies': academies, 'talents': talents,
+            'training_types': training_types, 'min_age': min_age, 'max_age': max_age}
+
+
+_training_table = None
+
+
+def load_training_db():
+    trainingdb = pd.read_csv('data/training_db.csv')
+    trainingdb['ID'] = trainingdb['ID'].str.lower()
+    return trainingdb
+
+
+def get_training_table():
+    """
+    Returns the compiled training table (see compile_training_table), reading the training database on first use
+    so that importing the module does not.
+    """
+    global _training_table
+    if _training_table is None:
+        _training_table = compile_training_table(load_training_db())
+    return _training_table
+
+
+def __getattr__(name):
+    # trainingdb and training_table used to be read at import time, and are still available as module attributes
+    if name == 'training_table':
+        return get_training_table()
+    if name == 'trainingdb':
+        return load_training_db()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def get_training_many(training_types, ages, academies=ACADEMY_LEVELS, training_talents='None', existing_skills=None):
+    """
+    Looks up the training increases for many combinations of training type, age, academy and talent at once.
+
+    Each of training_types, ages, academies and training_talents may be a single value or a sequence; sequences
+    are broadcast against each other, so for example a single training type with all academies returns one row
+    per academy, and per-player sequences return one row per player.
+
+    Parameters:
+    - training_types: Training type name(s), e.g. 'Batting' or 'Batting Technique'.
+    - ages: Player age(s) in years.
+    - academies: Academy level name(s), defaults to every academy level.
+    - training_talents: Training talent name(s), 'None' for players without a training talent.
+    - existing_skills: Current skill sublevels in ORDERED_SKILLS order, shape (7,) or (n, 7). Skills at 10000 or
+      above gain 85% of the normal increase.
+
+    Returns:
+    - np.ndarray: Integer skill increases with a trailing axis of 7 skills in ORDERED_SKILLS order.
+    """
+    def lookup(values, axis):
+        def index_of(value):
+            if str(value).lower() not in axis:
+                raise IndexError(f'No training data for {value}')
+            return axis[str(value).lower()]
+
+        return np.vectorize(index_of, otypes=[int])(np.asarray(values, dtype=object))
+
+    training_table = get_training_table()
+    training_type_names = np.vectorize(lambda t: t.replace(' Technique', '-Tech'), otypes=[object])(np.asarray(training_types, dtype=object))
+    academy_index = lookup(academies, training_table['academies'])
+    training_index = lookup(training_type_names, training_table['training_types'])
+    talent_index = np.vectorize(lambda t: training_table['talents'].get(str(t).lower(), -1), otypes=[int])(np.asarray(training_talents, dtype=object))
+
+    age_years = np.asarray(ages).astype(int)
+    if np.any((age_years < training_table['min_age']) | (age_years > training_table['max_age'])):
+        raise KeyError(f'No training data for age {ages}')
+
+    academy_index, talent_index, training_index, age_index = np.broadcast_arrays(academy_index, talent_index, training_index, age_years - training_table['min_age'])
+
+    # Talents without their own entry for a training type train like players with no talent
+    none_index = training_table['talents']['none']
+    talent_missing = (talent_index < 0) | ~training_table['available'][academy_index, np.maximum(talent_index, 0), training_index]
+    talent_index = np.where(talent_missing, none_index, talent_index)
+    if not np.all(training_table['available'][academy_index, talent_index, training_index]):
+        raise IndexError(f'No training data for {training_types}')
+
+    increases = training_table['increases'][academy_index, talent_index, training_index, age_index]
+
+    if existing_skills is not None:
+        increases = increases * np.where(np.asarray(existing_skills, dtype=float) < 10000, 1, 0.85)
+
+    return np.rint(increases).astype(np.int64)
 
 
 def get_training(training_type, age='16', academy='deluxe', training_talent='None', return_type='numeric', existing_skills=None):
-    try:
-        ID = f'{academy}{training_talent}{training_type.replace(" Technique", "-Tech")}'.lower()
-        relevant_row = trainingdb[trainingdb['ID'] == ID].iloc[0]
-        relevant_row.fillna(0, inplace=True)
-    except IndexError:
-        #print('Training with talent not found in db...')
-        ID = f'{academy}{"None"}{training_type.replace(" Technique", "-Tech")}'.lower()
-        relevant_row = trainingdb[trainingdb['ID'] == ID].iloc[0]
-        relevant_row.fillna(0, inplace=True)
-
-    if not isinstance(existing_skills, type(None)):
-        points_earned_multiplier = [1 if x < 10000 else 0.85 for x in existing_skills]
-    else:
-        points_earned_multiplier = [1] * 7
+    skill_increase = get_training_many(training_type, age, academy, training_talent, existing_skills).tolist()
 
     if return_type == 'dict':
-        skill_increase = {
-            skill: round(relevant_row[f'{age}{skill}'] * points_earned_multiplier[i]) for i, skill in enumerate(['Bat', 'Bowl', 'Keep', 'Field', 'End', 'Tech', 'Power'])
-        }
-
-    elif return_type == 'numeric':
-        skill_increase = [round(relevant_row[f'{age}{skill}'] * points_earned_multiplier[i]) for i, skill in enumerate(['Bat', 'Bowl', 'Keep', 'Field', 'End', 'Tech', 'Power'])]
+        skill_increase = {skill: skill_increase[i] for i, skill in enumerate(TRAINING_SKILLS)}
 
     return skill_increase
 
 
 def get_closest_academy(true_rating_increase, training_type, training_talent, age, existing_skills=[0] * 7):
-    academy_levels = ['minimal', 'meagre', 'inadequate', 'reasonable', 'satisfactory', 'good', 'excellent', 'superior', 'lavish', 'luxurious', 'deluxe']
-    possible_rating_increases = []
+    possible_rating_increases = np.abs(true_rating_increase - get_training_many(training_type, age, ACADEMY_LEVELS, training_talent, existing_skills).sum(axis=-1))
 
-    for academy_level in academy_levels:
-        increase = sum(get_training(training_type, training_talent=training_talent, age=age, academy=academy_level, existing_skills=existing_skills))
-        possible_rating_increases.append(abs(true_rating_increase-increase))
-
-    best_fit_index = sorted(enumerate(possible_rating_increases), key=lambda x: x[1])[0][0]
-    best_fit_name = academy_levels[best_fit_index]
+    best_fit_index = int(np.argmin(possible_rating_increases))
+    best_fit_name = ACADEMY_LEVELS[best_fit_index]
 
     return best_fit_index, best_fit_name
 
@@ -298,10 +396,9 @@ class PlayerPredictor:
         return end_estimated_sublevels
 
 
-import numpy as np
-import matplotlib.pyplot as plt
-
 def plot_player_predicted_training(player_states, start_season_week, start_age, training_descriptions):
+    import matplotlib.pyplot as plt
+
     base_width = 6.4  # Base width in inches
     base_length = 20  # Base length in data points
     data_points = len(player_states)  # Assuming all inner lists have the same length
@@ -0,0 +1,150 @@
+import CoreUtils
+browser = CoreUtils.initialize_browser()
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import pandas as pd
+import FTPUtils
+from ArchiveStore import ArchiveStore
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+class TransactionResolver:
+    """
+    Resolves the final transfer of expired transfer market listings.
+
+    Listings whose deadline has passed without a row in the transactions table are queued in a pending_transactions
+    table. Each call to resolve() takes the listings that are due, groups them by PlayerID, and downloads and parses
+    each player's transfer history once for all of that player's listings. Listings that cannot be matched yet are
+    retried with exponential backoff, and recorded as unsold once the horizon after their deadline has passed.
+    """
+
+    def __init__(self, store: ArchiveStore, resolution_delay: timedelta = timedelta(minutes=60),
+                 initial_backoff: timedelta = timedelta(minutes=30), backoff_factor: float = 2.0,
+                 max_backoff: timedelta = timedelta(hours=12), horizon: timedelta = timedelta(days=1)):
+        """
+        Parameters:
+        - store (ArchiveStore): The market archive, with players and transactions tables.
+        - resolution_delay (timedelta): How long after a deadline a listing is first checked, defaults to 60 minutes.
+        - initial_backoff (timedelta): Delay before the first retry of an unresolved listing, defaults to 30 minutes.
+        - backoff_factor (float): Factor by which the retry delay grows after each attempt, defaults to 2.0.
+        - max_backoff (timedelta): Maximum delay between retries, defaults to 12 hours.
+        - horizon (timedelta): Time after the deadline after which an unresolved listing is recorded as unsold,
+          defaults to 1 day.
+        """
+        self.store = store
+        self.resolution_delay = resolution_delay
+        self.initial_backoff = initial_backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.horizon = horizon
+
+        self.store.ensure_tables(['players', 'transactions'])
+        with self.store.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS pending_transactions (TransactionID TEXT PRIMARY KEY, PlayerID TEXT, '
+                         'Deadline TEXT, Attempts INTEGER, LastAttempt TEXT, NextAttempt TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_transactions_nextattempt ON pending_transactions (NextAttempt)')
+
+    def queue_expired_listings(self, now: Optional[datetime] = None) -> int:
+        """
+        Adds listings whose deadline passed at least resolution_delay ago, and which have no transaction yet, to the
+        pending_transactions table. Returns the number of listings added.
+        """
+        now = now or datetime.utcnow()
+        cutoff = (now - self.resolution_delay).strftime(TIMESTAMP_FORMAT)
+
+        with self.store.transaction() as conn:
+            return conn.execute('''
+                INSERT OR IGNORE INTO pending_transactions (TransactionID, PlayerID, Deadline, Attempts, LastAttempt, NextAttempt)
+                SELECT p.TransactionID, p.PlayerID, p.Deadline, 0, NULL, ?
+                FROM players p
+                LEFT JOIN transactions t ON p.TransactionID = t.TransactionID
+                WHERE p.Deadline < ?
+                  AND p.TransactionID IS NOT NULL
+                  AND t.TransactionID IS NULL
+            ''', (cutoff, cutoff)).rowcount
+
+    def get_due_listings(self, now: Optional[datetime] = None) -> pd.DataFrame:
+        now = now or datetime.utcnow()
+        return self.store.read_dataframe('''
+            SELECT q.TransactionID, q.PlayerID, q.Deadline, q.Attempts, p.Player, p.TeamName, p.TeamID
+            FROM pending_transactions q
+            JOIN players p ON p.TransactionID = q.TransactionID
+            WHERE q.NextAttempt <= ?
+            ORDER BY q.PlayerID, q.Deadline
+        ''', params=[now.strftime(TIMESTAMP_FORMAT)])
+
+    def get_backoff(self, attempts: int) -> timedelta:
+        return min(self.initial_backoff * (self.backoff_factor ** attempts), self.max_backoff)
+
+    def resolve(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Queues newly expired listings and attempts to resolve every pending listing that is due.
+
+        Parameters:
+        - now (Optional[datetime]): The current UTC time, defaults to datetime.utcnow().
+
+        Returns:
+        - Dict[str, int]: Counts of listings 'resolved', 'unsold' (horizon passed), 'retrying', and the number of
+          transfer history 'pages' downloaded.
+        """
+        now = now or datetime.utcnow()
+        self.queue_expired_listings(now)
+        due_listings = self.get_due_listings(now)
+
+        summary = {'resolved': 0, 'unsold': 0, 'retrying': 0, 'pages': 0}
+        if due_listings.empty:
+            return summary
+
+        player_ids = list(due_listings['PlayerID'].unique())
+        CoreUtils.log_event(f'Resolving {len(due_listings)} pending transactions from {len(player_ids)} transfer histories...')
+
+        transfer_history_urls = [f'https://www.fromthepavilion.org/playertransfers.htm?playerId={player_id}' for player_id in player_ids]
+        # Transfer histories are cached for an hour, longer than the first retry delay, so a retry would otherwise see
+        # the same page as the attempt before it
+        transfer_history_pages = browser.fetch_many(transfer_history_urls, use_cache=False)
+        summary['pages'] = len(transfer_history_pages)
+
+        transactions = []
+        retries = []
+        for player_id, transfer_page in zip(player_ids, transfer_history_pages):
+            transfer_history_table = FTPUtils.extract_transfer_history_table(transfer_page)
+
+            for n, listing in due_listings[due_listings['PlayerID'] == player_id].iterrows():
+                deadline = datetime.strptime(listing['Deadline'], TIMESTAMP_FORMAT)
+                transaction_data = FTPUtils.find_transaction(transfer_history_table, deadline.replace(tzinfo=timezone.utc))
+
+                if transaction_data is None and now - deadline > self.horizon:
+                    # Gives the same '(did not sell)' record as match_deadline_to_transaction
+                    transaction_data = FTPUtils.match_deadline_to_transaction(player_id, deadline.replace(tzinfo=timezone.utc), transfer_history_table=transfer_history_table)
+                    summary['unsold'] += 1
+                elif transaction_data is None:
+                    next_attempt = now + self.get_backoff(int(listing['Attempts']))
+                    retries.append((int(listing['Attempts']) + 1, now.strftime(TIMESTAMP_FORMAT), next_attempt.strftime(TIMESTAMP_FORMAT), listing['TransactionID']))
+                    summary['retrying'] += 1
+                    continue
+                else:
+                    summary['resolved'] += 1
+
+                transactions.append({
+                    'TransactionID': listing['TransactionID'],
+                    'Player': listing['Player'],
+                    'PlayerID': player_id,
+                    'FromTeamName': listing['TeamName'],
+                    'FromTeamID': listing['TeamID'],
+                    'ToTeamName': transaction_data['ToTeamName'],
+                    'ToTeamID': transaction_data['ToTeamID'],
+                    'FinalPrice': transaction_data['FinalPrice'],
+                    'CompletionTime': transaction_data['CompletionTime']
+                })
+
+        with self.store.transaction() as conn:
+            if transactions:
+                transactions_df = pd.DataFrame(transactions)
+                self.store.append_dataframe(transactions_df, 'transactions')
+                conn.executemany('DELETE FROM pending_transactions WHERE TransactionID = ?', [(t['TransactionID'],) for t in transactions])
+            conn.executemany('UPDATE pending_transactions SET Attempts = ?, LastAttempt = ?, NextAttempt = ? WHERE TransactionID = ?', retries)
+
+        CoreUtils.log_event(f'{summary["resolved"]} transactions resolved, {summary["unsold"]} recorded as unsold, {summary["retrying"]} will be retried.', ind_level=1)
+        return summary
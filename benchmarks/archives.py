@@ -0,0 +1,150 @@
+"""
+Synthetic team_archives.db and market_archive.db archives for the benchmarks.
+
+The team archive holds weekly observations of a squad whose hidden skill sublevels grow by the amounts in the
+training database, so PlayerTracker and SquadTrainingEngine do the same work as on a real archive. The market
+archive holds transfer listings and the transactions they resolved to.
+
+Both must be built with the repository's data directory (data/schema and data/training_db.csv) in the working
+directory, as the archive schema files and training database are read from there.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from ArchiveStore import open_store
+from FTPConstants import ORDERED_SKILLS
+
+TEAM_NAMES = ['Lords & Ladies', 'Kent Cavaliers', 'Mumbai Marauders', 'Otago Volts', 'Lahore Lions', 'Cape Cobras']
+TRAINING_TYPES = ['Batting', 'Bowling', 'Batting Technique', 'Bowling Technique', 'Keeping', 'Fielding', 'Fitness', 'All-Rounder']
+TALENTS = ['None', 'None', 'None', 'Prodigy', 'Gifted (Batting)', 'Gifted (Bowling)', 'Gifted (Fielding)']
+BOWL_TYPES = ['RM', 'RFM', 'RF', 'LM', 'LFM', 'ROB', 'RLB', 'LWS']
+START_TIME = datetime(2024, 1, 1)
+
+
+def player_attributes(rng: random.Random, player_id: int) -> dict:
+    return {
+        'Player': f'Player {player_id}',
+        'PlayerID': str(player_id),
+        'Nationality': str(rng.randint(1, 18)),
+        'BatHand': rng.choice(['L', 'R']),
+        'BowlType': rng.choice(BOWL_TYPES),
+        'Talent1': rng.choice(TALENTS),
+        'Talent2': 'None',
+        'Experience': rng.randint(0, 6),
+        'Captaincy': rng.randint(0, 6),
+    }
+
+
+def player_row(attributes: dict, sublevels: np.ndarray, age_years: int, age_weeks: int, season: int, week: int, timestamp: datetime) -> dict:
+    rating = int(sublevels.sum())
+    return dict(attributes, **{skill: int(sublevel // 1000) for skill, sublevel in zip(ORDERED_SKILLS, sublevels)}, **{
+        'Rating': rating,
+        'WageReal': rating // 4,
+        'AgeYear': age_years,
+        'AgeWeeks': age_weeks,
+        'AgeDisplay': float(f'{age_years}.{age_weeks:02d}'),
+        'AgeValue': age_years + age_weeks / 15,
+        'Form': 5,
+        'Fatigue': 'rested',
+        'DataSeason': season,
+        'DataWeek': week,
+        'DataTimestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+
+
+def build_team_archive(db_path: str, n_players: int = 40, n_weeks: int = 45, missing_week_rate: float = 0.05, seed: int = 0) -> int:
+    """
+    Builds a team archive of weekly squad observations.
+
+    Parameters:
+    - db_path (str): Path of the archive to create. An existing file is replaced.
+    - n_players (int): Number of players in the squad.
+    - n_weeks (int): Number of weeks observed.
+    - missing_week_rate (float): Fraction of weekly observations left out, as when a download is missed.
+    - seed (int): Random seed.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    from TrainingTracker import get_training_many
+
+    rng = random.Random(seed)
+    rows = []
+    for n in range(n_players):
+        player_id = 2000000 + n
+        attributes = dict(player_attributes(rng, player_id), TeamName='Synthetic XI', TeamID='4791')
+        sublevels = np.array([rng.randint(1000, 6000) for _ in ORDERED_SKILLS], dtype=np.int64)
+        age_years, age_weeks = rng.randint(16, 17), rng.randint(0, 14)
+
+        for week_n in range(n_weeks):
+            season, week = 60 + week_n // 15, week_n % 15
+            training = rng.choice(TRAINING_TYPES)
+            if week_n == 0 or rng.random() >= missing_week_rate:
+                rows.append(dict(player_row(attributes, sublevels, age_years, age_weeks, season, week, START_TIME + timedelta(weeks=week_n, minutes=n)),
+                                 Training=training))
+
+            sublevels = sublevels + get_training_many(training, age_years, 'reasonable', attributes['Talent1'], sublevels)
+            age_weeks += 1
+            if age_weeks > 14:
+                age_years, age_weeks = age_years + 1, 0
+
+    return write_archive(db_path, {'players': pd.DataFrame(rows)})
+
+
+def build_market_archive(db_path: str, n_listings: int = 5000, sold_rate: float = 0.7, seed: int = 0) -> int:
+    """
+    Builds a market archive of transfer listings and the transactions they resolved to.
+
+    Parameters:
+    - db_path (str): Path of the archive to create. An existing file is replaced.
+    - n_listings (int): Number of listings.
+    - sold_rate (float): Fraction of listings that were sold, the rest are recorded as unsold.
+    - seed (int): Random seed.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    rng = random.Random(seed)
+    listings, transactions = [], []
+    for n in range(n_listings):
+        # Some players are listed several times
+        player_id = 3000000 + rng.randint(0, int(n_listings * 0.8))
+        attributes = dict(player_attributes(random.Random(player_id), player_id), TeamName=rng.choice(TEAM_NAMES), TeamID=str(rng.randint(1, 9999)))
+        sublevels = np.array([rng.randint(500, 15000) for _ in ORDERED_SKILLS], dtype=np.int64)
+        listed_at = START_TIME + timedelta(minutes=17 * n)
+        deadline = listed_at + timedelta(days=3)
+        transaction_id = '%032x' % rng.getrandbits(128)
+        current_bid = rng.randint(1, 500) * 1000
+
+        listings.append(dict(player_row(attributes, sublevels, rng.randint(16, 32), rng.randint(0, 14), 60 + n // 2000, (n // 150) % 15, listed_at),
+                             Training=rng.choice(TRAINING_TYPES), Deadline=deadline.strftime('%Y-%m-%dT%H:%M:%S'), CurrentBid=current_bid,
+                             BiddingTeam='(opening)', BiddingTeamID='-1', NatSquad=False, Touring=False, TransactionID=transaction_id))
+
+        sold = rng.random() < sold_rate
+        transactions.append({
+            'TransactionID': transaction_id,
+            'Player': attributes['Player'],
+            'PlayerID': attributes['PlayerID'],
+            'FromTeamName': attributes['TeamName'],
+            'FromTeamID': int(attributes['TeamID']),
+            'ToTeamName': rng.choice(TEAM_NAMES) if sold else '(did not sell)',
+            'ToTeamID': rng.randint(1, 9999) if sold else -1,
+            'FinalPrice': float(current_bid + rng.randint(0, 100) * 1000) if sold else -1.0,
+            'CompletionTime': (deadline + timedelta(minutes=rng.randint(0, 30))).strftime('%Y-%m-%dT%H:%M:%S') if sold else '1970-01-01T00:00:00',
+        })
+
+    return write_archive(db_path, {'players': pd.DataFrame(listings), 'transactions': pd.DataFrame(transactions)})
+
+
+def write_archive(db_path: str, tables: dict) -> int:
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    store = open_store(db_path, tables=list(tables))
+    with store.transaction():
+        return sum(store.append_dataframe(df, table) for table, df in tables.items())
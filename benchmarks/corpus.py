@@ -0,0 +1,184 @@
+"""
+Offline corpus of saved pages for the benchmarks.
+
+Pages are stored as benchmarks/corpus/<page type>/<id>.htm, e.g. corpus/player/1000000.htm for
+https://www.fromthepavilion.org/player.htm?playerId=1000000. Pages missing from the corpus are generated by the
+synthetic generators in fixtures.py, so the benchmarks run without ever logging in. Real pages can be added to the
+corpus from the browser's page cache with --from-cache, and are then used in place of the synthetic ones.
+
+Usage, from the repository root:
+    python benchmarks/corpus.py [--from-cache data/page_cache.db] [--synthetic]
+"""
+import argparse
+import os
+import re
+import sys
+import zlib
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+from PageCache import PageCache
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# Page type: (URL with the page ID as {}, synthetic page generator taking the page ID)
+PAGE_TYPES = {
+    'player': ('www.fromthepavilion.org/player.htm?playerId={}', fixtures.player_page),
+    'playerpopup': ('www.fromthepavilion.org/playerpopup.htm?playerId={}', lambda page_id: fixtures.player_popup_page(seed=page_id)),
+    'playertransfers': ('www.fromthepavilion.org/playertransfers.htm?playerId={}', fixtures.player_transfers_page),
+    'club': ('www.fromthepavilion.org/club.htm?teamId={}', fixtures.club_page),
+    'scorecard': ('www.fromthepavilion.org/scorecard.htm?gameId={}', lambda page_id: fixtures.scorecard_page(seed=page_id)),
+    'ratings': ('www.fromthepavilion.org/ratings.htm?gameId={}', fixtures.ratings_page),
+    'seniors': ('www.fromthepavilion.org/seniors.htm?squadViewId=2&orderBy=&teamId={}&playerType=0', lambda page_id: fixtures.squad_page(seed=page_id)),
+    # Search results are form submissions rather than URLs, so they are stored by results page number
+    'transfer': ('www.fromthepavilion.org/transfer.htm?page={}', lambda page_id: fixtures.transfer_search_page(seed=page_id)),
+    'playerranks': ('www.fromthepavilion.org/playerranks.htm?page={}', lambda page_id: fixtures.player_ranks_page(seed=page_id)),
+}
+
+# IDs of the synthetic pages, per page type
+PLAYER_IDS = list(range(1000000, 1000040))
+TEAM_IDS = list(range(1, 11))  # Every synthetic player plays for one of these teams
+GAME_IDS = list(range(500000, 500020))
+SYNTHETIC_IDS = {
+    'player': PLAYER_IDS,
+    'playerpopup': PLAYER_IDS,
+    'playertransfers': PLAYER_IDS,
+    'club': TEAM_IDS,
+    'scorecard': GAME_IDS,
+    'ratings': GAME_IDS,
+    'seniors': list(range(1, 11)),
+    'transfer': list(range(10)),
+    'playerranks': list(range(10)),
+}
+
+
+def page_url(page_type: str, page_id) -> str:
+    return 'https://' + PAGE_TYPES[page_type][0].format(page_id)
+
+
+def page_path(page_type: str, page_id, corpus_dir: str = CORPUS_DIR) -> str:
+    return os.path.join(corpus_dir, page_type, f'{page_id}.htm')
+
+
+def get_page_ids(page_type: str, corpus_dir: str = CORPUS_DIR) -> list:
+    """
+    Returns the IDs of the saved pages of a page type, or the IDs of its synthetic pages if none are saved.
+    """
+    type_dir = os.path.join(corpus_dir, page_type)
+    saved_ids = sorted(name[:-4] for name in os.listdir(type_dir) if name.endswith('.htm')) if os.path.isdir(type_dir) else []
+    return saved_ids if saved_ids else [str(page_id) for page_id in SYNTHETIC_IDS[page_type]]
+
+
+def load_page(page_type: str, page_id, corpus_dir: str = CORPUS_DIR) -> str:
+    """
+    Returns a saved page from the corpus, or its synthetic version if it has not been saved.
+    """
+    path = page_path(page_type, page_id, corpus_dir)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    return PAGE_TYPES[page_type][1](int(page_id))
+
+
+def load_pages(page_type: str, corpus_dir: str = CORPUS_DIR) -> dict:
+    return {page_id: load_page(page_type, page_id, corpus_dir) for page_id in get_page_ids(page_type, corpus_dir)}
+
+
+def save_page(page_type: str, page_id, content: str, corpus_dir: str = CORPUS_DIR) -> str:
+    path = page_path(page_type, page_id, corpus_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+    return path
+
+
+def write_synthetic_corpus(corpus_dir: str = CORPUS_DIR) -> int:
+    """
+    Saves every synthetic page that is not already in the corpus. Returns the number of pages written.
+    """
+    n_written = 0
+    for page_type, page_ids in SYNTHETIC_IDS.items():
+        for page_id in page_ids:
+            if not os.path.exists(page_path(page_type, page_id, corpus_dir)):
+                save_page(page_type, page_id, PAGE_TYPES[page_type][1](page_id), corpus_dir)
+                n_written += 1
+
+    return n_written
+
+
+URL_PATTERNS = {page_type: re.compile(re.escape(url).replace(re.escape('{}'), r'(\d+)') + '$') for page_type, (url, _) in PAGE_TYPES.items()}
+
+
+def match_url(url: str) -> tuple:
+    """
+    Returns the (page type, page ID) of a corpus page URL, with or without its scheme, or (None, None) if the URL
+    is not one of the corpus page types.
+    """
+    url = re.sub(r'^https?://', '', url)
+    for page_type, pattern in URL_PATTERNS.items():
+        match = pattern.match(url)
+        if match:
+            return page_type, match.group(1)
+
+    return None, None
+
+
+def import_page_cache(cache_path: str, corpus_dir: str = CORPUS_DIR) -> int:
+    """
+    Copies the pages stored in a PageCache database (data/page_cache.db by default) into the corpus. Returns the
+    number of pages copied.
+    """
+    conn = sqlite3.connect(cache_path)
+    try:
+        rows = conn.execute('SELECT p.URL, b.Body FROM pages p JOIN bodies b ON p.ContentHash = b.ContentHash').fetchall()
+    finally:
+        conn.close()
+
+    n_copied = 0
+    for url, body in rows:
+        page_type, page_id = match_url(url)
+        if page_type:
+            save_page(page_type, page_id, zlib.decompress(body).decode('utf-8', errors='replace'), corpus_dir)
+            n_copied += 1
+
+    return n_copied
+
+
+def build_page_cache(cache_path: str, corpus_dir: str = CORPUS_DIR) -> int:
+    """
+    Stores every page of the corpus, saved or synthetic, in a PageCache database, so that an offline browser
+    serves them for their URLs. Returns the number of pages stored.
+    """
+    page_cache = PageCache(db_path=cache_path, record_all=True)
+    n_stored = 0
+    for page_type in PAGE_TYPES:
+        for page_id, content in load_pages(page_type, corpus_dir).items():
+            n_stored += page_cache.put(page_url(page_type, page_id), content.encode('utf-8'))
+    page_cache.conn.close()
+
+    return n_stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from-cache', help='Copy the pages of a PageCache database into the corpus')
+    parser.add_argument('--synthetic', action='store_true', help='Save the synthetic pages missing from the corpus')
+    parser.add_argument('--corpus-dir', default=CORPUS_DIR, help='Corpus directory, defaults to benchmarks/corpus')
+    args = parser.parse_args()
+
+    if args.from_cache:
+        print(f'{import_page_cache(args.from_cache, args.corpus_dir)} pages copied from {args.from_cache}')
+    if args.synthetic:
+        print(f'{write_synthetic_corpus(args.corpus_dir)} synthetic pages written to {args.corpus_dir}')
+
+    for page_type in PAGE_TYPES:
+        print(f'{page_type:<16}{len(get_page_ids(page_type, args.corpus_dir)):>6} pages')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Synthetic pages with the table layouts of the site's hot pages, used by the benchmarks when no saved pages are
+available. Each page surrounds its data table with the navigation tables, scripts and comments of a real page, and
+the cell contents use the entities, line breaks and thousands separators the parsers have to handle.
+"""
+import random
+
+SKILL_LEVELS = ['atrocious', 'dreadful', 'poor', 'ordinary', 'average', 'reasonable', 'capable', 'reliable', 'accomplished', 'expert',
+                'outstanding', 'spectacular', 'exceptional', 'world class', 'elite', 'legendary']
+FIRST_NAMES = ['James', 'Rahul', 'Ben', 'Mohammed', 'Kane', 'Joe', 'Faf', 'Shaun', 'Imran', 'Wasim']
+LAST_NAMES = ["O'Brien", 'Sharma', 'Stokes', 'Rizwan', 'Williamson', 'Root', 'du Plessis', 'Pollock', 'Khan', 'Akram']
+TEAM_NAMES = ['Lords &amp; Ladies', 'Kent Cavaliers', 'Mumbai Marauders', 'Otago Volts', 'Lahore Lions', 'Cape Cobras']
+
+
+def page(title: str, body: str) -> str:
+    return f'''<!DOCTYPE html>
+<html><head><title>{title} - From the Pavilion</title>
+<script type="text/javascript">var menu = "<table><tr><td>not a table</td></tr></table>";</script>
+<link rel="stylesheet" href="/css/ftp.css"></head>
+<body>
+<div id="header"><a href="club.htm?teamId=4791">My Club</a> | <a href="logout.htm">Logout</a>
+<div id="season-week-clock">Week 5, Season 62</div></div>
+<!-- <table><tr><td>Commented out table</td></tr></table> -->
+<div id="content">
+<h1>{title}</h1>
+{body}
+</div>
+<div id="footer">&copy; From the Pavilion</div>
+</body></html>'''
+
+
+def player_link(player_id: int, name: str) -> str:
+    return f'<a href="player.htm?playerId={player_id}" title="{name}">{name}</a> <a href="playerpopup.htm?playerId={player_id}" class="popup"><img src="/img/popup.gif"/></a>'
+
+
+def random_player(rng: random.Random) -> tuple:
+    player_id = rng.randint(1000000, 2999999)
+    return player_id, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'.replace("'", '&#39;')
+
+
+def search_form(action: str, fields: list = ('country', 'age', 'ageWeeks', 'sortByWage')) -> str:
+    """
+    Returns a search form like those of the transfer market and player rankings pages, with a select for each of
+    the given fields and a hidden results page field. The form holds no tables or links, so adding it to a page
+    does not move the tables or links the parsers count.
+    """
+    options = {
+        'country': ['0'] + [str(region_id) for region_id in range(1, 19)],
+        'region': ['0'] + [str(region_id) for region_id in range(1, 19)],
+        'age': ['0'] + [str(age) for age in range(16, 41)],
+        'ageWeeks': ['0'] + [str(week) for week in range(1, 15)],
+        'sortByWage': ['0', '1'],
+    }
+    selects = ''.join(f'<select name="{field}">' + ''.join(f'<option value="{value}">{value}</option>' for value in options[field]) + '</select>' for field in fields)
+    return f'<form action="{action}" method="post">{selects}<input type="hidden" name="page" value="0"/><input type="submit" value="Search"/></form>'
+
+
+def login_page(logged_out: bool = True) -> str:
+    """
+    Returns the site's front page, with the login form and the text check_login looks for when logged out.
+    """
+    if not logged_out:
+        return page('Home', '<p>Welcome back.</p>')
+
+    return page('Home', '''<p>From the Pavilion is <strong>completely free</strong> to play.</p>
+<form action="securityCheck.htm" method="post"><input type="text" name="j_username"/><input type="password" name="j_password"/>
+<input type="submit" value="Login"/></form>''')
+
+
+def transfer_search_page(n_rows: int = 20, seed: int = 0, form: str = None, page_number: int = 0, page_count: int = None) -> str:
+    rng = random.Random(seed)
+    header = ['#', 'Player', 'Nat', 'Age', 'Rating', 'Bat', 'Bowl', 'Tech', 'Pow', 'Keep', 'Field', 'End', 'Exp', 'Capt', 'BT', 'Current Bid', 'Deadline', '']
+    rows = []
+    for n in range(n_rows):
+        player_id, name = random_player(rng)
+        skills = ''.join(f'<td>{rng.choice(SKILL_LEVELS)}</td>' for _ in range(7))
+        bid = f'${rng.randint(1, 900) * 1000:,}'
+        bidder = '(opening)' if rng.random() < 0.3 else f'<a href="club.htm?teamId={rng.randint(1, 9999)}">{rng.choice(TEAM_NAMES)}</a>'
+        rows.append(f'''<tr class="{'odd' if n % 2 else 'even'}">
+    <td>{n + 1}</td><td>{player_link(player_id, name)}</td><td><a href="regionview.htm?regionId={rng.randint(1, 18)}"><img src="/img/flags/{n}.gif"/></a></td>
+    <td>{rng.randint(16, 34)}.{rng.randint(0, 14):02d}</td><td>{rng.randint(1000, 30000):,}</td>{skills}
+    <td>{rng.choice(SKILL_LEVELS)}</td><td>{rng.choice(SKILL_LEVELS)}</td><td>{rng.choice(['RM', 'LFM', 'RLB', 'ROB'])}</td>
+    <td>{bid} {bidder}</td><td>{rng.randint(1, 28)} Oct. 2026<br/>{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}</td><td><a href="bid.htm?listingId={player_id}">Bid</a></td>
+</tr>''')
+
+    # The search form links to the regions before the results, and parse_transfer_search_results skips those links
+    region_links = ' '.join(f'<a href="regionview.htm?regionId={region_id}">{region_id}</a>' for region_id in range(1, 10))
+    form = form or '<form action="transfer.htm" method="post"><select name="country"><option value="0">Any</option></select><input type="hidden" name="page" value="0"/></form>'
+    pager = f'<div class="pager">Page {page_number + 1} of {page_count}</div>' if page_count is not None else ''
+    body = f'''{form}
+<p class="regions">{region_links}</p>
+<h2>Transfer Search Results</h2>
+<table class="data">
+<thead><tr>{''.join(f'<th>{h}</th>' for h in header)}</tr></thead>
+<tbody>
+{''.join(rows)}
+</tbody>
+</table>
+{pager}'''
+    return page('Transfer Market', body)
+
+
+def player_ranks_page(n_rows: int = 30, seed: int = 0, form: str = '') -> str:
+    rng = random.Random(seed)
+    filter_table = '<table class="filters"><tr><th>Country</th><td><select name="country"><option>Any</option></select></td><th>Age</th><td>16</td></tr></table>'
+    rows = []
+    for n in range(n_rows):
+        player_id, name = random_player(rng)
+        rows.append(f'''<tr><td>{n + 1}</td><td>{player_link(player_id, name)}</td><td><a href="regionview.htm?regionId={rng.randint(1, 18)}">
+    <img src="/img/flags/1.gif"/></a></td><td>{rng.randint(16, 34)}</td><td>{rng.randint(1000, 30000):,}</td><td>${rng.randint(500, 90000):,}</td></tr>''')
+
+    # The page links to the regions before the rankings, and iter_best_players skips those links
+    region_links = ' '.join(f'<a href="regionview.htm?regionId={region_id}">{region_id}</a>' for region_id in range(1, 21))
+    body = f'''{form}{filter_table}
+<p class="regions">{region_links}</p>
+<table class="data"><tr><th>#</th><th>Players</th><th>Nat</th><th>Age</th><th>Rating</th><th>Wage</th></tr>
+{''.join(rows)}
+</table>'''
+    return page('Player Rankings', body)
+
+
+def squad_page(n_rows: int = 25, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    header = ['#', 'Player', 'Nat', 'Age', 'Rating', 'Wage', 'BT', 'Exp', 'Fatg', 'Role', 'End', 'Bat', 'Bowl', 'Tech', 'Power', 'Keep', 'Field', 'Capt', '']
+    rows = []
+    for n in range(n_rows):
+        player_id, name = random_player(rng)
+        skills = ''.join(f'<td>{rng.choice(SKILL_LEVELS)}</td>' for _ in range(8))
+        rows.append(f'''<tr><td>{n + 1}</td><td>{player_link(player_id, name)}</td><td><a href="regionview.htm?regionId={rng.randint(1, 18)}"></a></td>
+    <td>{rng.randint(16, 34)}.{rng.randint(0, 14):02d}</td><td>{rng.randint(1000, 30000):,}</td><td>${rng.randint(500, 90000):,}</td>
+    <td>RM</td><td>{rng.choice(SKILL_LEVELS)}</td><td>{rng.choice(['rested', 'weary'])}</td><td>Batsman</td>{skills}<td>&nbsp;</td>
+</tr>''')
+
+    body = f'''<table class="data squad">
+<tr>{''.join(f'<th>{h}</th>' for h in header)}</tr>
+{''.join(rows)}
+</table>'''
+    return page('Senior Squad', body)
+
+
+def scorecard_page(seed: int = 0) -> str:
+    rng = random.Random(seed)
+    teams = game_teams(seed)
+
+    def innings_table(batting_team):
+        rows = []
+        for n in range(11):
+            player_id, name = random_player(rng)
+            rows.append(f'<tr><td><a href="player.htm?playerId={player_id}" title="{name}">{name}</a></td><td>c Smith b Jones</td>'
+                        f'<td>{rng.randint(0, 120)}</td><td>{rng.randint(1, 150)}</td><td>{rng.randint(0, 12)}</td><td>{rng.randint(0, 5)}</td></tr>')
+        return f'''<table class="data scorecard"><tr><th>{batting_team}</th><th>{batting_team}</th><th>Runs</th><th>Balls</th><th>4s</th><th>6s</th></tr>
+{''.join(rows)}
+<tr><td>Extras</td><td>(b 1, lb 4, w 6)</td><td>11</td><td></td><td></td><td></td></tr>
+<tr><td>Total</td><td>{rng.randint(2, 10)} wickets, {rng.randint(30, 49)}.{rng.randint(0, 5)} overs</td><td>{rng.randint(100, 400)}</td><td></td><td></td><td></td></tr>
+<tr><td colspan="6">Fall of wickets: 1-12, 2-40, 3-77</td></tr>
+</table>'''
+
+    def bowling_table(bowling_team):
+        rows = ''.join(f'<tr><td>Bowler {n}</td><td>{rng.randint(4, 10)}</td><td>{rng.randint(0, 2)}</td><td>{rng.randint(10, 70)}</td><td>{rng.randint(0, 5)}</td></tr>' for n in range(6))
+        return f'<table class="data bowling"><tr><th>{bowling_team}</th><th>O</th><th>M</th><th>R</th><th>W</th></tr>{rows}</table>'
+
+    game_info = ''.join(f'<tr><th>{key}</th><td>{value}</td></tr>' for key, value in [
+        ('Weather', 'Sunny'), ('Pitch', 'Dusty'), ('League', 'Youth World Cup 2'), ('Date', f'{rng.randint(1, 28)} Oct. 26 14:00'), ('Venue', 'Lord&#39;s')])
+    body = f'''<table class="summary"><tr><th>Result:</th><td>{teams[0]} won by 24 runs</td></tr><tr><th>Toss:</th><td>{teams[0]} won the toss and elected to bat.</td></tr></table>
+{innings_table(teams[0])}
+{bowling_table(teams[1])}
+{innings_table(teams[1])}
+{bowling_table(teams[0])}
+<table class="info">{game_info}</table>'''
+    return page('Scorecard', body)
+
+
+def player_page(player_id: int = 1000000) -> str:
+    rng = random.Random(player_id)
+    name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'.replace("'", '&#39;')
+    team_id = 1 + player_id % 10
+    skills = {skill: rng.randint(2, 12) for skill in ['Batting', 'Bowling', 'Keeping', 'Fielding', 'Endurance', 'Technique', 'Power']}
+    rating = sum(level * 1000 for level in skills.values()) + rng.randint(0, 6999)
+    wage = rating // 4
+    talents = rng.sample(['Prodigy', 'Gifted (Batting)', 'Natural Leader', 'Swinger', 'Pinch Hitter'], rng.randint(0, 2))
+    talent_spans = ' '.join(f'<span class="popuphelp" title="{talent}|Talent description">{talent}</span>' for talent in talents)
+
+    def skill_cell(level):
+        return f'<td class="skills"><img src="/img/skills/{level}.gif"/>{SKILL_LEVELS[level]}</td>'
+
+    skill_rows = ''.join(f'<tr><th>{skill}</th>{skill_cell(level)}</tr>' for skill, level in skills.items())
+    summary_rows = ''.join(f'<tr><th>{role}</th>{skill_cell(rng.randint(2, 12))}</tr>' for role in ['Batsman', 'Bowler', 'Keeper', 'Allrounder'])
+    body = f'''<h1><a href="player.htm?playerId={player_id}">{name}</a> &gt;&gt; <a href="club.htm?teamId={team_id}">{rng.choice(TEAM_NAMES)}</a></h1>
+<p>{rng.randint(16, 30)}y{rng.randint(0, 14)}w, {rating:,} rating, {wage * 9 // 10:,} wage (10% discount)</p>
+<p>{rng.choice(['Left', 'Right'])} hand batsman <span class="pipe">|</span> {rng.choice(['Left', 'Right'])} arm {rng.choice(['Fast medium', 'Fast', 'Medium', 'Finger spin', 'Wrist spin'])}</p>
+<p>{talent_spans}</p>
+<table class="data player"><tr><th>Experience</th><td class="skills">{SKILL_LEVELS[rng.randint(0, 9)]}</td><th>Form</th><td>{SKILL_LEVELS[rng.randint(2, 9)]}</td></tr>
+<tr><th>Fatigue</th><td class="fatigue">rested</td><th>Captaincy</th><td><span class="skills">{SKILL_LEVELS[rng.randint(0, 9)]}</span></td></tr></table>
+<table class="data skills">{skill_rows}</table>
+<table class="data summary">{summary_rows}</table>
+<p>Nationality: <a href="regionview.htm?regionId={rng.randint(1, 18)}"><img src="/img/flags/1.gif"/></a></p>'''
+    return page(f'{name}', body)
+
+
+def player_transfers_page(player_id: int = 1000000, n_transfers: int = 4) -> str:
+    rng = random.Random(player_id)
+    rows = []
+    for n in range(n_transfers):
+        from_team, to_team = rng.sample(range(1, 9999), 2)
+        rows.append(f'''<tr><td>{rng.randint(1, 28)} Oct. {20 + n} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}</td><td>{50 + n}</td>
+    <td><a href="club.htm?teamId={from_team}">{rng.choice(TEAM_NAMES)}</a></td><td><a href="club.htm?teamId={to_team}">{rng.choice(TEAM_NAMES)}</a></td>
+    <td>${rng.randint(1, 900) * 1000:,}</td><td>{rng.randint(1000, 30000):,}</td><td>{16 + n * 2}</td></tr>''')
+
+    body = f'''<h1><a href="player.htm?playerId={player_id}">Transfer History</a></h1>
+<table class="data stats tablesorter"><tr><th>Date</th><th>Season</th><th>From</th><th>To</th><th>Price</th><th>Rating</th><th>Age</th></tr>
+{''.join(rows)}
+</table>'''
+    return page('Transfer History', body)
+
+
+def club_page(team_id: int = 1) -> str:
+    rng = random.Random(team_id)
+    team_name = rng.choice(TEAM_NAMES)
+    member_image = '<img src="/img/member.gif" title="This manager is a Pavilion Member."/>' if rng.random() < 0.5 else ''
+    body = f'''<p><a href="bookmark.htm?teamId={team_id}">Add this team to your bookmarks</a></p>
+<h1><a href="club.htm?teamId={team_id}">{team_name}</a> &gt;&gt; Club</h1>
+<table class="data club"><tr><th>Manager</th><td>{rng.choice(FIRST_NAMES)} {member_image}</td></tr>
+<tr><th>Country</th><td><a href="regionview.htm?regionId={rng.randint(1, 18)}">Region</a></td></tr>
+<tr><th>Ground</th><td>{rng.choice(LAST_NAMES)} Oval</td></tr></table>'''
+    return page(team_name, body)
+
+
+def game_teams(game_id: int) -> list:
+    # The scorecard and ratings pages of a game show the same two teams
+    return random.Random(game_id).sample(TEAM_NAMES, 2)
+
+
+def ratings_page(game_id: int = 0) -> str:
+    rng = random.Random(-game_id)
+    teams = game_teams(game_id)
+    categories = ['Batting - Top Order', 'Batting - Middle Order', 'Batting - Tail', 'Bowling - Pace', 'Bowling - Spin', 'Fielding', 'Keeping']
+    rows = ''.join(f'<tr><td>{category}</td><td>{rng.randint(500, 9000):,} (good)</td><td>{rng.randint(500, 9000):,} (average)</td></tr>' for category in categories)
+    body = f'''<table class="data stats"><tr><th></th><th>{teams[0]}</th><th>{teams[1]}</th></tr>
+{rows}
+</table>'''
+    return page('Match Ratings', body)
+
+
+def player_popup_page(seed: int = 0) -> str:
+    rng = random.Random(seed)
+    rows = ''.join(f'<tr><td>Label {n}</td><td>{rng.choice(SKILL_LEVELS)}</td><td>Label {n}b</td><td>{rng.choice(SKILL_LEVELS)}</td></tr>' for n in range(9))
+    rows += f'<tr><td>Wage</td><td>${rng.randint(500, 9000):,}</td><td>Training</td><td>{rng.choice(["Batting", "Bowling", "Fielding", "Keeping"])}</td></tr>'
+    return f'<html><body><table class="popup">{rows}</table></body></html>'
+
@@ -0,0 +1,286 @@
+"""
+Local stand-in for the site, for load testing the scrapers without logging in to the real site or spending its
+rate limit budget.
+
+The server keeps logged-in sessions like the site: the front page shows the login form posting to
+securityCheck.htm, any username and password log in, and every other page shows the logged-out front page (with
+the "completely free" text check_login looks for) until the session cookie is set. Pages are served from a
+recorded PageCache database when one is given, then from the corpus and its synthetic generators (see corpus.py)
+for any page ID. Transfer market and player rankings searches return results seeded by the submitted search
+settings, so repeated runs download the same pages.
+
+Latency, errors and expired sessions can be injected to exercise the retry and re-login paths. Point the browser
+at the server with initialize_browser(base_url=server.url), or with the PAVILIONPY_BASE_URL environment variable.
+Server statistics are returned as JSON from /__stats__.
+
+Usage, from the repository root:
+    python benchmarks/mock_server.py [--port 8765] [--latency 0.2] [--jitter 0.1] [--error-rate 0.02] [--page-cache data/page_cache.db]
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpus
+import fixtures
+from PageCache import PageCache, CacheMissError
+
+SESSION_COOKIE = 'JSESSIONID'
+TRANSFER_RESULTS_PER_PAGE = 20
+PLAYER_RANKS_PER_PAGE = 30
+
+
+class MockFTPServer:
+    """
+    Threaded HTTP server imitating the pages of the site used by the project.
+
+    Parameters:
+    - host (str): Address to listen on.
+    - port (int): Port to listen on, 0 for any free port.
+    - latency (float): Seconds added to every response.
+    - jitter (float): Maximum random seconds added on top of the latency.
+    - error_rate (float): Fraction of requests answered with error_status instead of the page.
+    - error_status (int): HTTP status of the injected errors.
+    - logout_rate (float): Fraction of logged-in requests whose session expires, answered with the logged-out page.
+    - page_cache_path (Optional[str]): PageCache database of recorded pages, served in preference to the corpus.
+    - corpus_dir (str): Corpus directory, pages missing from it are generated.
+    - transfer_pages (int): Number of results pages of every transfer market search. The last one is not full.
+    - transfer_page_limit (int): Number of results pages the server shows for one search, with a pager on each page.
+    - seed (int): Random seed of the injected latency, errors and expired sessions.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, logout_rate=0.0,
+                 page_cache_path=None, corpus_dir=corpus.CORPUS_DIR, transfer_pages=3, transfer_page_limit=10, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.logout_rate = logout_rate
+        self.page_cache = PageCache(db_path=page_cache_path, offline=True) if page_cache_path else None
+        self.corpus_dir = corpus_dir
+        self.transfer_pages = transfer_pages
+        self.transfer_page_limit = transfer_page_limit
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.stats = Counter()
+
+        self.httpd = ThreadingHTTPServer((host, port), MockFTPRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock_server = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, sessions=len(self.sessions))
+
+    def _count(self, *keys):
+        with self.lock:
+            self.stats.update(keys)
+
+    def _chance(self, rate):
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    def _delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                extra = self.rng.uniform(0, self.jitter)
+            time.sleep(self.latency + extra)
+
+    def respond(self, method, path, form, session_id):
+        """
+        Returns the (status, headers, content) of the response to a request.
+
+        Parameters:
+        - method (str): 'GET' or 'POST'.
+        - path (str): Requested path, including the query string.
+        - form (dict): Submitted form fields, merged with the query string fields.
+        - session_id (Optional[str]): Value of the session cookie.
+        """
+        page_name = urlsplit(path).path.lstrip('/')
+        if page_name == '__stats__':
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self.get_stats()).encode()
+
+        self._count('requests')
+        self._delay()
+        if self._chance(self.error_rate):
+            self._count('errors')
+            return self.error_status, {}, f'<html><body><h1>Error {self.error_status}</h1></body></html>'.encode()
+
+        if page_name == 'securityCheck.htm' and method == 'POST':
+            if not (form.get('j_username') and form.get('j_password')):
+                return self._html(fixtures.login_page())
+
+            session_id = secrets.token_hex(16)
+            with self.lock:
+                self.sessions.add(session_id)
+            self._count('logins')
+            return 302, {'Location': '/', 'Set-Cookie': f'{SESSION_COOKIE}={session_id}; Path=/'}, b''
+
+        with self.lock:
+            logged_in = session_id in self.sessions
+        if logged_in and self._chance(self.logout_rate):
+            with self.lock:
+                self.sessions.discard(session_id)
+            self._count('logouts')
+            logged_in = False
+
+        if not logged_in:
+            self._count('logged_out_pages')
+            return self._html(fixtures.login_page())
+        if page_name in ('', 'index.htm'):
+            return self._html(fixtures.login_page(logged_out=False))
+
+        if page_name == 'transfer.htm':
+            content = self.transfer_search_page(form)
+        elif page_name == 'playerranks.htm':
+            content = self.player_ranks_page(form)
+        else:
+            query = urlsplit(path).query
+            content = self.get_page('www.fromthepavilion.org/' + page_name + ('?' + query if query else ''))
+
+        if content is None:
+            self._count('not_found')
+            return 404, {}, b'<html><body><h1>Page not found</h1></body></html>'
+
+        self._count(page_name)
+        return self._html(content)
+
+    @staticmethod
+    def _html(content):
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, content.encode('utf-8')
+
+    @staticmethod
+    def _search_seed(form):
+        # Results depend on the search settings and page only, so every run of a search sees the same listings
+        return zlib.crc32(repr(sorted(form.items())).encode())
+
+    def transfer_search_page(self, form):
+        page = int(form.get('page') or 0)
+        page_count = min(self.transfer_pages, self.transfer_page_limit)
+        n_rows = 0 if page >= page_count else TRANSFER_RESULTS_PER_PAGE if page < self.transfer_pages - 1 else TRANSFER_RESULTS_PER_PAGE // 3
+        return fixtures.transfer_search_page(n_rows=n_rows, seed=self._search_seed(form), form=fixtures.search_form('transfer.htm'),
+                                             page_number=page, page_count=page_count)
+
+    def player_ranks_page(self, form):
+        return fixtures.player_ranks_page(n_rows=PLAYER_RANKS_PER_PAGE, seed=self._search_seed(form),
+                                          form=fixtures.search_form('playerranks.htm', fields=['country', 'region', 'age', 'ageWeeks', 'sortByWage']))
+
+    def get_page(self, url):
+        """
+        Returns a recorded page, or its corpus version, or None if the URL is not a page the corpus knows.
+        """
+        if self.page_cache is not None:
+            try:
+                return self.page_cache.get(url).decode('utf-8', errors='replace')
+            except CacheMissError:
+                pass
+
+        page_type, page_id = corpus.match_url(url)
+        if page_type is None:
+            return None
+
+        return corpus.load_page(page_type, page_id, self.corpus_dir)
+
+
+class MockFTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        form = dict(parse_qsl(urlsplit(self.path).query, keep_blank_values=True))
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length:
+            form.update(parse_qsl(self.rfile.read(content_length).decode('utf-8'), keep_blank_values=True))
+
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        session_id = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+
+        status, headers, content = self.server.mock_server.respond(method, self.path, form, session_id)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Requests are counted in the server statistics rather than logged
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random seconds added on top of the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of the injected errors')
+    parser.add_argument('--logout-rate', type=float, default=0.0, help='Fraction of requests whose session expires')
+    parser.add_argument('--page-cache', help='PageCache database of recorded pages to serve')
+    parser.add_argument('--corpus-dir', default=corpus.CORPUS_DIR, help='Page corpus directory, defaults to benchmarks/corpus')
+    parser.add_argument('--transfer-pages', type=int, default=3, help='Results pages of every transfer market search')
+    parser.add_argument('--transfer-page-limit', type=int, default=10, help='Results pages shown for one search')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the injected latency and errors')
+    args = parser.parse_args()
+
+    server = MockFTPServer(host=args.host, port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           error_status=args.error_status, logout_rate=args.logout_rate, page_cache_path=args.page_cache,
+                           corpus_dir=args.corpus_dir, transfer_pages=args.transfer_pages, transfer_page_limit=args.transfer_page_limit,
+                           seed=args.seed)
+    print(f'Serving on {server.url}, use it with PAVILIONPY_BASE_URL={server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.get_stats(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
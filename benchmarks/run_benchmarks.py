@@ -0,0 +1,225 @@
+"""
+Benchmarks of the page parsers, the training inference and the TeamViewer endpoints, run offline.
+
+A temporary working directory is set up with the repository's schema and training database, synthetic
+team_archives.db and market_archive.db archives, and a page cache holding the benchmark corpus (see corpus.py). The
+browser is started in offline mode, so every page is served from the corpus and nothing logs in or touches the
+site. Each benchmark reports its throughput (items per second, best of --repeat runs) and the peak memory
+allocated during one run, and is compared against the stored baseline. A benchmark whose throughput falls, or
+whose peak memory rises, by more than --tolerance is reported as a regression and the script exits with status 1.
+
+Usage, from the repository root:
+    python benchmarks/run_benchmarks.py [--repeat 3] [--cases get_game_summary flask_view_player] [--save-baseline]
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import corpus
+
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+TEAM_ARCHIVE = 'data/archives/team_archives/team_archives.db'
+MARKET_ARCHIVE = 'data/archives/market_archive/market_archive.db'
+
+
+def prepare_workdir(workdir: str, corpus_dir: str) -> None:
+    """
+    Sets up the data directory the benchmarked code reads from, makes it the working directory and starts the
+    offline browser.
+    """
+    os.makedirs(os.path.join(workdir, 'data'), exist_ok=True)
+    shutil.copytree(os.path.join(REPO_DIR, 'data', 'schema'), os.path.join(workdir, 'data', 'schema'), dirs_exist_ok=True)
+    shutil.copy(os.path.join(REPO_DIR, 'data', 'training_db.csv'), os.path.join(workdir, 'data', 'training_db.csv'))
+    os.chdir(workdir)
+    corpus.build_page_cache('data/page_cache.db', corpus_dir)
+
+    # Every module shares this browser, which serves the corpus pages from the page cache
+    import CoreUtils
+    browser = CoreUtils.initialize_browser(auto_login=False, offline=True)
+    # The offline browser makes no requests, and must not replace the real rate limit state when the script exits
+    browser.rate_limiter.state_file = None
+
+    import archives
+    archives.build_team_archive(TEAM_ARCHIVE)
+    archives.build_market_archive(MARKET_ARCHIVE)
+
+    # The squad training estimates are read from the inference table, which save_teams fills after each download
+    from PlayerTracker import SquadTrainingEngine
+    SquadTrainingEngine(TEAM_ARCHIVE).update_inference_table()
+
+
+def get_benchmarks(corpus_dir: str) -> dict:
+    """
+    Returns the benchmarks by name, each as (function running it once, number of items it processes).
+    """
+    import pandas as pd
+    import FTPUtils
+    import PavilionPy
+    import save_leagues
+    import TrainingTracker
+    from ArchiveStore import open_store
+    from PlayerTracker import PlayerTracker
+    from TeamViewer import app
+
+    pages = {page_type: corpus.load_pages(page_type, corpus_dir) for page_type in ['transfer', 'playertransfers', 'scorecard', 'ratings']}
+    player_ids = corpus.get_page_ids('player', corpus_dir)
+    game_ids = [game_id for game_id in pages['scorecard'] if game_id in pages['ratings']]
+    team_player_ids = [row[0] for row in open_store(TEAM_ARCHIVE).fetchall('SELECT DISTINCT PlayerID FROM players ORDER BY PlayerID LIMIT 10')]
+    market_player_ids = [row[0] for row in open_store(MARKET_ARCHIVE).fetchall('SELECT DISTINCT PlayerID FROM players ORDER BY PlayerID LIMIT 500')]
+
+    rng = random.Random(0)
+    academy_inputs = [(rng.randint(0, 400), rng.choice(['Batting', 'Bowling', 'Fielding', 'Batting Technique']), rng.choice(['None', 'Prodigy']),
+                       rng.randint(16, 25), [rng.randint(1000, 12000) for _ in range(7)]) for _ in range(1000)]
+
+    client = app.test_client()
+
+    def request(method, url, **kwargs):
+        response = client.open(url, method=method, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}')
+
+    def add_player_columns_in_processes():
+        # The pages are parsed by the shared process pool, as they are on a machine with several CPUs
+        pipeline = PavilionPy.Pipeline
+        PavilionPy.Pipeline = functools.partial(pipeline, parse_workers=2)
+        try:
+            return PavilionPy.add_player_columns(pd.DataFrame({'PlayerID': player_ids}), ['all_visible'])
+        finally:
+            PavilionPy.Pipeline = pipeline
+
+    benchmarks = {
+        'add_player_columns': (lambda: PavilionPy.add_player_columns(pd.DataFrame({'PlayerID': player_ids}), ['all_visible']), len(player_ids)),
+        'add_player_columns_processes': (add_player_columns_in_processes, len(player_ids)),
+        'parse_transfer_search_results': (lambda: [PavilionPy.parse_transfer_search_results(page) for page in pages['transfer'].values()], len(pages['transfer'])),
+        'extract_transfer_history_table': (lambda: [FTPUtils.extract_transfer_history_table(page) for page in pages['playertransfers'].values()], len(pages['playertransfers'])),
+        'get_game_summary': (lambda: [save_leagues.get_game_summary(game_id, page=pages['scorecard'][game_id], ratings_page=pages['ratings'][game_id]) for game_id in game_ids],
+                             len(game_ids)),
+        'PlayerTracker': (lambda: [PlayerTracker(player_id) for player_id in team_player_ids], len(team_player_ids)),
+        'get_closest_academy': (lambda: [TrainingTracker.get_closest_academy(*inputs[:3], age=inputs[3], existing_skills=inputs[4]) for inputs in academy_inputs],
+                                len(academy_inputs)),
+        'flask_players_in_database': (lambda: request('GET', '/get_players_in_database'), 1),
+        'flask_get_players': (lambda: request('POST', '/get_players', json={'player_ids': market_player_ids, 'source': 'market'}), len(market_player_ids)),
+        'flask_squad_training_estimates': (lambda: request('GET', '/get_squad_training_estimates'), 1),
+        'flask_player_skills': (lambda: [request('POST', '/get_player_skills', data={'playerId': player_id}) for player_id in team_player_ids], len(team_player_ids)),
+        'flask_player_chart_data': (lambda: [request('GET', f'/get_player_chart_data/{player_id}/') for player_id in team_player_ids], len(team_player_ids)),
+        'flask_view_player': (lambda: [request('GET', f'/view_player/{player_id}/?source=team') for player_id in team_player_ids], len(team_player_ids)),
+        'flask_view_market_player': (lambda: [request('GET', f'/view_player/{player_id}/?source=market') for player_id in market_player_ids[:10]], 10),
+    }
+
+    return benchmarks
+
+
+def measure(function, n_items: int, repeat: int) -> dict:
+    # The first run fills the caches a long running process would have filled (team details, stored inference)
+    function()
+
+    best_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'items': n_items, 'seconds': best_time, 'throughput': n_items / best_time, 'peak_mb': peak_memory / 2 ** 20}
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> dict:
+    """
+    Returns the reason each benchmark regressed against the baseline, by benchmark name.
+    """
+    regressions = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        reasons = []
+        if result['throughput'] < baseline[name]['throughput'] * (1 - tolerance):
+            reasons.append(f'throughput {result["throughput"] / baseline[name]["throughput"] - 1:+.0%}')
+        if result['peak_mb'] > baseline[name]['peak_mb'] * (1 + tolerance):
+            reasons.append(f'peak memory {result["peak_mb"] / baseline[name]["peak_mb"] - 1:+.0%}')
+        if reasons:
+            regressions[name] = ', '.join(reasons)
+
+    return regressions
+
+
+def print_results(results: dict, baseline: dict, regressions: dict) -> None:
+    print(f'{"benchmark":<34}{"items/s":>12}{"baseline":>12}{"peak MB":>10}{"baseline":>10}  status')
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        print(f'{name:<34}{result["throughput"]:>12.1f}{base.get("throughput", float("nan")):>12.1f}'
+              f'{result["peak_mb"]:>10.2f}{base.get("peak_mb", float("nan")):>10.2f}  '
+              f'{"REGRESSION (" + regressions[name] + ")" if name in regressions else "ok" if base else "no baseline"}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='*', help='Benchmarks to run, defaults to all')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions, the fastest is reported')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed fractional change from the baseline before a regression is reported')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file, defaults to benchmarks/baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--corpus-dir', default=corpus.CORPUS_DIR, help='Page corpus directory, defaults to benchmarks/corpus')
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep the temporary working directory')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix='pavilionpy_bench_')
+    original_dir = os.getcwd()
+    results = {}
+    try:
+        # The benchmarked code logs every page it opens and warns about players whose skills are all solved, which
+        # would bury the results
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            prepare_workdir(workdir, args.corpus_dir)
+            benchmarks = get_benchmarks(args.corpus_dir)
+            for name in (args.cases or benchmarks):
+                function, n_items = benchmarks[name]
+                results[name] = measure(function, n_items, args.repeat)
+    finally:
+        if 'CoreUtils' in sys.modules:
+            # Log lines are written in the background, and must be written before the working directory is removed
+            sys.modules['CoreUtils'].log_writer.flush()
+        os.chdir(original_dir)
+        if args.keep_workdir:
+            print(f'Working directory kept at {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    print_results(results, baseline, regressions)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(baseline, **{name: {'throughput': round(result['throughput'], 2), 'peak_mb': round(result['peak_mb'], 3)}
+                                        for name, result in results.items()}), f, indent=4)
+        print(f'Baseline saved to {args.baseline}')
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -39,8 +39,8 @@ CREATE TABLE IF NOT EXISTS players (
     AgeWeeks INTEGER,
     AgeValue REAL,
     CountryOfResidence INTEGER,
-    TrainingWeek INTEGER
+    TrainingWeek INTEGER,
     DataSeason INTEGER,
     DataWeek INTEGER,
-    DataTimestamp TEXT,
-);
\ No newline at end of file
+    DataTimestamp TEXT
+);
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS teams (
+    TeamID TEXT,
+    TeamName TEXT,
+    ManagerName TEXT,
+    ManagerMembership BOOLEAN,
+    TeamRegionID TEXT,
+    TeamGroundName TEXT,
+    DataSeason INTEGER,
+    DataTimeStamp TEXT
+);
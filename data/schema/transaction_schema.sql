@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS transactions (
+    TransactionID TEXT,
+    Player TEXT,
+    PlayerID TEXT,
+    FromTeamName TEXT,
+    FromTeamID INTEGER,
+    ToTeamName TEXT,
+    ToTeamID INTEGER,
+    FinalPrice REAL,
+    CompletionTime TEXT
+);
@@ -1,4 +1,6 @@
-from PavilionPy import watch_transfer_market
+from MarketScheduler import MarketScheduler
 
 database_name = 'market_archive'
-watch_transfer_market(database_name)
\ No newline at end of file
+
+if __name__ == '__main__':
+    MarketScheduler(database_name).run()
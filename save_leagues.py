@@ -4,7 +4,6 @@ browser = CoreUtils.initialize_browser()
 import sqlite3
 import os
 import json
-import jsonschema
 import re
 import time
 import numpy as np
@@ -12,18 +11,23 @@ import uuid
 from datetime import datetime, timedelta
 import pandas as pd
 from io import StringIO
-from jsonschema import validate
 from typing import Dict, Optional, List, Union
 from bs4 import BeautifulSoup
 
 import CoreUtils
+from ArchiveStore import open_store
+from CrawlJob import CrawlJob, ItemNotReady
 from PavilionPy import apply_column_ordering
+from Pipeline import Pipeline
+
+# Games handed to each run of the download pipeline. The games of a league after its first unplayed game are not
+# downloaded, apart from those the other fetchers had already started, so a large batch wastes few requests
+GAME_BATCH_SIZE = 50
 
 def get_league_page(league_id):
     browser.open('https://www.fromthepavilion.org/leaguefixtures.htm?lsId={}'.format(league_id))
-    page = str(browser.parsed)
 
-    return page
+    return browser.text
 
 
 def extract_game_ids(page_content):
@@ -37,8 +41,7 @@ def extract_game_ids(page_content):
 
 def get_league_overview_page(league_id):
     browser.open('https://www.fromthepavilion.org/leagueoverview.htm?lsId={}'.format(league_id))
-    page_content = str(browser.parsed)
-    return page_content
+    return browser.text
 
 
 def extract_seasons_and_ids(page_content):
@@ -49,11 +52,13 @@ def extract_seasons_and_ids(page_content):
     return seasons_dict
 
 
-def extract_match_ratings(game_id):
-    url = f'https://www.fromthepavilion.org/ratings.htm?gameId={game_id}'
-    browser.open(url)
-    page = str(browser.parsed)
-    soup = BeautifulSoup(page, 'html.parser')
+def extract_match_ratings(game_id, page=False):
+    if not page:
+        url = f'https://www.fromthepavilion.org/ratings.htm?gameId={game_id}'
+        browser.open(url)
+        soup = browser.parsed
+    else:
+        soup = BeautifulSoup(page, 'html.parser')
     table = soup.find('table', class_='data stats')
     headers = table.find_all('th')
     team1 = headers[1].get_text().strip()
@@ -87,12 +92,14 @@ def extract_player_ids(table_html):
             player_names.append(None)
     return player_ids, player_names
 
-def get_game_summary(game_id):
-    CoreUtils.log_event(f'Downloading summary for game {game_id}')
-    url = f'https://www.fromthepavilion.org/scorecard.htm?gameId={game_id}'
-    browser.open(url)
-    page = str(browser.parsed)
-    soup = BeautifulSoup(page, 'html.parser')\
+def get_game_summary(game_id, page=False, ratings_page=False):
+    if not page:
+        CoreUtils.log_event(f'Downloading summary for game {game_id}')
+        url = f'https://www.fromthepavilion.org/scorecard.htm?gameId={game_id}'
+        browser.open(url)
+        page, soup = browser.text, browser.parsed
+    else:
+        soup = BeautifulSoup(page, 'html.parser')
 
     result_text = soup.find('th', string='Result:').find_next_sibling('td').text
     winner = result_text.split(' won ')[0]
@@ -100,10 +107,12 @@ def get_game_summary(game_id):
     toss_text = soup.find('th', string='Toss:').find_next_sibling('td').text
     toss_winner, toss_decision = toss_text[:-1].split(' won the toss and elected to ')
 
-    match_ratings, team1_name, team2_name = extract_match_ratings(game_id)
+    match_ratings, team1_name, team2_name = extract_match_ratings(game_id, page=ratings_page)
     batting_team = (toss_winner if toss_decision == 'bat' else (team1_name if toss_winner == team2_name else team2_name))
 
-    game_info = pd.read_html(StringIO(str(soup)))[5]
+    # The page is read once for the game information and both innings
+    scorecard_tables = pd.read_html(StringIO(page))
+    first_innings, second_innings, game_info = scorecard_tables[1], scorecard_tables[3], scorecard_tables[5]
     weather = game_info[game_info[0] == 'Weather'][1].values[0]
     pitch = game_info[game_info[0] == 'Pitch'][1].values[0]
     league = game_info[game_info[0] == 'League'][1].values[0]
@@ -114,10 +123,8 @@ def get_game_summary(game_id):
 
     match_type, division = league.rsplit(' ', 1)
 
-    tb = pd.read_html(StringIO(str(soup)))
-
-    first_innings_footer = tb[1].iloc[-2]
-    second_innings_footer = tb[3].iloc[-2]
+    first_innings_footer = first_innings.iloc[-2]
+    second_innings_footer = second_innings.iloc[-2]
 
     first_innings_score = first_innings_footer['Runs']
     first_innings_info = re.search(r"(\d+) wickets, (\d+(?:\.\d+)?) overs", first_innings_footer[f'{team1_name if team1_name == batting_team else team2_name}.1'])
@@ -158,31 +165,92 @@ def get_game_summary(game_id):
     return game_summary
 
 
-def download_league_games(league_ids):
-    game_summaries = []
+def parse_game_pages(game, pages):
+    """
+    Parses the scorecard and ratings pages of a league game into its summary. Runs in a parsing process of the
+    download_league_games Pipeline.
+    """
+    scorecard_page, ratings_page = pages
+    try:
+        game_summary = get_game_summary(game.ItemKey, page=scorecard_page, ratings_page=ratings_page)
+    except AttributeError as e:
+        raise ItemNotReady(f'Game {game.ItemKey} has not yet been played, halting for league {game.Parent} - ({str(e)})')
+
+    game_summary['LeagueID'] = [int(game.Parent)]
+    return game_summary
+
 
-    for league_id in league_ids:
-        page_content = get_league_page(league_id)
-        league_games = extract_game_ids(page_content)
+def download_league_games(league_ids, db_path='data/archives/league_games/league_games.db'):
+    """
+    Downloads the summaries of every played game in the given leagues to the game_summaries table of an archive, and
+    returns the summaries of those leagues.
 
-        for game_id in league_games:
-            try:
-                game_summary = get_game_summary(game_id)
-                game_summary['LeagueID'] = [league_id]
-                game_summaries.append(game_summary)
-            except AttributeError as e:
-                CoreUtils.log_event(f'Game {game_id} has not yet been played, halting for league {league_id} - ({str(e)})')
-                break
-            except Exception as e:
-                CoreUtils.log_event(f'An unexpected error occurred for game {game_id} in league {league_id}, skipping - ({str(e)})')
-                pass
+    The download is a CrawlJob: leagues and their games are tracked in the archive, so an interrupted download skips
+    the games already saved when it is run again, and unplayed games are picked up by a later run.
 
-    game_summary_df = pd.concat(game_summaries).reset_index(drop=True)
+    Parameters:
+    - league_ids (list): The league IDs to download.
+    - db_path (str): Path to the archive, defaults to data/archives/league_games/league_games.db.
+
+    Returns:
+    - pd.DataFrame: The game summaries of the given leagues.
+    """
+    store = open_store(db_path)
+    job = CrawlJob('league_games', store)
+    job.add_items('league', league_ids)
     column_ordering_schema = 'data/schema/col_ordering_natgamesummary.txt'
 
-    game_summary_df = apply_column_ordering(game_summary_df, column_ordering_schema)
+    def collect_league_game_ids(leagues):
+        for league in leagues:
+            page_content = get_league_page(league.ItemKey)
+            job.add_items('game', extract_game_ids(page_content), parent=league.ItemKey)
+
+    def collect_game_summaries(games):
+        unplayed_leagues = set()
+
+        def fetch_game_pages(game):
+            # Games are listed in fixture order, so once a league has an unplayed game its later games are not downloaded
+            if game.Parent in unplayed_leagues:
+                raise ItemNotReady(f'Game {game.ItemKey} comes after an unplayed game of league {game.Parent}')
+
+            scorecard_page = browser.fetch(f'https://www.fromthepavilion.org/scorecard.htm?gameId={game.ItemKey}')
+            if 'Result:' not in scorecard_page:
+                unplayed_leagues.add(game.Parent)
+                raise ItemNotReady(f'Game {game.ItemKey} has not yet been played, halting for league {game.Parent}')
+
+            return scorecard_page, browser.fetch(f'https://www.fromthepavilion.org/ratings.htm?gameId={game.ItemKey}')
+
+        stored_game_ids = set()
+
+        def store_game_summaries(game_summaries):
+            game_summaries = pd.concat(game_summaries)
+            store.append_dataframe(apply_column_ordering(game_summaries, column_ordering_schema), 'game_summaries')
+            stored_game_ids.update(str(game_id) for game_id in game_summaries['GameID'])
+
+        CoreUtils.log_event(f'Downloading summaries for games {", ".join(game.ItemKey for game in games)}')
+        pipeline = Pipeline(fetch_game_pages, parse_game_pages, store_game_summaries, name='League games')
+        try:
+            pipeline.run(games)
+        except Exception as e:
+            # The summaries are stored in several batches, so the games stored before the failure are marked as done
+            # and only the rest are collected again, rather than storing their summaries twice
+            errors = {game.ItemKey: e for game in games if game.ItemKey not in stored_game_ids}
+            errors.update((game.ItemKey, error) for game, error in pipeline.errors.items())
+            return errors
+
+        return {game.ItemKey: error for game, error in pipeline.errors.items()}
+
+    job.run('league', collect_league_game_ids)
+    job.run('game', collect_game_summaries, batch_size=GAME_BATCH_SIZE, requests_per_item=2)
+
+    if store.fetchone("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'game_summaries'") is None:
+        return pd.DataFrame()
+
+    placeholders = ', '.join('?' for _ in league_ids)
+    game_summary_df = store.read_dataframe(f'SELECT * FROM game_summaries WHERE LeagueID IN ({placeholders}) ORDER BY rowid',
+                                           params=[int(league_id) for league_id in league_ids])
 
-    return game_summary_df
+    return game_summary_df.reset_index(drop=True)
 
 
 if __name__ == '__main__':
@@ -1,20 +1,37 @@
-import sqlite3
-import os
-from PavilionPy import best_player_search
+import CoreUtils
+browser = CoreUtils.initialize_browser()
+
+from ArchiveStore import open_store
+from CrawlJob import CrawlJob
+from PavilionPy import iter_best_players, save_player_batches, get_stored_player_ids
+from FTPUtils import get_current_game_week
 
 # Example
-# Save the top 150 waged UAE players
+# Save the top 150 waged UAE players, once per game week
 # 'columns_to_add' as 'all_visible' will download player skils, and requires UAE management roles in-game)
 
-nat_potentials = best_player_search(
-    search_settings={'country': '16', 'ageWeeks': '-1', 'pages': 5, 'sortByWage': 'true'},
-    columns_to_add='all_visible',
-    skill_level_format='numeric'
-)
+search_settings = {'country': '16', 'ageWeeks': '-1', 'pages': 5, 'sortByWage': 'true'}
 
 db_path = 'data/archives/uae_potentials/uae_potentials.db'
-os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-conn = sqlite3.connect(db_path)
-nat_potentials.to_sql('potentials', conn, if_exists='append', index=False)
-conn.close()
+
+def save_potentials(searches):
+    for search in searches:
+        # Players saved this week before an interruption are skipped instead of downloaded again
+        saved_players = get_stored_player_ids(store, data_season=current_season, data_week=current_week, table='potentials')
+        nat_potentials = iter_best_players(
+            search_settings=search_settings,
+            columns_to_add='all_visible',
+            skill_level_format='numeric',
+            ignore_players=saved_players
+        )
+        save_player_batches(store, nat_potentials, table='potentials')
+
+
+if __name__ == '__main__':
+    store = open_store(db_path)
+    current_season, current_week = get_current_game_week()
+
+    job = CrawlJob(f'uae_potentials_s{current_season}w{current_week}', store)
+    job.add_items('search', [search_settings['country']])
+    job.run('search', save_potentials, requests_per_item=150)
@@ -1,39 +1,59 @@
 import CoreUtils
 browser = CoreUtils.initialize_browser()
 
-import sqlite3
 import pandas as pd
 import os
-from PavilionPy import get_team_players
+from ArchiveStore import open_store
+from CrawlJob import CrawlJob, ItemNotReady
+from PavilionPy import iter_team_players, get_stored_player_ids, save_player_batches
 from FTPUtils import get_team_info, get_current_game_week
+from PlayerTracker import SquadTrainingEngine
 
 team_ids = [3941]#, 3016]
 db_path = 'data/archives/team_archives/team_archives.db'
 age_group = 'all'
 #age_group = 'youths'
 
-conn = sqlite3.connect(db_path)
-def get_existing_combinations(conn):
-    query = "SELECT PlayerID, DataSeason, DataWeek FROM players"
-    existing_df = pd.read_sql(query, conn)
-    return set(existing_df.itertuples(index=False, name=None))
 
-current_season, current_week = get_current_game_week()
-existing_combinations = get_existing_combinations(conn)
-players_already_downloaded = [player_id for player_id, data_season, data_week in existing_combinations if data_season == current_season and data_week == current_week]
+def get_trained_players(team_players, team_name, untrained_players):
+    team_players['TeamGroup'] = team_name
+    trained_players = team_players[team_players['TrainedThisWeek'] == 1]
 
-for teamid in team_ids:
-    team_name = get_team_info(teamid, 'TeamName')
-    new_players = get_team_players(teamid, columns_to_add='all_visible', column_ordering_keyword='col_ordering_visibleplayers', age_group=age_group, ignore_players=players_already_downloaded)
-    if len(new_players) > 0:
-        new_players['TeamGroup'] = team_name
-        trained_players = new_players[new_players['TrainedThisWeek'] == 1]
+    untrained_players_count = len(team_players) - len(trained_players)
+    if untrained_players_count > 0:
+        CoreUtils.log_event(f"{untrained_players_count} players were filtered out because they have not been trained this week.")
+        untrained_players.extend(team_players.loc[team_players['TrainedThisWeek'] != 1, 'PlayerID'])
 
-        untrained_players_count = len(new_players) - len(trained_players)
-        if untrained_players_count > 0:
-            CoreUtils.log_event(f"{untrained_players_count} players were filtered out because they have not been trained this week.")
+    return trained_players
 
-        trained_players.to_sql('players', conn, if_exists='append', index=False)
-        CoreUtils.log_event(f'{len(trained_players)} players saved to the database for TeamID {teamid}.')
 
-conn.close()
+def save_teams(teams):
+    errors = {}
+    for team in teams:
+        team_name = get_team_info(team.ItemKey, 'TeamName')
+        untrained_players = []
+        team_batches = iter_team_players(team.ItemKey, columns_to_add='all_visible', column_ordering_keyword='col_ordering_visibleplayers', age_group=age_group, ignore_players=players_already_downloaded)
+        n_saved_players = save_player_batches(store, (get_trained_players(batch, team_name, untrained_players) for batch in team_batches))
+        CoreUtils.log_event(f'{n_saved_players} players saved to the database for TeamID {team.ItemKey}.')
+
+        # Age groups train at different times, so a team with players still to train stays pending and is downloaded
+        # again by a later run this week, skipping the players already saved
+        if untrained_players:
+            errors[team.ItemKey] = ItemNotReady(f'{len(untrained_players)} players of TeamID {team.ItemKey} have not been trained this week')
+
+    return errors
+
+
+if __name__ == '__main__':
+    store = open_store(db_path, tables=['players'])
+
+    current_season, current_week = get_current_game_week()
+    players_already_downloaded = get_stored_player_ids(store, data_season=current_season, data_week=current_week)
+
+    # Teams are downloaded once per game week, teams whose players have all been saved this week are skipped if the
+    # script is run again
+    job = CrawlJob(f'save_teams_s{current_season}w{current_week}', store)
+    job.add_items('team', team_ids)
+    job.run('team', save_teams, requests_per_item=25)
+
+    SquadTrainingEngine(db_path).update_inference_table()
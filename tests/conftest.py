@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs a test in an empty working directory holding the repository's schema files and training database, as the
+    modules read data/schema and data/training_db.csv and write their logs, page cache and rate limit state relative
+    to the working directory.
+    """
+    os.makedirs(tmp_path / 'data')
+    for name in ('schema', 'training_db.csv'):
+        os.symlink(os.path.join(REPO_DIR, 'data', name), tmp_path / 'data' / name)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def browser(workdir):
+    """
+    The offline browser shared by every module, which never logs in and does not save its rate limit state.
+    """
+    import CoreUtils
+    browser = CoreUtils.initialize_browser(auto_login=False, offline=True)
+    browser.rate_limiter.state_file = None
+    return browser
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+from ArchiveStore import ArchiveStore
+
+
+@pytest.fixture
+def store(workdir):
+    return ArchiveStore(str(workdir / 'archive.db'))
+
+
+def count_rows(store, table):
+    if store.fetchone("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)) is None:
+        return None
+    return store.fetchone(f'SELECT COUNT(*) FROM "{table}"')[0]
+
+
+def test_append_dataframe_is_rolled_back_with_its_transaction(store):
+    store.append_dataframe(pd.DataFrame({'TransactionID': ['kept'], 'PlayerID': ['1']}), 'transactions')
+
+    with pytest.raises(RuntimeError):
+        with store.transaction() as conn:
+            store.append_dataframe(pd.DataFrame({'TransactionID': ['a', 'b'], 'PlayerID': ['2', '3'], 'NewColumn': [1, 2]}), 'transactions')
+            raise RuntimeError('crash after appending')
+
+    assert count_rows(store, 'transactions') == 1
+    assert store.fetchall("SELECT TransactionID FROM transactions") == [('kept',)]
+    assert 'NewColumn' not in [row[1] for row in store.fetchall('PRAGMA table_info("transactions")')]
+
+
+def test_new_tables_are_rolled_back_with_their_transaction(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.append_dataframe(pd.DataFrame({'GameID': [1]}), 'game_summaries')
+            store.append_dataframe(pd.DataFrame({'PlayerID': ['1']}), 'players')
+            raise RuntimeError('crash after appending')
+
+    assert count_rows(store, 'game_summaries') is None
+    assert count_rows(store, 'players') is None
+
+
+def test_append_dataframe_stores_missing_values_as_null(store):
+    df = pd.DataFrame({'GameID': [1, 2], 'Score': [150.0, None], 'Winner': ['A', None], 'Played': [True, False]})
+    assert store.append_dataframe(df, 'game_summaries') == 2
+
+    assert store.fetchall('SELECT GameID, Score, Winner, Played FROM game_summaries ORDER BY GameID') == [(1, 150.0, 'A', 1), (2, None, None, 0)]
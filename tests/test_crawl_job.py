@@ -0,0 +1,34 @@
+import pytest
+
+
+@pytest.fixture
+def job(browser, workdir):
+    from ArchiveStore import ArchiveStore
+    from CrawlJob import CrawlJob
+    return CrawlJob('test', ArchiveStore(str(workdir / 'archive.db')))
+
+
+def test_items_without_a_parent_are_deferred_alone(job):
+    from CrawlJob import ItemNotReady
+    job.add_items('team', [1, 2, 3])
+    handled = []
+
+    def handler(teams):
+        handled.extend(team.ItemKey for team in teams)
+        return {team.ItemKey: ItemNotReady('not trained yet') for team in teams if team.ItemKey == '1'}
+
+    assert job.run('team', handler) == {'done': 2, 'failed': 0, 'deferred': 1}
+    assert handled == ['1', '2', '3']
+    assert [item.ItemKey for item in job.get_items('team', status='pending')] == ['1']
+
+
+def test_items_after_one_not_ready_are_deferred_with_their_parent(job):
+    from CrawlJob import ItemNotReady
+    job.add_items('game', [1, 2], parent=10)
+    job.add_items('game', [3], parent=20)
+
+    def handler(games):
+        return {game.ItemKey: ItemNotReady('not played yet') for game in games if game.ItemKey == '1'}
+
+    assert job.run('game', handler) == {'done': 1, 'failed': 0, 'deferred': 1}
+    assert [item.ItemKey for item in job.get_items('game', status='pending')] == ['1', '2']
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def MarketScheduler(browser):
+    import MarketScheduler
+    return MarketScheduler
+
+
+def test_every_listing_of_a_failed_detail_batch_is_retried(MarketScheduler, tmp_path, monkeypatch):
+    def fail_to_download(listings, additional_columns):
+        raise ConnectionError('could not download the player pages')
+
+    monkeypatch.setattr(MarketScheduler, 'finalise_transfer_listings', fail_to_download)
+    scheduler = MarketScheduler.MarketScheduler(str(tmp_path / 'market.db'), retry_delay=600)
+    now = datetime.utcnow()
+    deadline = (now + timedelta(minutes=2)).strftime(MarketScheduler.TIMESTAMP_FORMAT)
+    keys = [(str(player_id), deadline) for player_id in (1, 2, 3)]
+    for key in keys:
+        scheduler.listings[key] = {'row': pd.Series({'PlayerID': key[0], 'Deadline': key[1]}), 'stored': False, 'skipped': False}
+        scheduler.schedule(now - timedelta(seconds=1), 'detail', key)
+
+    scheduler.run(max_events=1)
+
+    retried_keys = sorted(payload for when, _, kind, payload in scheduler.events if kind == 'detail')
+    assert retried_keys == keys
+    assert all(when > now + timedelta(minutes=5) for when, _, kind, payload in scheduler.events)
+
+
+@pytest.fixture
+def rate_limiter(browser, monkeypatch):
+    from CoreUtils import RateLimiter
+    rate_limiter = RateLimiter(state_file=None)
+    monkeypatch.setattr(browser, 'rate_limiter', rate_limiter)
+    return rate_limiter
+
+
+def test_searches_poll_the_first_pages_and_fit_in_the_search_budget(MarketScheduler, rate_limiter, tmp_path, monkeypatch):
+    searches = []
+
+    def search_transfer_listings(search_settings, max_pages=None, shard_fields=None):
+        searches.append((max_pages, shard_fields))
+        for _ in range(30 if shard_fields is None else 1):
+            rate_limiter.record()
+        deadline = (datetime.utcnow() + timedelta(days=2)).strftime(MarketScheduler.TIMESTAMP_FORMAT)
+        return pd.DataFrame({'PlayerID': [str(len(searches))], 'Deadline': [deadline]})
+
+    monkeypatch.setattr(MarketScheduler, 'search_transfer_listings', search_transfer_listings)
+    scheduler = MarketScheduler.MarketScheduler(str(tmp_path / 'market.db'), full_sweep_interval=timedelta(hours=12))
+    start = datetime.utcnow()
+    for hours in (0, 1, 2, 13):
+        scheduler.take_events('search', start + timedelta(days=7))
+        scheduler.handle_search(start + timedelta(hours=hours))
+
+    # Only the first search and the one after full_sweep_interval download every page and split the search
+    assert searches == [(None, None), (1, []), (1, []), (None, None)]
+    # A quarter of the weekly limit spread over the week allows the 30 requests of the full sweep about every 4 hours
+    assert scheduler.last_search_cost == 30
+    [(next_search, _, _, _)] = [event for event in scheduler.events if event[2] == 'search']
+    search_rate = 0.25 * (5000 - 62) / timedelta(days=7).total_seconds()
+    assert next_search >= start + timedelta(hours=13, seconds=30 / search_rate)
+
+
+def test_listings_beyond_the_request_budget_are_skipped(MarketScheduler, rate_limiter, tmp_path, monkeypatch):
+    archived = []
+
+    def finalise_transfer_listings(listings, additional_columns):
+        archived.extend(listings['PlayerID'])
+        return listings
+
+    monkeypatch.setattr(MarketScheduler, 'finalise_transfer_listings', finalise_transfer_listings)
+    monkeypatch.setattr(MarketScheduler, 'save_market_listings', lambda store, players: (len(players), 0))
+    scheduler = MarketScheduler.MarketScheduler(str(tmp_path / 'market.db'))
+    now = datetime.utcnow()
+    keys = [(str(player_id), (now + timedelta(minutes=2, seconds=player_id)).strftime(MarketScheduler.TIMESTAMP_FORMAT)) for player_id in range(60)]
+    for key in keys:
+        scheduler.listings[key] = {'row': pd.Series({'PlayerID': key[0], 'Deadline': key[1]}), 'stored': False, 'skipped': False}
+        scheduler.schedule(now, 'detail', key)
+
+    # Six hours of three quarters of the weekly limit's rate allows 44 listings of 3 requests each
+    scheduler.handle_detail(now, keys[0])
+    assert archived == [key[0] for key in keys[:44]]
+    assert all(scheduler.listings[key]['skipped'] for key in keys[44:])
+    assert scheduler.listing_allowance < MarketScheduler.REQUESTS_PER_LISTING
+
+    # The allowance is refilled with time
+    archived.clear()
+    later_key = ('60', (now + timedelta(hours=1)).strftime(MarketScheduler.TIMESTAMP_FORMAT))
+    scheduler.listings[later_key] = {'row': pd.Series({'PlayerID': '60', 'Deadline': later_key[1]}), 'stored': False, 'skipped': False}
+    scheduler.handle_detail(now + timedelta(minutes=20), later_key)
+    assert archived == ['60']
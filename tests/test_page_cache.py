@@ -0,0 +1,31 @@
+from PageCache import PageCache
+from benchmarks import fixtures
+
+
+def test_only_finished_game_pages_are_cached(tmp_path):
+    cache = PageCache(db_path=str(tmp_path / 'page_cache.db'))
+    unplayed_ratings_page = fixtures.page('Match Ratings', '<p>Ratings are shown once the game has been played.</p>')
+
+    assert not cache.put('https://www.fromthepavilion.org/ratings.htm?gameId=1', unplayed_ratings_page.encode())
+    assert cache.get('https://www.fromthepavilion.org/ratings.htm?gameId=1') is None
+    assert cache.put('https://www.fromthepavilion.org/ratings.htm?gameId=1', fixtures.ratings_page(1).encode())
+    assert cache.get('https://www.fromthepavilion.org/ratings.htm?gameId=1') == fixtures.ratings_page(1).encode()
+
+
+def test_forms_are_read_from_cached_pages(browser, tmp_path, monkeypatch):
+    # Search pages are only cached when every page is recorded, as for the benchmark corpus, and replayed offline
+    url = 'https://www.fromthepavilion.org/transfer.htm'
+    cache = PageCache(db_path=str(tmp_path / 'page_cache.db'), offline=True, record_all=True)
+    assert cache.put(url, fixtures.transfer_search_page(form=fixtures.search_form('transfer.htm')).encode())
+    monkeypatch.setattr(browser, 'page_cache', cache)
+    monkeypatch.setattr(browser, 'form_cache', {})
+
+    form = str(browser.get_page_form(url).parsed)
+    assert form.startswith('<form action="https://www.fromthepavilion.org/transfer.htm"')
+    assert '<select name="ageWeeks">' in form
+
+    # Forms are loaded again once the browser has logged in again
+    with open('data/credentials.txt', 'w') as f:
+        f.write('user,pass')
+    browser.login(max_attempts=0)
+    assert browser.form_cache == {}
@@ -0,0 +1,85 @@
+import os
+import threading
+import pytest
+
+
+@pytest.fixture
+def Pipeline(browser):
+    import Pipeline
+    return Pipeline
+
+
+# Parse functions run in the parsing processes, so they are defined at module level
+def parse_square(item, page):
+    if item == 3:
+        raise ValueError('unparseable page')
+    return item, page * page
+
+
+def parse_and_die(item, page):
+    os._exit(1)
+
+
+def run_with_timeout(pipeline, items, timeout=60):
+    result = {}
+
+    def run():
+        try:
+            result['errors'] = pipeline.run(items)
+        except Exception as e:
+            result['exception'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'Pipeline.run did not return'
+    return result
+
+
+@pytest.mark.parametrize('parse_workers', [0, 2])
+def test_records_are_parsed_and_stored(Pipeline, parse_workers):
+    stored = []
+    pipeline = Pipeline.Pipeline(lambda item: item, parse_square, stored.extend, fetch_workers=2, parse_workers=parse_workers,
+                                 queue_size=2, batch_size=3)
+    result = run_with_timeout(pipeline, range(10))
+
+    assert sorted(stored) == [(item, item * item) for item in range(10) if item != 3]
+    assert list(result['errors']) == [3] and isinstance(result['errors'][3], ValueError)
+    stats = pipeline.get_stats()
+    assert (stats['fetch']['items'], stats['parse']['items'], stats['parse']['errors'], stats['store']['items']) == (10, 9, 1, 9)
+
+
+def test_fetch_errors_are_returned_per_item(Pipeline):
+    def fetch(item):
+        if item % 2:
+            raise ConnectionError(f'could not download {item}')
+        return item
+
+    stored = []
+    result = run_with_timeout(Pipeline.Pipeline(fetch, parse_square, stored.extend, fetch_workers=2, parse_workers=0), range(6))
+
+    assert sorted(stored) == [(0, 0), (2, 4), (4, 16)]
+    assert sorted(result['errors']) == [1, 3, 5]
+
+
+def test_a_dead_parsing_process_fails_its_items_without_hanging(Pipeline):
+    stored = []
+    result = run_with_timeout(Pipeline.Pipeline(lambda item: item, parse_and_die, stored.extend, fetch_workers=2, parse_workers=2), range(8))
+
+    assert stored == []
+    assert sorted(result['errors']) == list(range(8))
+
+    # The broken pool is replaced, so later pipelines still parse in processes
+    result = run_with_timeout(Pipeline.Pipeline(lambda item: item, parse_square, stored.extend, fetch_workers=2, parse_workers=2), [1, 2])
+    assert result['errors'] == {} and sorted(stored) == [(1, 1), (2, 4)]
+
+
+def test_store_errors_stop_the_pipeline(Pipeline):
+    def store(records):
+        raise OSError('disk full')
+
+    pipeline = Pipeline.Pipeline(lambda item: item, parse_square, store, fetch_workers=1, parse_workers=0, queue_size=1, batch_size=1)
+    result = run_with_timeout(pipeline, range(1000))
+
+    assert isinstance(result['exception'], OSError)
+    assert pipeline.get_stats()['fetch']['items'] < 1000
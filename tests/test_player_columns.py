@@ -0,0 +1,13 @@
+import pandas as pd
+
+
+def test_only_skills_are_taken_from_the_results_table(browser):
+    import PavilionPy
+    player_df = pd.DataFrame({'PlayerID': [1, 2], 'Players': ['Player 1', 'Player 2'], 'Bat': [5, 7], 'Pow': [3, 4],
+                              'Exp': [2, 3], 'Capt': [1, 1], 'Fatg': ['Fresh', 'Tired']})
+
+    column_sources, pages_needed = PavilionPy.plan_player_columns(player_df, ['Batting', 'Power', 'Experience', 'Captaincy', 'Fatigue'])
+
+    assert column_sources == {'Batting': ('table', 'Bat'), 'Power': ('table', 'Pow'), 'Experience': ('player_page', 'Experience'),
+                              'Captaincy': ('player_page', 'Captaincy'), 'Fatigue': ('player_page', 'Fatigue')}
+    assert pages_needed == {'player_page'}
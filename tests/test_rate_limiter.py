@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+from CoreUtils import RateLimiter
+
+
+def test_sliding_windows_wait_for_the_most_limiting_window():
+    rate_limiter = RateLimiter(limits=[(timedelta(seconds=10), 2), (timedelta(seconds=60), 3)], state_file=None)
+    rate_limiter.record(0)
+    rate_limiter.record(1)
+
+    assert rate_limiter.remaining(now=2) == [(10, 0), (60, 1)]
+    assert rate_limiter.wait_time(now=2) == (8, 10)
+
+    # Both requests have left the short window, but the long window is full after one more
+    assert rate_limiter.remaining(now=11) == [(10, 2), (60, 1)]
+    assert rate_limiter.wait_time(now=11) == (0, None)
+    rate_limiter.record(11)
+    assert rate_limiter.remaining(now=12) == [(10, 1), (60, 0)]
+    assert rate_limiter.wait_time(now=12) == (48, 60)
+    assert rate_limiter.remaining(now=62) == [(10, 2), (60, 2)]
+
+
+def test_state_is_restored_by_a_new_limiter(tmp_path):
+    state_file = str(tmp_path / 'ratelimit_state.json')
+    limits = [(timedelta(seconds=10), 2), (timedelta(days=1), 5)]
+    rate_limiter = RateLimiter(limits=limits, state_file=state_file)
+    # Loading drops requests that have left every window by the current time
+    now = time.time()
+    for timestamp in (now - 20, now - 5, now - 1):
+        rate_limiter.record(timestamp)
+    rate_limiter.save()
+
+    restored = RateLimiter(limits=limits, state_file=state_file)
+    assert restored.remaining(now=now) == [(10, 0), (86400, 2)]
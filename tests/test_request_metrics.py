@@ -0,0 +1,47 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'<html><body>Synthetic page</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://localhost:{}/player.htm?playerId=1'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_host_lookup_and_connection_are_timed_on_the_browser_session(server):
+    import CoreUtils
+    from RequestMetrics import RequestMetrics
+    metrics = RequestMetrics(summary_interval=None)
+    session = CoreUtils.create_rbrowser().session
+
+    request_timings = []
+    for _ in range(2):
+        with metrics.time_request(server) as timings:
+            session.get(server)
+        request_timings.append((timings['dns'], timings['connect']))
+
+    # The connection is kept open for the second request, so only the first looks the host up and connects
+    assert all(seconds > 0 for seconds in request_timings[0]) and request_timings[1] == (0, 0)
+    assert metrics.snapshot()['histograms']['player']['connect']['count'] == 2
+    # Lookups made outside the browser's sessions are not timed
+    assert socket.getaddrinfo.__module__ == 'socket'
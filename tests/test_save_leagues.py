@@ -0,0 +1,58 @@
+import functools
+import pytest
+from benchmarks import fixtures
+
+GAME_IDS = list(range(500000, 500006))
+
+
+@pytest.fixture
+def save_leagues(browser, monkeypatch):
+    import save_leagues
+
+    def fetch(url):
+        game_id = int(url.split('gameId=')[1])
+        return fixtures.scorecard_page(seed=game_id) if 'scorecard' in url else fixtures.ratings_page(game_id)
+
+    monkeypatch.setattr(browser, 'fetch', fetch)
+    monkeypatch.setattr(save_leagues, 'get_league_page', lambda league_id: ''.join(f'<a href="game.htm?gameId={game_id}">' for game_id in GAME_IDS))
+    # Small writer batches and parsing processes, so that the summaries are stored in several batches as they are
+    # for a large download
+    monkeypatch.setattr(save_leagues, 'Pipeline', functools.partial(save_leagues.Pipeline, parse_workers=2, batch_size=2))
+    return save_leagues
+
+
+def get_game_statuses(db_path):
+    from ArchiveStore import ArchiveStore
+    store = ArchiveStore(db_path)
+    statuses = dict(store.fetchall("SELECT ItemKey, Status FROM crawl_items WHERE Kind = 'game'"))
+    stored_game_ids = [str(game_id) for game_id, in store.fetchall('SELECT GameID FROM game_summaries')]
+    return statuses, stored_game_ids
+
+
+def test_games_stored_before_a_failed_batch_are_not_stored_again(save_leagues, tmp_path, monkeypatch):
+    from ArchiveStore import ArchiveStore
+    db_path = str(tmp_path / 'league_games.db')
+    append_dataframe = ArchiveStore.append_dataframe
+    append_calls = []
+
+    def fail_second_append(self, df, table_name):
+        append_calls.append(table_name)
+        if len(append_calls) == 2:
+            raise OSError('disk I/O error')
+        return append_dataframe(self, df, table_name)
+
+    monkeypatch.setattr(ArchiveStore, 'append_dataframe', fail_second_append)
+    save_leagues.download_league_games([1], db_path=db_path)
+
+    statuses, stored_game_ids = get_game_statuses(db_path)
+    assert stored_game_ids and len(stored_game_ids) < len(GAME_IDS)
+    assert sorted(key for key, status in statuses.items() if status == 'done') == sorted(stored_game_ids)
+    assert all(status == 'failed' for key, status in statuses.items() if key not in stored_game_ids)
+
+    monkeypatch.setattr(ArchiveStore, 'append_dataframe', append_dataframe)
+    game_summaries = save_leagues.download_league_games([1], db_path=db_path)
+
+    statuses, stored_game_ids = get_game_statuses(db_path)
+    assert sorted(stored_game_ids) == [str(game_id) for game_id in GAME_IDS]
+    assert set(statuses.values()) == {'done'}
+    assert len(game_summaries) == len(GAME_IDS)
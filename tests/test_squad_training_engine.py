@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from benchmarks import archives
+
+TEAM_ARCHIVE = 'data/archives/team_archives/team_archives.db'
+# The synthetic squad of this seed includes a player first observed at age 16 week 0, whose first week is not trained
+SEED = 2
+
+
+@pytest.fixture
+def team_archive(browser):
+    archives.build_team_archive(TEAM_ARCHIVE, n_players=5, n_weeks=8, missing_week_rate=0.2, seed=SEED)
+    return TEAM_ARCHIVE
+
+
+def as_displayed(observation_results):
+    return {week: {key: str(value) for key, value in result.items()} for week, result in observation_results.items()}
+
+
+def test_engine_matches_player_tracker(team_archive):
+    from PlayerTracker import PlayerTracker, SquadTrainingEngine
+    results = SquadTrainingEngine(team_archive).run().set_index('PlayerID')
+
+    assert set(results.index) == {str(2000000 + n) for n in range(5)}
+    new_players = 0
+    for player_id, result in results.iterrows():
+        tracker = PlayerTracker(player_id)
+        first_state = tracker.player_states.iloc[0]
+        new_players += (first_state['AgeYear'], first_state['AgeWeeks']) == (16, 0)
+
+        assert result['TrainingTalent'] == tracker.permanent_attributes['TrainingTalent']
+        assert result['FirstObservation'] == tracker.training_processing_results['first_observation']
+        assert result['LastObservation'] == tracker.training_processing_results['last_observation']
+        assert result['SpareRating'] == tracker.spare_rating
+        assert result['TotalUnknownSpareRating'] == tracker.total_unknown_spare_rating
+        assert result['KnownSublevels'] == tracker.known_sublevels.tolist()
+        assert result['KnownSkills'] == tracker.known_skills.tolist()
+        assert np.allclose(result['EstimatedSpare'], tracker.estimate_spare)
+        assert result['EstimatedMaxTraining'] == tracker.estimate_max_training.tolist()
+        assert as_displayed(result['ObservationResults']) == as_displayed(tracker.training_processing_results['observation_results'])
+
+    assert new_players
+
+
+def test_incremental_update_matches_full_rebuild(team_archive):
+    from ArchiveStore import open_store
+    from PlayerTracker import SquadTrainingEngine
+    store = open_store(team_archive)
+    players = store.read_dataframe('SELECT * FROM players ORDER BY rowid')
+    game_weeks = players['DataSeason'] * 15 + players['DataWeek']
+    weeks = sorted(game_weeks.unique())
+
+    # The first weeks are recorded at once, then one week at a time, and the last two weeks after a missed update
+    with store.transaction() as conn:
+        conn.execute('DELETE FROM players')
+    engine = SquadTrainingEngine(team_archive)
+    for recorded_weeks in [weeks[:3]] + [[week] for week in weeks[3:-2]] + [weeks[-2:]]:
+        with store.transaction():
+            store.append_dataframe(players[game_weeks.isin(recorded_weeks)], 'players')
+        engine.update_inference_table()
+    incremental = {player_id: engine.load_inference(player_id) for player_id in players['PlayerID'].unique()}
+
+    with store.transaction() as conn:
+        conn.execute(f'DELETE FROM {engine.INFERENCE_TABLE}')
+    assert engine.update_inference_table() == len(incremental)
+    for player_id, record in incremental.items():
+        assert record == engine.load_inference(player_id)
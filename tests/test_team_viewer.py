@@ -0,0 +1,26 @@
+import pytest
+from benchmarks import archives
+
+TEAM_ARCHIVE = 'data/archives/team_archives/team_archives.db'
+
+
+@pytest.fixture
+def client(browser, monkeypatch):
+    archives.build_team_archive(TEAM_ARCHIVE, n_players=2, n_weeks=3)
+    import TeamViewer
+    from PlayerTracker import SquadTrainingEngine
+    monkeypatch.setattr(TeamViewer, 'training_engine', SquadTrainingEngine(TEAM_ARCHIVE))
+    return TeamViewer.app.test_client()
+
+
+def test_squad_training_estimates_only_read_the_inference_table(client):
+    from ArchiveStore import open_store
+    assert client.get('/get_squad_training_estimates').get_json() == {'players': []}
+    assert open_store(TEAM_ARCHIVE).fetchone('SELECT COUNT(*) FROM training_inference')[0] == 0
+
+
+def test_players_missing_from_the_archive_are_not_found(client):
+    assert client.get('/get_player_chart_data/1/').status_code == 404
+    assert client.post('/get_player_skills', data={'playerId': '1'}).status_code == 404
+    assert client.get('/get_player_chart_data/2000000/').status_code == 200
+    assert client.post('/get_player_skills', data={'playerId': '2000000'}).status_code == 200
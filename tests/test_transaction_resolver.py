@@ -0,0 +1,105 @@
+import random
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks import archives, fixtures
+
+NOW = datetime(2024, 1, 10, 12, 0)
+# Both listings of player 3000001 were sold, 3000002 has not been sold yet, 3000003 was not sold within the horizon,
+# the deadline of 3000004 has only just passed and the transaction of 3000005 was resolved before
+LISTINGS = [
+    (3000001, NOW - timedelta(hours=3)),
+    (3000001, NOW - timedelta(days=5)),
+    (3000002, NOW - timedelta(hours=2)),
+    (3000003, NOW - timedelta(days=2)),
+    (3000004, NOW - timedelta(minutes=30)),
+    (3000005, NOW - timedelta(hours=4)),
+]
+
+
+def transfer_history_page(player_id, completion_times):
+    rows = ''.join(f'''<tr><td>{completion_time.strftime('%d %b. %y %H:%M')}</td><td>60</td>
+    <td><a href="club.htm?teamId=4791">Synthetic XI</a></td><td><a href="club.htm?teamId=1234">Kent Cavaliers</a></td>
+    <td>$25,000</td><td>5,000</td><td>17</td></tr>''' for completion_time in completion_times)
+    body = f'''<h1><a href="player.htm?playerId={player_id}">Transfer History</a></h1>
+<table class="data stats tablesorter"><tr><th>Date</th><th>Season</th><th>From</th><th>To</th><th>Price</th><th>Rating</th><th>Age</th></tr>
+{rows}
+</table>'''
+    return fixtures.page('Transfer History', body)
+
+
+@pytest.fixture
+def resolver(browser, monkeypatch):
+    from ArchiveStore import open_store
+    from TransactionResolver import TransactionResolver, TIMESTAMP_FORMAT
+
+    rng = random.Random(0)
+    listings = []
+    for n, (player_id, deadline) in enumerate(LISTINGS):
+        attributes = dict(archives.player_attributes(rng, player_id), TeamName='Synthetic XI', TeamID='4791')
+        sublevels = np.array([rng.randint(500, 15000) for _ in range(7)], dtype=np.int64)
+        listings.append(dict(archives.player_row(attributes, sublevels, 17, 0, 60, 0, deadline - timedelta(days=3)),
+                             Training='Batting', Deadline=deadline.strftime(TIMESTAMP_FORMAT), CurrentBid=1000, BiddingTeam='(opening)',
+                             BiddingTeamID='-1', NatSquad=False, Touring=False, TransactionID=f'{n:032x}'))
+    db_path = 'data/archives/market_archive/market_archive.db'
+    archives.write_archive(db_path, {'players': pd.DataFrame(listings), 'transactions': pd.DataFrame([{
+        'TransactionID': f'{5:032x}', 'Player': 'Player 3000005', 'PlayerID': '3000005', 'FromTeamName': 'Synthetic XI', 'FromTeamID': 4791,
+        'ToTeamName': 'Kent Cavaliers', 'ToTeamID': 1234, 'FinalPrice': 25000.0, 'CompletionTime': (NOW - timedelta(hours=4)).strftime(TIMESTAMP_FORMAT)}])})
+
+    completion_times = {3000001: [LISTINGS[1][1] + timedelta(minutes=1), LISTINGS[0][1] + timedelta(minutes=3)]}
+    fetched_urls = []
+
+    def fetch_many(urls, use_cache=True):
+        fetched_urls.append(urls)
+        return [transfer_history_page(player_id, completion_times.get(player_id, []))
+                for player_id in (int(url.split('playerId=')[1]) for url in urls)]
+
+    monkeypatch.setattr(browser, 'fetch_many', fetch_many)
+    resolver = TransactionResolver(open_store(db_path))
+    resolver.completion_times, resolver.fetched_urls = completion_times, fetched_urls
+    return resolver
+
+
+def get_pending(resolver):
+    return {transaction_id: (player_id, attempts, last_attempt, next_attempt) for transaction_id, player_id, attempts, last_attempt, next_attempt
+            in resolver.store.fetchall('SELECT TransactionID, PlayerID, Attempts, LastAttempt, NextAttempt FROM pending_transactions')}
+
+
+def get_transactions(resolver):
+    return {transaction_id: (to_team_name, final_price, completion_time) for transaction_id, to_team_name, final_price, completion_time
+            in resolver.store.fetchall('SELECT TransactionID, ToTeamName, FinalPrice, CompletionTime FROM transactions')}
+
+
+def test_backoff_doubles_up_to_the_maximum(resolver):
+    assert [resolver.get_backoff(attempts) for attempts in range(7)] == [timedelta(minutes=minutes) for minutes in (30, 60, 120, 240, 480, 720, 720)]
+
+
+def test_pending_listings_are_resolved_retried_or_recorded_as_unsold(resolver):
+    from TransactionResolver import TIMESTAMP_FORMAT
+
+    assert resolver.resolve(NOW) == {'resolved': 2, 'unsold': 1, 'retrying': 1, 'pages': 3}
+    # Both listings of 3000001 are resolved from one transfer history
+    assert resolver.fetched_urls == [[f'https://www.fromthepavilion.org/playertransfers.htm?playerId={player_id}' for player_id in (3000001, 3000002, 3000003)]]
+
+    transactions = get_transactions(resolver)
+    assert transactions[f'{0:032x}'] == ('Kent Cavaliers', 25000.0, (LISTINGS[0][1] + timedelta(minutes=3)).strftime(TIMESTAMP_FORMAT))
+    assert transactions[f'{1:032x}'] == ('Kent Cavaliers', 25000.0, (LISTINGS[1][1] + timedelta(minutes=1)).strftime(TIMESTAMP_FORMAT))
+    assert transactions[f'{3:032x}'] == ('(did not sell)', -1.0, '1970-01-01T00:00:00')
+    assert get_pending(resolver) == {f'{2:032x}': ('3000002', 1, NOW.strftime(TIMESTAMP_FORMAT), (NOW + timedelta(minutes=30)).strftime(TIMESTAMP_FORMAT))}
+
+    # Nothing is due until the retry, and the listing whose deadline has just passed is not checked before the delay
+    assert resolver.resolve(NOW + timedelta(minutes=29)) == {'resolved': 0, 'unsold': 0, 'retrying': 0, 'pages': 0}
+    assert len(resolver.fetched_urls) == 1
+
+    retry_time = NOW + timedelta(minutes=31)
+    assert resolver.resolve(retry_time) == {'resolved': 0, 'unsold': 0, 'retrying': 2, 'pages': 2}
+    assert get_pending(resolver) == {
+        f'{2:032x}': ('3000002', 2, retry_time.strftime(TIMESTAMP_FORMAT), (retry_time + timedelta(minutes=60)).strftime(TIMESTAMP_FORMAT)),
+        f'{4:032x}': ('3000004', 1, retry_time.strftime(TIMESTAMP_FORMAT), (retry_time + timedelta(minutes=30)).strftime(TIMESTAMP_FORMAT)),
+    }
+
+    resolver.completion_times[3000002] = [LISTINGS[2][1] + timedelta(minutes=5)]
+    assert resolver.resolve(retry_time + timedelta(minutes=60)) == {'resolved': 1, 'unsold': 0, 'retrying': 1, 'pages': 2}
+    assert set(get_pending(resolver)) == {f'{4:032x}'}
+    assert len(get_transactions(resolver)) == 5
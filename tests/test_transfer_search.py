@@ -0,0 +1,85 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import pytest
+from benchmarks import fixtures
+
+PAGE_LIMIT = 3  # Results pages the site shows for one search
+COUNTRIES = [str(region_id) for region_id in range(19)]
+# Listings on the market in each country. The whole market and country 2 have more listings than the site shows
+LISTINGS = dict({country: 3 for country in COUNTRIES[1:]}, **{'1': 25, '2': 70})
+
+
+@pytest.fixture
+def market():
+    # The results pages submitted, and whether they show a pager
+    return SimpleNamespace(submitted_pages=[], pager=True)
+
+
+@pytest.fixture
+def PavilionPy(browser, market, monkeypatch):
+    import PavilionPy
+
+    def open_transfer_search_form(search_settings):
+        # The fields read by get_transfer_search_shards, and the search settings the form was filled in with
+        return {'country': SimpleNamespace(value='0', options=COUNTRIES), 'settings': search_settings}
+
+    def submit_transfer_search_page(search_settings_form, page=0):
+        country = search_settings_form['settings'].get('country', '0')
+        n_listings = LISTINGS[country] if country != '0' else sum(LISTINGS.values())
+        market.submitted_pages.append((country, page))
+        page_count = min(max(-(-n_listings // 20), 1), PAGE_LIMIT) if market.pager else None
+        n_rows = min(max(n_listings - page * 20, 0), 20)
+        return fixtures.transfer_search_page(n_rows=n_rows, seed=int(country) * 100 + page, page_number=page, page_count=page_count)
+
+    monkeypatch.setattr(PavilionPy, 'open_transfer_search_form', open_transfer_search_form)
+    monkeypatch.setattr(PavilionPy, 'submit_transfer_search_page', submit_transfer_search_page)
+    return PavilionPy
+
+
+def test_page_count_is_read_from_the_pager(PavilionPy):
+    assert PavilionPy.get_transfer_search_page_count(fixtures.transfer_search_page(page_number=1, page_count=7)) == 7
+    assert PavilionPy.get_transfer_search_page_count(fixtures.transfer_search_page()) is None
+
+
+def test_search_stops_at_the_last_page_of_the_pager(PavilionPy, market):
+    listings = PavilionPy.search_transfer_listings({'country': '1'})
+
+    assert market.submitted_pages == [('1', 0), ('1', 1)]
+    assert len(listings) == 25
+
+
+def test_search_without_a_pager_stops_at_the_first_page_that_is_not_full(PavilionPy, market):
+    market.pager = False
+    listings = PavilionPy.search_transfer_listings({'country': '1'})
+
+    assert market.submitted_pages == [('1', 0), ('1', 1)]
+    assert len(listings) == 25
+
+
+def test_truncated_search_is_split_by_country(PavilionPy, market):
+    listings = PavilionPy.search_transfer_listings()
+
+    submitted_pages = market.submitted_pages
+    assert submitted_pages[:PAGE_LIMIT] == [('0', page) for page in range(PAGE_LIMIT)]
+    assert sorted(submitted_pages[PAGE_LIMIT:]) == sorted([(country, 0) for country in COUNTRIES[1:]] + [('1', 1), ('2', 1), ('2', 2)])
+    # Country 2 cannot be split further, so only the listings on the pages the site shows are found
+    assert len(listings) == sum(LISTINGS.values()) - (LISTINGS['2'] - PAGE_LIMIT * 20)
+
+
+def test_page_bound_applies_without_splitting(PavilionPy, market):
+    listings = PavilionPy.search_transfer_listings(max_pages=2, shard_fields=[])
+
+    assert market.submitted_pages == [('0', 0), ('0', 1)]
+    assert len(listings) == 40
+
+
+def test_watch_transfer_market_polls_the_pages_of_max_players_per_download(PavilionPy, monkeypatch):
+    import MarketScheduler
+    schedulers = []
+    monkeypatch.setattr(MarketScheduler.MarketScheduler, 'run', lambda self: schedulers.append(self))
+
+    PavilionPy.watch_transfer_market('data/market.db', max_players_per_download=45)
+    PavilionPy.watch_transfer_market('data/market.db', max_players_per_download=None)
+
+    assert schedulers[0].poll_pages == 3 and schedulers[0].full_sweep_interval == timedelta(days=1)
+    assert schedulers[1].full_sweep_interval == timedelta(0)